@@ -1,27 +1,53 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, send_file, jsonify
-from db import crear_base_datos, insertar_empleado, cargar_empleado, existe_codigo
-from qr import generar_qr
-from imagen import generar_carnet, combinar_anverso_reverso
+from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, send_file, jsonify, Response, stream_with_context
+from db import insertar_empleado, cargar_empleado, existe_codigo
+from conexion_db import obtener_conexion, init_app as init_conexion_db
+from migraciones import aplicar_migraciones
+from aprendiz import (
+    SELECT_APRENDIZ, ProveedorJSON, fabrica_aprendiz, fabrica_aprendiz_busqueda, fabrica_aprendiz_carnet,
+)
+from busqueda import filtro_busqueda, filtros_listado
+from trabajos_importacion import crear_trabajo, obtener_trabajo, reanudar_trabajos, init_app as init_trabajos
+from lotes_carnets import crear_lote, obtener_lote
+from importador_sena import ALIAS_COLUMNAS, EXTENSIONES_IMPORTACION, simular_importacion
+from exportacion import (
+    FORMATOS_EXPORTACION, GENERADORES_EXPORTACION, MIME_XLSX, bloques_plantilla, buscar_en_cache,
+    clave_exportacion, cursor_exportacion, guardar_en_cache, iniciar_lectura, se_guarda_en_cache,
+)
+from contadores import leer_contador, sumar_desde, distribucion
+from qr import imagen_qr
+from imagen import registrar_fuentes, renderizar_carnet, reverso_compartido
 from procesador_fotos import procesar_foto_aprendiz
 from datetime import date, timedelta, datetime
 import os
 import random
 import traceback
-import pandas as pd
 import tempfile
-import openpyxl
 from werkzeug.utils import secure_filename
 import sqlite3
 import shutil
 import json
 import time
+import base64
 
 app = Flask(__name__)
 app.secret_key = 'clave_secreta_segura'
+app.json = ProveedorJSON(app)
 
 # Configuraciones para Excel
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Campo -> encabezados aceptados al importar (ver importador_sena.ALIAS_COLUMNAS)
+app.config['ALIAS_COLUMNAS'] = ALIAS_COLUMNAS
+
+# Archivo de configuración opcional (variable de entorno CARNET_CONFIG), por
+# ejemplo con otra tabla ALIAS_COLUMNAS para una plantilla distinta
+app.config.from_envvar('CARNET_CONFIG', silent=True)
+
+# Conexiones SQLite compartidas por petición (WAL + PRAGMAs de rendimiento)
+init_conexion_db(app)
+
+# Los trabajos de importación usan la tabla de encabezados de la configuración
+init_trabajos(app)
 
 # Crear carpetas necesarias
 os.makedirs("static/fotos", exist_ok=True)
@@ -33,9 +59,6 @@ os.makedirs("static/fotos_backup", exist_ok=True)
 os.makedirs("static/fotos_backup/por_fecha", exist_ok=True)
 os.makedirs("static/fotos_backup/metadatos", exist_ok=True)
 
-# Crear base de datos
-crear_base_datos()
-
 # Usuarios del sistema
 usuarios = {
     "admin": {"clave": "admin123", "rol": "admin"},
@@ -48,141 +71,27 @@ usuarios = {
 # FUNCIONES AUXILIARES PRINCIPALES
 # =============================================
 
-def actualizar_base_datos_sena():
-    """Actualiza la base de datos con las columnas necesarias"""
-    try:
-        conn = sqlite3.connect('carnet.db')
-        cursor = conn.cursor()
-        
-        # Verificar si la tabla existe
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='empleados'")
-        if not cursor.fetchone():
-            print("Creando tabla empleados...")
-            # Crear tabla completa desde el inicio
-            cursor.execute("""
-                CREATE TABLE empleados (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nombre TEXT NOT NULL,
-                    cedula TEXT UNIQUE NOT NULL,
-                    tipo_documento TEXT DEFAULT 'CC',
-                    cargo TEXT DEFAULT 'APRENDIZ',
-                    codigo TEXT UNIQUE,
-                    fecha_emision TEXT,
-                    fecha_vencimiento TEXT,
-                    tipo_sangre TEXT,
-                    foto TEXT,
-                    nis TEXT,
-                    primer_apellido TEXT,
-                    segundo_apellido TEXT,
-                    nombre_programa TEXT,
-                    codigo_ficha TEXT,
-                    centro TEXT,
-                    nivel_formacion TEXT DEFAULT 'Técnico',
-                    red_tecnologica TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            print("Tabla empleados creada exitosamente")
-        else:
-            print("Tabla empleados existe, verificando columnas...")
-            # Obtener columnas existentes
-            cursor.execute("PRAGMA table_info(empleados)")
-            columnas_existentes = [col[1] for col in cursor.fetchall()]
-            
-            # Columnas que deben existir
-            columnas_necesarias = {
-                'nis': 'TEXT',
-                'primer_apellido': 'TEXT',
-                'segundo_apellido': 'TEXT',
-                'nombre_programa': 'TEXT',
-                'codigo_ficha': 'TEXT',
-                'centro': 'TEXT',
-                'nivel_formacion': 'TEXT DEFAULT "Técnico"',
-                'red_tecnologica': 'TEXT',
-                'created_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
-                'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            }
-            
-            # Agregar columnas faltantes
-            for columna, tipo in columnas_necesarias.items():
-                if columna not in columnas_existentes:
-                    try:
-                        cursor.execute(f'ALTER TABLE empleados ADD COLUMN {columna} {tipo}')
-                        print(f"Columna agregada: {columna}")
-                    except sqlite3.OperationalError as e:
-                        if "duplicate column name" in str(e):
-                            print(f"Columna ya existe: {columna}")
-                        else:
-                            print(f"Error agregando columna {columna}: {e}")
-        
-        # Crear índices para mejorar rendimiento
-        indices = [
-            "CREATE INDEX IF NOT EXISTS idx_cedula ON empleados(cedula)",
-            "CREATE INDEX IF NOT EXISTS idx_codigo ON empleados(codigo)",
-            "CREATE INDEX IF NOT EXISTS idx_nombre_programa ON empleados(nombre_programa)",
-            "CREATE INDEX IF NOT EXISTS idx_codigo_ficha ON empleados(codigo_ficha)",
-            "CREATE INDEX IF NOT EXISTS idx_fecha_emision ON empleados(fecha_emision)"
-        ]
-        
-        for indice in indices:
-            cursor.execute(indice)
-        
-        conn.commit()
-        conn.close()
-        print("Base de datos actualizada correctamente")
-        return True
-        
-    except Exception as e:
-        print(f"Error actualizando base de datos: {e}")
-        return False
-
 def buscar_empleado_completo(cedula):
     """Busca un empleado por cédula con todos los campos SENA"""
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz_carnet
         
         # Limpiar cédula de entrada
         cedula_limpia = ''.join(filter(str.isdigit, str(cedula)))
         
         print(f"Buscando empleado con cédula: {cedula_limpia}")
         
-        cursor.execute("""
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados 
+        cursor.execute(SELECT_APRENDIZ + """
             WHERE cedula = ? 
             ORDER BY created_at DESC, updated_at DESC
             LIMIT 1
         """, (cedula_limpia,))
         
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            empleado = {
-                'nombre': row[0] or '',
-                'cedula': row[1] or '',
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4] or '',
-                'fecha_emision': row[5] or '',
-                'fecha_vencimiento': row[6] or '',
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8] or None,
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa Técnico',
-                'codigo_ficha': row[13] or 'N/A',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico',
-                'red_tecnologica': row[16] or 'Tecnologías de Producción Industrial'
-            }
-            
+        empleado = cursor.fetchone()
+        
+        if empleado:
             print(f"Empleado encontrado: {empleado['nombre']} - Programa: {empleado['nombre_programa']}")
             return empleado
         else:
@@ -197,42 +106,16 @@ def buscar_empleado_completo(cedula):
 def obtener_todos_empleados():
     """Función para obtener todos los empleados de la base de datos"""
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz_carnet
         
-        cursor.execute("""
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados
+        cursor.execute(SELECT_APRENDIZ + """
             ORDER BY created_at DESC, nombre ASC
         """)
         
-        empleados = []
-        for row in cursor.fetchall():
-            empleado = {
-                'nombre': row[0] or '',
-                'cedula': row[1] or '',
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4] or '',
-                'fecha_emision': row[5] or '',
-                'fecha_vencimiento': row[6] or '',
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8] or None,
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa Técnico',
-                'codigo_ficha': row[13] or 'N/A',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico',
-                'red_tecnologica': row[16] or 'Tecnologías de Producción Industrial'
-            }
-            empleados.append(empleado)
+        empleados = cursor.fetchall()
         
-        conn.close()
         print(f"Obtenidos {len(empleados)} empleados de la base de datos")
         return empleados
         
@@ -243,70 +126,24 @@ def obtener_todos_empleados():
 def buscar_empleados_con_filtros(buscar='', filtro_foto='', filtro_programa='', filtro_nivel=''):
     """Busca empleados con múltiples filtros"""
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz_busqueda
         
-        # Construir query base
-        query = """
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados 
-            WHERE 1=1
-        """
-        params = []
-        
-        # Aplicar filtros
-        if buscar:
-            query += " AND (nombre LIKE ? OR cedula LIKE ? OR codigo LIKE ? OR nis LIKE ?)"
-            buscar_param = f"%{buscar}%"
-            params.extend([buscar_param, buscar_param, buscar_param, buscar_param])
+        # Búsqueda de texto (FTS5 ordenado por relevancia) + filtros
+        union, condicion, params, orden_relevancia = filtros_listado(
+            conn, buscar, filtro_foto, filtro_programa, filtro_nivel)
+        query = SELECT_APRENDIZ + union + " WHERE 1=1" + condicion
+        orden = f"{orden_relevancia}, nombre ASC" if orden_relevancia else "nombre ASC"
         
-        if filtro_foto == 'con_foto':
-            query += " AND foto IS NOT NULL AND foto != ''"
-        elif filtro_foto == 'sin_foto':
-            query += " AND (foto IS NULL OR foto = '')"
-        
-        if filtro_programa:
-            query += " AND nombre_programa LIKE ?"
-            params.append(f"%{filtro_programa}%")
-        
-        if filtro_nivel:
-            query += " AND nivel_formacion = ?"
-            params.append(filtro_nivel)
-        
-        query += " ORDER BY nombre ASC"
+        query += f" ORDER BY {orden}"
         
         print(f"Ejecutando query: {query}")
         print(f"Con parámetros: {params}")
         
         cursor.execute(query, params)
-        empleados = []
-        
-        for row in cursor.fetchall():
-            empleado = {
-                'nombre': row[0],
-                'cedula': row[1],
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4],
-                'fecha_emision': row[5],
-                'fecha_vencimiento': row[6],
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8],
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa General',
-                'codigo_ficha': row[13] or 'Sin Ficha',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico',
-                'red_tecnologica': row[16] or 'Tecnologías de Producción Industrial'
-            }
-            empleados.append(empleado)
+        empleados = cursor.fetchall()
         
-        conn.close()
         print(f"Encontrados {len(empleados)} empleados con los filtros aplicados")
         return empleados
         
@@ -314,43 +151,86 @@ def buscar_empleados_con_filtros(buscar='', filtro_foto='', filtro_programa='',
         print(f"Error buscando empleados con filtros: {e}")
         return []
 
+# Paginación por cursor (keyset sobre nombre, cedula)
+LIMITE_PAGINA_DEFECTO = 50
+LIMITE_PAGINA_MAXIMO = 500
+
+def codificar_cursor(aprendiz):
+    """Convierte la posición (nombre, cedula) de la última fila en un token opaco"""
+    posicion = json.dumps([aprendiz['nombre'], aprendiz['cedula']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(posicion.encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(token):
+    """Devuelve [nombre, cedula] desde un token de cursor, o None si viene vacío"""
+    if not token:
+        return None
+    try:
+        posicion = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(posicion, list) or len(posicion) != 2:
+        raise ValueError("Cursor inválido")
+    return posicion
+
+# Carnets generados en disco (static/carnets)
+CARPETA_CARNETS = os.path.join('static', 'carnets')
+
+def cedulas_con_carnet(conn):
+    """
+    Cédulas con carnet en disco: carnet_<cedula>.png, carnet_combinado_<cedula>.png
+    y <NOMBRE>_completo.png. Solo los nombres de esos archivos se buscan en la BD.
+    """
+    cedulas, nombres = set(), []
+    if not os.path.exists(CARPETA_CARNETS):
+        return cedulas
+    
+    for archivo in os.listdir(CARPETA_CARNETS):
+        if not archivo.endswith('.png'):
+            continue
+        if archivo.endswith('_completo.png'):
+            nombres.append(archivo[:-len('_completo.png')].replace('_', ' '))
+            continue
+        for prefijo in ('carnet_combinado_', 'carnet_'):
+            if archivo.startswith(prefijo):
+                cedula = archivo[len(prefijo):-len('.png')]
+                if cedula.isdigit():
+                    cedulas.add(cedula)
+                break
+    
+    if nombres:
+        cursor = conn.execute(
+            "SELECT cedula FROM empleados WHERE nombre IN (SELECT value FROM json_each(?))",
+            (json.dumps(nombres, ensure_ascii=False),))
+        cedulas.update(fila[0] for fila in cursor)
+    return cedulas
+
 def obtener_estadisticas_dashboard():
     """Obtiene estadísticas actualizadas para el dashboard"""
     try:
-        conn = sqlite3.connect('carnet.db')
-        cursor = conn.cursor()
+        conn = obtener_conexion()
         
-        # Total de aprendices
-        cursor.execute("SELECT COUNT(*) FROM empleados")
-        total_aprendices = cursor.fetchone()[0]
+        # Total de aprendices (tabla contadores, mantenida por triggers)
+        total_aprendices = leer_contador(conn, 'total')
         
         # Registrados hoy
         hoy = date.today().strftime("%Y-%m-%d")
-        cursor.execute("SELECT COUNT(*) FROM empleados WHERE fecha_emision = ?", (hoy,))
-        registrados_hoy = cursor.fetchone()[0]
+        registrados_hoy = leer_contador(conn, 'fecha_emision', hoy)
         
         # Esta semana
         fecha_semana = (date.today() - timedelta(days=7)).strftime("%Y-%m-%d")
-        cursor.execute("SELECT COUNT(*) FROM empleados WHERE fecha_emision >= ?", (fecha_semana,))
-        esta_semana = cursor.fetchone()[0]
+        esta_semana = sumar_desde(conn, 'fecha_emision', fecha_semana)
         
         # Con foto
-        cursor.execute("SELECT COUNT(*) FROM empleados WHERE foto IS NOT NULL AND foto != ''")
-        con_foto = cursor.fetchone()[0]
+        con_foto = leer_contador(conn, 'con_foto')
         
         # Por nivel de formación
-        cursor.execute("SELECT nivel_formacion, COUNT(*) FROM empleados GROUP BY nivel_formacion")
-        por_nivel = dict(cursor.fetchall())
+        por_nivel = dict(distribucion(conn, 'nivel'))
         
         # Por programa
-        cursor.execute("SELECT nombre_programa, COUNT(*) FROM empleados GROUP BY nombre_programa ORDER BY COUNT(*) DESC LIMIT 5")
-        top_programas = cursor.fetchall()
+        top_programas = distribucion(conn, 'programa', 5)
         
         # Por ficha
-        cursor.execute("SELECT codigo_ficha, COUNT(*) FROM empleados GROUP BY codigo_ficha ORDER BY COUNT(*) DESC LIMIT 5")
-        top_fichas = cursor.fetchall()
-        
-        conn.close()
+        top_fichas = distribucion(conn, 'ficha', 5)
         
         return {
             'total_aprendices': total_aprendices,
@@ -378,55 +258,6 @@ def obtener_estadisticas_dashboard():
             'disponibilidad': 100
         }
 
-def convertir_fecha_excel(fecha_serial):
-    """Convierte fecha serial de Excel a formato YYYY-MM-DD"""
-    try:
-        if fecha_serial == "" or fecha_serial is None:
-            return ""
-        
-        # Si ya es una cadena de fecha, devolverla
-        if isinstance(fecha_serial, str):
-            if "/" in fecha_serial or "-" in fecha_serial:
-                return fecha_serial
-        
-        # Convertir número serial de Excel a fecha
-        fecha_serial = float(fecha_serial)
-        # Excel cuenta desde 1900-01-01, pero tiene un bug que cuenta 1900 como año bisiesto
-        base_date = datetime(1899, 12, 30)  # Ajuste por el bug de Excel
-        fecha_convertida = base_date + timedelta(days=fecha_serial)
-        return fecha_convertida.strftime("%Y-%m-%d")
-        
-    except (ValueError, TypeError):
-        return ""
-
-def generar_nis_automatico():
-    """Genera un NIS automático de 11 dígitos"""
-    return str(random.randint(10000000000, 99999999999))
-
-def determinar_nivel_formacion(programa):
-    """Determina el nivel de formación basado en el programa"""
-    programa_lower = programa.lower() if programa else ""
-    
-    # Palabras clave para tecnólogo
-    tecnologicas = ["tecnología", "tecnológico", "tecnólogo", "gestión", "desarrollo", "análisis"]
-    
-    # Palabras clave para técnico
-    tecnicas = ["técnico", "auxiliar", "operación", "mantenimiento"]
-    
-    for palabra in tecnologicas:
-        if palabra in programa_lower:
-            return "Tecnólogo"
-    
-    for palabra in tecnicas:
-        if palabra in programa_lower:
-            return "Técnico"
-    
-    # Por defecto, si el programa es largo (más de 50 caracteres), probablemente sea tecnólogo
-    if len(programa) > 50:
-        return "Tecnólogo"
-    
-    return "Técnico"
-
 def procesar_foto_aprendiz_fallback(archivo_foto, cedula):
     """Función de procesamiento de fotos de respaldo si no existe la original"""
     try:
@@ -588,327 +419,6 @@ def procesar_foto_admin_con_backup(archivo_foto, cedula):
     except Exception as e:
         return procesar_foto_aprendiz_fallback(archivo_foto, cedula)
 
-# =============================================
-# NUEVA FUNCIÓN PARA VERIFICAR DUPLICADOS
-# =============================================
-
-def verificar_datos_duplicados(cedulas_excel, porcentaje_minimo=80):
-    """
-    Verifica si los datos del Excel ya están cargados en la base de datos
-    Retorna True si más del porcentaje_minimo de las cédulas ya existen
-    """
-    try:
-        if not cedulas_excel:
-            return False, 0, 0
-            
-        conn = sqlite3.connect('carnet.db')
-        cursor = conn.cursor()
-        
-        # Convertir cédulas a lista para consulta SQL
-        cedulas_limpias = []
-        for cedula in cedulas_excel:
-            cedula_limpia = ''.join(filter(str.isdigit, str(cedula))) if cedula else ''
-            if cedula_limpia and len(cedula_limpia) >= 7:
-                cedulas_limpias.append(cedula_limpia)
-        
-        if not cedulas_limpias:
-            conn.close()
-            return False, 0, 0
-        
-        # Buscar cédulas existentes en la base de datos
-        placeholders = ','.join(['?' for _ in cedulas_limpias])
-        cursor.execute(f"SELECT cedula FROM empleados WHERE cedula IN ({placeholders})", cedulas_limpias)
-        cedulas_existentes = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        # Calcular porcentaje de coincidencias
-        total_cedulas = len(cedulas_limpias)
-        cedulas_encontradas = len(cedulas_existentes)
-        porcentaje_coincidencia = (cedulas_encontradas / total_cedulas) * 100 if total_cedulas > 0 else 0
-        
-        print(f"📊 Verificación duplicados:")
-        print(f"   - Total cédulas en Excel: {total_cedulas}")
-        print(f"   - Cédulas ya existentes: {cedulas_encontradas}")
-        print(f"   - Porcentaje coincidencia: {porcentaje_coincidencia:.1f}%")
-        
-        # Si más del porcentaje_minimo ya existe, consideramos que está duplicado
-        es_duplicado = porcentaje_coincidencia >= porcentaje_minimo
-        
-        return es_duplicado, cedulas_encontradas, total_cedulas
-        
-    except Exception as e:
-        print(f"Error verificando duplicados: {e}")
-        return False, 0, 0
-
-# =============================================
-# FUNCIÓN MEJORADA PARA CARGAR EXCEL SENA (CON VERIFICACIÓN DE DUPLICADOS)
-# =============================================
-
-def cargar_excel_sena_mejorado(file):
-    """Función especializada para cargar archivos Excel del SENA con manejo mejorado"""
-    try:
-        print("=== INICIANDO CARGA DE EXCEL SENA ===")
-        
-        # Guardar archivo temporalmente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-            file.save(temp_file.name)
-            temp_file_path = temp_file.name
-        
-        print(f"Archivo guardado temporalmente en: {temp_file_path}")
-        
-        # Leer Excel con openpyxl directamente para mejor control
-        workbook = openpyxl.load_workbook(temp_file_path)
-        sheet = workbook.active
-        
-        print(f"Hoja activa: {sheet.title}")
-        
-        # Obtener todas las filas
-        rows = list(sheet.iter_rows(values_only=True))
-        print(f"Total de filas encontradas: {len(rows)}")
-        
-        if len(rows) < 2:
-            os.unlink(temp_file_path)
-            return {'success': False, 'message': 'El archivo no contiene datos válidos'}
-        
-        # Identificar headers (primera fila no vacía)
-        headers_row = rows[0]
-        print(f"Headers detectados: {headers_row}")
-        
-        # Crear mapa de columnas (ignorando las vacías)
-        column_map = {}
-        for idx, header in enumerate(headers_row):
-            if header and header.strip():
-                column_map[header.strip()] = idx
-        
-        print(f"Mapa de columnas creado: {column_map}")
-        print(f"🔍 Buscando columna de fecha en: {list(column_map.keys())}")
-        
-        # Verificar columnas requeridas
-        required_columns = ['Primer Apellido', 'Nombre', 'Tipo de documento', 'Número de documento']
-        missing_columns = [col for col in required_columns if col not in column_map]
-        
-        if missing_columns:
-            os.unlink(temp_file_path)
-            return {
-                'success': False, 
-                'message': f'Faltan columnas requeridas: {", ".join(missing_columns)}'
-            }
-        
-        # 🆕 NUEVA VERIFICACIÓN DE DUPLICADOS
-        print("🔍 Verificando si los datos ya están cargados...")
-        
-        # Extraer todas las cédulas del Excel para verificación
-        cedulas_excel = []
-        for row_idx, row in enumerate(rows[1:], start=2):
-            if not any(row):
-                continue
-            numero_documento = str(row[column_map.get('Número de documento', '')]).strip() if row[column_map.get('Número de documento', '')] else ''
-            if numero_documento and numero_documento != 'None':
-                cedulas_excel.append(numero_documento)
-        
-        # Verificar duplicados
-        es_duplicado, coincidencias, total = verificar_datos_duplicados(cedulas_excel, porcentaje_minimo=80)
-        
-        if es_duplicado:
-            os.unlink(temp_file_path)
-            return {
-                'success': False,
-                'message': f'⚠️ Base de datos duplicada detectada. {coincidencias} de {total} aprendices ({((coincidencias/total)*100):.1f}%) ya están registrados en el sistema. Si necesitas actualizar datos específicos, elimina los registros duplicados primero o usa una plantilla con solo los datos nuevos.',
-                'duplicado': True,
-                'coincidencias': coincidencias,
-                'total': total
-            }
-        
-        # Si llegamos aquí, continuar con el procesamiento normal...
-        print("✅ Verificación pasada, continuando con la carga...")
-        
-        # Procesar datos
-        conn = sqlite3.connect('carnet.db')
-        cursor = conn.cursor()
-        
-        created_count = 0
-        updated_count = 0
-        error_count = 0
-        errors = []
-        
-        # Procesar cada fila de datos (saltar header)
-        for row_idx, row in enumerate(rows[1:], start=2):
-            try:
-                # Saltar filas completamente vacías
-                if not any(row):
-                    continue
-                
-                # Extraer datos usando el mapa de columnas
-                numero_documento = str(row[column_map.get('Número de documento', '')]).strip() if row[column_map.get('Número de documento', '')] else ''
-                
-                # Validar que tenga número de documento
-                if not numero_documento or numero_documento == 'None':
-                    continue
-                
-                # Limpiar número de documento
-                numero_documento = ''.join(filter(str.isdigit, numero_documento))
-                if len(numero_documento) < 7:
-                    errors.append(f"Fila {row_idx}: Número de documento inválido")
-                    error_count += 1
-                    continue
-                
-                # Extraer otros campos
-                primer_apellido = str(row[column_map.get('Primer Apellido', '')]).strip().upper() if row[column_map.get('Primer Apellido', '')] else ''
-                segundo_apellido = str(row[column_map.get('Segundo Apellido', '')]).strip().upper() if row[column_map.get('Segundo Apellido', '')] else ''
-                nombre = str(row[column_map.get('Nombre', '')]).strip().upper() if row[column_map.get('Nombre', '')] else ''
-                tipo_documento = str(row[column_map.get('Tipo de documento', '')]).strip() if row[column_map.get('Tipo de documento', '')] else 'CC'
-                tipo_sangre = str(row[column_map.get('Tipo de Sangre', '')]).strip().upper() if row[column_map.get('Tipo de Sangre', '')] else 'O+'
-                nombre_programa = str(row[column_map.get('Nombre del Programa', '')]).strip() if row[column_map.get('Nombre del Programa', '')] else ''
-                codigo_ficha = str(row[column_map.get('Código de Ficha', '')]).strip() if row[column_map.get('Código de Ficha', '')] else ''
-                centro = str(row[column_map.get('Centro', '')]).strip() if row[column_map.get('Centro', '')] else 'Centro de Biotecnología Industrial'
-                red_tecnologica = str(row[column_map.get('Red Tecnologica', '')]).strip() if row[column_map.get('Red Tecnologica', '')] else ''
-                
-                # Procesar fecha
-                fecha_finalizacion = None
-                posibles_nombres_fecha = [
-                    'Fecha Finalización del Programa',
-                    'Fecha Finalizacion del Programa',
-                    'FECHA FINALIZACION',
-                    'Fecha de Finalización',
-                    'Fecha Finalizacion',
-                    'Fecha Final',
-                    'Fecha Fin'
-                ]
-
-                for nombre_col in posibles_nombres_fecha:
-                    if nombre_col in column_map:
-                        fecha_finalizacion_raw = row[column_map.get(nombre_col, '')]
-                        if fecha_finalizacion_raw and fecha_finalizacion_raw != 'None':
-                            fecha_finalizacion = convertir_fecha_excel(fecha_finalizacion_raw)
-                            print(f"✅ Fecha encontrada en columna '{nombre_col}': {fecha_finalizacion}")
-                            break
-
-                # Si no se encontró fecha, usar fecha por defecto (1 año desde hoy)
-                if not fecha_finalizacion:
-                    from datetime import datetime, timedelta
-                    fecha_default = (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
-                    fecha_finalizacion = fecha_default
-                    print(f"⚠️ No se encontró fecha de finalización, usando: {fecha_finalizacion}")
-                
-                # Generar o procesar NIS
-                nis = str(row[column_map.get('NIS', '')]).strip() if row[column_map.get('NIS', '')] else ''
-                if not nis or nis == 'None' or nis == '':
-                    nis = generar_nis_automatico()
-                
-                # Determinar nivel de formación
-                nivel_formacion = determinar_nivel_formacion(nombre_programa)
-                
-                # Validar datos mínimos
-                if not all([primer_apellido, nombre, numero_documento]):
-                    errors.append(f"Fila {row_idx}: Faltan datos obligatorios (Primer Apellido, Nombre, Número de documento)")
-                    error_count += 1
-                    continue
-                
-                # Construir nombre completo
-                nombre_completo = f"{nombre} {primer_apellido}"
-                if segundo_apellido:
-                    nombre_completo += f" {segundo_apellido}"
-                
-                # Verificar si ya existe
-                cursor.execute("SELECT id FROM empleados WHERE cedula = ?", (numero_documento,))
-                existe = cursor.fetchone()
-                
-                # Generar código único
-                iniciales = ''.join([parte[0] for parte in nombre_completo.split() if parte])[:4]
-                codigo_generado = None
-                for _ in range(10):
-                    codigo_temp = f"{iniciales}{random.randint(1000, 9999)}"
-                    cursor.execute("SELECT codigo FROM empleados WHERE codigo = ?", (codigo_temp,))
-                    if not cursor.fetchone():
-                        codigo_generado = codigo_temp
-                        break
-                
-                if not codigo_generado:
-                    errors.append(f"Fila {row_idx}: No se pudo generar código único")
-                    error_count += 1
-                    continue
-                
-                # Preparar datos
-                hoy = date.today().strftime("%Y-%m-%d")
-                
-                if existe:
-                    # Actualizar
-                    cursor.execute("""
-                        UPDATE empleados SET 
-                            nombre = ?, tipo_documento = ?, cargo = ?, codigo = ?,
-                            fecha_emision = ?, fecha_vencimiento = ?, tipo_sangre = ?,
-                            nis = ?, primer_apellido = ?, segundo_apellido = ?,
-                            nombre_programa = ?, codigo_ficha = ?, centro = ?, 
-                            nivel_formacion = ?, red_tecnologica = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE cedula = ?
-                    """, (
-                        nombre_completo, tipo_documento, 'APRENDIZ', codigo_generado,
-                        hoy, fecha_finalizacion, tipo_sangre,
-                        nis, primer_apellido, segundo_apellido,
-                        nombre_programa, codigo_ficha, centro, 
-                        nivel_formacion, red_tecnologica,
-                        numero_documento
-                    ))
-                    updated_count += 1
-                    print(f"Actualizado: {nombre_completo} - Cedula: {numero_documento}")
-                else:
-                    # Crear nuevo
-                    cursor.execute("""
-                        INSERT INTO empleados (
-                            nombre, cedula, tipo_documento, cargo, codigo,
-                            fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                            nis, primer_apellido, segundo_apellido,
-                            nombre_programa, codigo_ficha, centro, 
-                            nivel_formacion, red_tecnologica
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        nombre_completo, numero_documento, tipo_documento, 
-                        'APRENDIZ', codigo_generado, hoy, 
-                        fecha_finalizacion, tipo_sangre, None,
-                        nis, primer_apellido, segundo_apellido,
-                        nombre_programa, codigo_ficha, centro, 
-                        nivel_formacion, red_tecnologica
-                    ))
-                    created_count += 1
-                    print(f"Creado: {nombre_completo} - Cedula: {numero_documento}")
-                
-                # Confirmar cada inserción
-                conn.commit()
-                
-            except Exception as e:
-                error_count += 1
-                error_msg = f"Fila {row_idx}: Error - {str(e)}"
-                errors.append(error_msg)
-                print(error_msg)
-                continue
-        
-        conn.close()
-        os.unlink(temp_file_path)
-        
-        print(f"=== CARGA COMPLETADA ===")
-        print(f"Creados: {created_count}")
-        print(f"Actualizados: {updated_count}")
-        print(f"Errores: {error_count}")
-        
-        return {
-            'success': True,
-            'created': created_count,
-            'updated': updated_count,
-            'errors': error_count,
-            'error_details': errors[:10],  # Máximo 10 errores para mostrar
-            'message': f'✅ Carga exitosa del SENA: {created_count} aprendices creados, {updated_count} actualizados.'
-        }
-        
-    except Exception as e:
-        if 'temp_file_path' in locals():
-            os.unlink(temp_file_path)
-        print(f"Error general cargando Excel: {e}")
-        return {
-            'success': False,
-            'message': f'Error al procesar archivo: {str(e)}'
-        }
-
 # =============================================
 # RUTAS PRINCIPALES DEL SISTEMA
 # =============================================
@@ -957,85 +467,39 @@ def api_metricas_dashboard():
         return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
 
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
 
         hoy = date.today().strftime("%Y-%m-%d")
         semana = (date.today() - timedelta(days=7)).strftime("%Y-%m-%d")
 
-        # ── Aprendices ──
-        cursor.execute("SELECT COUNT(*) FROM empleados")
-        total = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM empleados WHERE DATE(created_at) = ?", (hoy,))
-        hoy_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM empleados WHERE DATE(created_at) >= ?", (semana,))
-        semana_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM empleados WHERE foto IS NOT NULL AND foto != ''")
-        con_foto = cursor.fetchone()[0]
+        # ── Aprendices (tabla contadores, mantenida por triggers) ──
+        total = leer_contador(conn, 'total')
+        hoy_count = leer_contador(conn, 'fecha_creacion', hoy)
+        semana_count = sumar_desde(conn, 'fecha_creacion', semana)
+        con_foto = leer_contador(conn, 'con_foto')
 
         sin_foto = total - con_foto
 
-        conn.close()
-
-        # ── Carnets generados (leyendo disco) ──
-        carpeta = os.path.join('static', 'carnets')
-        cedulas_carnet = set()
-
-        if os.path.exists(carpeta):
-            archivos_completo = []
-            for archivo in os.listdir(carpeta):
-                if not archivo.endswith('.png'):
-                    continue
-                if archivo.startswith('carnet_') and '_completo' not in archivo:
-                    ced = archivo.replace('carnet_', '').replace('.png', '')
-                    if ced.isdigit():
-                        cedulas_carnet.add(ced)
-                elif archivo.startswith('carnet_combinado_'):
-                    ced = archivo.replace('carnet_combinado_', '').replace('.png', '')
-                    if ced.isdigit():
-                        cedulas_carnet.add(ced)
-                if archivo.endswith('_completo.png'):
-                    archivos_completo.append(archivo)
-
-            if archivos_completo:
-                conn2 = sqlite3.connect('carnet.db')
-                cur2 = conn2.cursor()
-                cur2.execute("SELECT cedula, nombre FROM empleados")
-                for ced_bd, nom_bd in cur2.fetchall():
-                    if nom_bd and (nom_bd.replace(' ', '_') + '_completo.png') in archivos_completo:
-                        cedulas_carnet.add(ced_bd)
-                conn2.close()
-
-        # Cruzar con cédulas actuales en BD para no contar huérfanos
-        conn3 = sqlite3.connect('carnet.db')
-        cur3 = conn3.cursor()
-        cur3.execute("SELECT cedula, foto FROM empleados")
-        rows = cur3.fetchall()
-        conn3.close()
-
-        cedulas_bd    = {r[0] for r in rows}
-        cedulas_foto  = {r[0] for r in rows if r[1]}
-
-        carnets_validos   = cedulas_carnet & cedulas_bd          # con carnet en disco Y en BD
-        carnets_con_foto  = carnets_validos & cedulas_foto       # generados Y con foto actual
-        carnets_sin_foto  = carnets_validos - cedulas_foto       # generados pero sin foto
-        total_carnets     = len(carnets_validos)
-        pendientes        = len(cedulas_foto - carnets_validos)  # tienen foto pero falta generar
+        # ── Carnets generados: cédulas en disco, cruzadas solo contra esas filas ──
+        # (los huérfanos, sin aprendiz en la BD, no cuentan)
+        cedulas_carnet = cedulas_con_carnet(conn)
+        total_carnets, carnets_con_foto = cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(foto IS NOT NULL AND foto != ''), 0)
+            FROM empleados WHERE cedula IN (SELECT value FROM json_each(?))
+        """, (json.dumps(sorted(cedulas_carnet)),)).fetchone()
+        carnets_sin_foto = total_carnets - carnets_con_foto   # generados pero sin foto
+        pendientes = con_foto - carnets_con_foto              # tienen foto pero falta generar
 
         # Carnets de hoy / semana — aproximación por fecha de archivo
         carnets_hoy    = 0
         carnets_semana = 0
-        if os.path.exists(carpeta):
-            import time as _time
-            ts_hoy   = _time.time() - 86400
-            ts_semana= _time.time() - 86400 * 7
-            for archivo in os.listdir(carpeta):
-                ruta = os.path.join(carpeta, archivo)
-                if archivo.endswith('.png') and os.path.exists(ruta):
-                    mtime = os.path.getmtime(ruta)
+        if os.path.exists(CARPETA_CARNETS):
+            ts_hoy    = time.time() - 86400
+            ts_semana = time.time() - 86400 * 7
+            for entrada in os.scandir(CARPETA_CARNETS):
+                if entrada.name.endswith('.png'):
+                    mtime = entrada.stat().st_mtime
                     if mtime >= ts_hoy:
                         carnets_hoy += 1
                     if mtime >= ts_semana:
@@ -1053,8 +517,8 @@ def api_metricas_dashboard():
             'carnets_total': total_carnets,
             'carnets_hoy': carnets_hoy,
             'carnets_semana': carnets_semana,
-            'carnets_con_foto': len(carnets_con_foto),
-            'carnets_sin_foto': len(carnets_sin_foto),
+            'carnets_con_foto': carnets_con_foto,
+            'carnets_sin_foto': carnets_sin_foto,
             'carnets_pendientes': pendientes,
         })
 
@@ -1102,131 +566,189 @@ def dashboard_aprendiz():
 @app.route('/api/lista_aprendices_filtrada', methods=['GET'])
 def api_lista_aprendices_filtrada():
     """
-    API para obtener lista filtrada de aprendices
+    API para obtener lista filtrada de aprendices, paginada por cursor
     
     Parámetros:
     - todos=true: mostrar todos
     - ficha=codigo: buscar por ficha
     - cedula=numero: buscar por cédula exacta
-    - nombre=texto: buscar por nombre (parcial)
+    - nombre=texto: buscar por nombre (prefijos de palabra, índice FTS5)
+    - buscar=texto: buscar en nombre, cédula, programa y ficha (índice FTS5)
     - foto=con_foto|sin_foto: filtrar por foto
+    - carnet=generado|pendiente: con o sin carnet en disco
+    - limite=N: tamaño de página (por defecto 50, máximo 500)
+    - cursor=token: valor de 'siguiente_cursor' de la página anterior
+    - con_total=true: incluir el total de coincidencias (consulta COUNT adicional)
     """
     try:
-        print("\n[API] === BÚSQUEDA INICIADA ===")
-        
         # Obtener parámetros
         todos = request.args.get('todos', '').lower() == 'true'
         ficha = request.args.get('ficha', '').strip()
         cedula = request.args.get('cedula', '').strip()
         nombre = request.args.get('nombre', '').strip()
+        buscar = request.args.get('buscar', '').strip()
         foto_estado = request.args.get('foto', '').strip()
+        carnet_estado = request.args.get('carnet', '').strip()
+        con_total = request.args.get('con_total', '').lower() == 'true'
+        limite = request.args.get('limite', LIMITE_PAGINA_DEFECTO, type=int) or LIMITE_PAGINA_DEFECTO
+        limite = max(1, min(limite, LIMITE_PAGINA_MAXIMO))
         
-        print(f"[API] Parámetros recibidos:")
-        print(f"  - todos: {todos}")
-        print(f"  - ficha: {ficha}")
-        print(f"  - cedula: {cedula}")
-        print(f"  - nombre: {nombre}")
-        print(f"  - foto_estado: {foto_estado}")
+        try:
+            posicion = decodificar_cursor(request.args.get('cursor', '').strip())
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Cursor inválido'}), 400
         
-        # Conectar a BD
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz
         
-        # Contar total en BD
-        cursor.execute("SELECT COUNT(*) FROM empleados")
-        total_en_bd = cursor.fetchone()[0]
-        print(f"[API] Total en BD: {total_en_bd}")
-        
-        # Construir consulta
-        query = """
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados 
-            WHERE 1=1
-        """
+        # Construir filtros (union: JOIN con el índice FTS cuando se busca por nombre)
+        union = ""
+        filtros = ""
         params = []
         
-        # Aplicar filtros
         if not todos:
             if ficha:
-                print(f"[API] Filtrando por ficha: {ficha}")
-                query += " AND codigo_ficha LIKE ?"
+                filtros += " AND codigo_ficha LIKE ?"
                 params.append(f"%{ficha}%")
             
             if cedula:
-                print(f"[API] Filtrando por cedula: {cedula}")
                 cedula_limpia = ''.join(filter(str.isdigit, cedula))
-                query += " AND cedula = ?"
+                filtros += " AND cedula = ?"
                 params.append(cedula_limpia)
             
-            if nombre:
-                print(f"[API] Filtrando por nombre: {nombre}")
-                query += " AND nombre LIKE ?"
-                params.append(f"%{nombre}%")
-        else:
-            print(f"[API] Mostrando TODOS los aprendices")
+            if nombre or buscar:
+                columnas = ('nombre',) if nombre else None
+                union, condicion, params_busqueda, _ = filtro_busqueda(conn, nombre or buscar, columnas)
+                filtros += condicion
+                if union:
+                    # El parámetro del JOIN va antes que los del WHERE
+                    params = params_busqueda + params
+                else:
+                    params.extend(params_busqueda)
         
         # Filtro por foto
         if foto_estado == 'con_foto':
-            print(f"[API] Filtrando: CON FOTO")
-            query += " AND foto IS NOT NULL AND foto != ''"
+            filtros += " AND foto IS NOT NULL AND foto != ''"
         elif foto_estado == 'sin_foto':
-            print(f"[API] Filtrando: SIN FOTO")
-            query += " AND (foto IS NULL OR foto = '')"
-        
-        query += " ORDER BY nombre ASC"
-        
-        print(f"[API] Query: {query}")
-        print(f"[API] Parámetros: {params}")
-        
-        # Ejecutar
-        cursor.execute(query, params)
-        aprendices = []
-        
-        for row in cursor.fetchall():
-            aprendiz = {
-                'nombre': row[0],
-                'cedula': row[1],
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4],
-                'fecha_emision': row[5],
-                'fecha_vencimiento': row[6],
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8],
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa General',
-                'codigo_ficha': row[13] or 'Sin Ficha',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico',
-                'red_tecnologica': row[16] or 'Red Tecnológica'
-            }
-            aprendices.append(aprendiz)
+            filtros += " AND (foto IS NULL OR foto = '')"
+        
+        # Filtro por carnet en disco
+        if carnet_estado in ('generado', 'pendiente'):
+            operador = "IN" if carnet_estado == 'generado' else "NOT IN"
+            filtros += f" AND cedula {operador} (SELECT value FROM json_each(?))"
+            params.append(json.dumps(sorted(cedulas_con_carnet(conn))))
+        
+        # Total solo si se pide (evita un COUNT(*) en cada página)
+        total = None
+        if con_total:
+            total = conn.execute("SELECT COUNT(*) FROM empleados" + union + " WHERE 1=1" + filtros, params).fetchone()[0]
+        
+        # Keyset: continuar después del último (nombre, cedula) entregado
+        query = SELECT_APRENDIZ + union + " WHERE 1=1" + filtros
+        params_pagina = list(params)
+        if posicion:
+            query += " AND (nombre, cedula) > (?, ?)"
+            params_pagina.extend(posicion)
+        
+        # Orden estable: cedula es única y desempata nombres repetidos
+        query += " ORDER BY nombre ASC, cedula ASC LIMIT ?"
+        params_pagina.append(limite + 1)
+        
+        cursor.execute(query, params_pagina)
+        aprendices = cursor.fetchall()
         
-        conn.close()
+        tiene_mas = len(aprendices) > limite
+        if tiene_mas:
+            aprendices = aprendices[:limite]
+        siguiente_cursor = codificar_cursor(aprendices[-1]) if tiene_mas else None
         
-        print(f"[API] RESULTADO: {len(aprendices)} aprendices encontrados")
-        print(f"[API] === BÚSQUEDA FINALIZADA ===\n")
+        print(f"[API] Página de {len(aprendices)} aprendices (más: {tiene_mas})")
         
-        return jsonify({
+        respuesta = {
             'success': True,
-            'total': len(aprendices),
-            'aprendices': aprendices
-        })
+            'cantidad': len(aprendices),
+            'aprendices': aprendices,
+            'siguiente_cursor': siguiente_cursor,
+            'tiene_mas': tiene_mas
+        }
+        if total is not None:
+            respuesta['total'] = total
+        
+        return jsonify(respuesta)
     
     except Exception as e:
         print(f"[API ERROR]: {str(e)}")
-        import traceback
         traceback.print_exc()
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
         }), 500
 
+@app.route('/api/export', methods=['GET'])
+def api_export():
+    """
+    Exporta aprendices en streaming, sin armar la lista en memoria
+    
+    Parámetros:
+    - format=csv|jsonl: formato de salida (por defecto csv)
+    - ficha=codigo: ficha exacta
+    - programa=texto: nombre del programa (contiene)
+    - foto=con_foto|sin_foto: filtrar por foto
+    - nivel=texto: nivel de formación exacto
+    - buscar=texto: búsqueda de texto (FTS5)
+    """
+    if 'usuario' not in session:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 401
+    if session.get('rol') != 'admin':
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+
+    formato = request.args.get('format', 'csv').strip().lower()
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({'success': False, 'message': 'Formato no soportado (use csv o jsonl)'}), 400
+    
+    filtros = {
+        'buscar': request.args.get('buscar', '').strip(),
+        'filtro_foto': request.args.get('foto', '').strip(),
+        'filtro_programa': request.args.get('programa', '').strip(),
+        'filtro_nivel': request.args.get('nivel', '').strip(),
+        'filtro_ficha': request.args.get('ficha', '').strip(),
+    }
+    nombre_archivo = f'aprendices_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
+    
+    try:
+        conn = obtener_conexion()
+        # La versión y las filas se leen en la misma transacción
+        clave = clave_exportacion(iniciar_lectura(conn), formato, filtros)
+        if clave in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{clave}"'})
+        
+        # Misma versión y filtros: se envía el archivo ya generado
+        en_cache = se_guarda_en_cache(conn, filtros)
+        ruta = buscar_en_cache(clave, formato) if en_cache else None
+        if ruta:
+            return send_file(ruta, mimetype=FORMATOS_EXPORTACION[formato], as_attachment=True,
+                             download_name=nombre_archivo, etag=clave, conditional=True)
+        
+        cursor = cursor_exportacion(conn, **filtros)
+    except Exception as e:
+        print(f"[API ERROR] Exportación: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+    
+    # stream_with_context mantiene la conexión de la petición hasta enviar la última fila;
+    # el archivo queda en caché solo si la exportación se envió completa
+    bloques = GENERADORES_EXPORTACION[formato](cursor)
+    if en_cache:
+        bloques = guardar_en_cache(bloques, clave, formato)
+    respuesta = Response(
+        stream_with_context(bloques),
+        mimetype=FORMATOS_EXPORTACION[formato],
+        headers={'Content-Disposition': f'attachment; filename={nombre_archivo}'}
+    )
+    respuesta.set_etag(clave)
+    return respuesta
+
 @app.route('/api/buscar_aprendiz/<cedula>')
 def api_buscar_aprendiz(cedula):
     """Buscar un aprendiz específico por cédula"""
@@ -1599,26 +1121,14 @@ def generar_carnet_web():
         print(f"Empleado encontrado: {empleado.get('nombre', 'Sin nombre')}")
         
         try:
-            print("Generando QR...")
-            ruta_qr = generar_qr(empleado["cedula"])
-            print(f"QR generado: {ruta_qr}")
-            
+            # QR, anverso, reverso y combinado en memoria; se guardan las tres caras
             print("Generando carnet...")
-            ruta_carnet = generar_carnet(empleado, ruta_qr)
-            print(f"Carnet generado: {ruta_carnet}")
-            
-            nombre_archivo = os.path.basename(ruta_carnet)
-            print(f"Nombre archivo: {nombre_archivo}")
-            
-            # Combinar anverso y reverso aquí (nombre está en empleado['nombre'])
-            print("Combinando anverso y reverso...")
-            reverso_path = f"reverso_{empleado['cedula']}.png"  # Nombre del reverso esperado
-            archivo_combinado = combinar_anverso_reverso(nombre_archivo, reverso_path, empleado['nombre'])
-            print(f"Archivo combinado: {archivo_combinado}")
+            archivos = renderizar_carnet(empleado, imagen_qr())
+            print(f"Archivos generados: {archivos}")
             
             print("Carnet generado exitosamente!")
             flash(f"Carnet generado exitosamente para {empleado['nombre']} (Nivel: {empleado['nivel_formacion']})", 'success')
-            return render_template("ver_carnet.html", carnet=archivo_combinado, empleado=empleado)
+            return render_template("ver_carnet.html", carnet=archivos['completo'], empleado=empleado, reverso=archivos['reverso'])
             
         except Exception as e:
             print(f"Error al generar carnet: {e}")
@@ -1641,107 +1151,40 @@ def descargar_plantilla():
         return redirect(url_for('login'))
     
     try:
-        # Obtener empleados registrados
-        empleados = obtener_todos_empleados()
-        
-        if empleados:
-            # Crear plantilla con datos reales (CON nivel_formacion y red_tecnologica)
-            data = {
-                'NIS': [],
-                'Primer Apellido': [],
-                'Segundo Apellido': [],
-                'Nombre': [],
-                'Tipo de documento': [],
-                'Número de documento': [],
-                'Tipo de Sangre': [],
-                'Nombre del Programa': [],
-                'Nivel de Formación': [],
-                'Código de Ficha': [],
-                'Centro': [],
-                'Red Tecnologica': [],
-                'Fecha Finalización del Programa': []
-            }
-            
-            # Llenar con datos reales
-            for empleado in empleados:
-                # Dividir nombre completo en partes
-                partes_nombre = empleado['nombre'].split()
-                if len(partes_nombre) >= 3:
-                    nombres = partes_nombre[0]
-                    primer_apellido = partes_nombre[1]
-                    segundo_apellido = ' '.join(partes_nombre[2:])
-                elif len(partes_nombre) == 2:
-                    nombres = partes_nombre[0]
-                    primer_apellido = partes_nombre[1]
-                    segundo_apellido = ''
-                else:
-                    nombres = empleado['nombre']
-                    primer_apellido = ''
-                    segundo_apellido = ''
-                
-                data['NIS'].append(empleado['nis'])
-                data['Primer Apellido'].append(primer_apellido)
-                data['Segundo Apellido'].append(segundo_apellido)
-                data['Nombre'].append(nombres)
-                data['Tipo de documento'].append(empleado['tipo_documento'])
-                data['Número de documento'].append(empleado['cedula'])
-                data['Tipo de Sangre'].append(empleado['tipo_sangre'])
-                data['Nombre del Programa'].append(empleado['nombre_programa'])
-                data['Nivel de Formación'].append(empleado['nivel_formacion'])
-                data['Código de Ficha'].append(empleado['codigo_ficha'])
-                data['Centro'].append(empleado['centro'])
-                data['Red Tecnologica'].append(empleado['red_tecnologica'])
-                data['Fecha Finalización del Programa'].append(empleado['fecha_vencimiento'])
-            
+        conn = obtener_conexion()
+        # La versión, el total y las filas se leen en la misma transacción;
+        # ETag = clave de la caché: una descarga repetida sin cambios responde 304
+        clave = clave_exportacion(iniciar_lectura(conn), 'xlsx')
+        if clave in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{clave}"'})
+        total = leer_contador(conn, 'total')
+        
+        if total:
             filename = f'empleados_sena_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            flash(f'Se descargó la plantilla con {len(empleados)} empleados registrados', 'success')
-            
+            flash(f'Se descargó la plantilla con {total} empleados registrados', 'success')
         else:
-            # Plantilla con datos de ejemplo si no hay empleados
-            data = {
-                'NIS': ['12345678901', '12345678902', '12345678903'],
-                'Primer Apellido': ['PEREZ', 'GARCIA', 'MARTINEZ'],
-                'Segundo Apellido': ['LOPEZ', 'RODRIGUEZ', 'SILVA'],
-                'Nombre': ['JUAN CARLOS', 'MARIA ALEJANDRA', 'CARLOS ANDRES'],
-                'Tipo de documento': ['CC', 'CC', 'TI'],
-                'Número de documento': ['12345678', '87654321', '11223344'],
-                'Tipo de Sangre': ['O+', 'A-', 'B+'],
-                'Nombre del Programa': [
-                    'Análisis y Desarrollo de Sistemas de Información',
-                    'Biotecnología Industrial',
-                    'Gestión Empresarial'
-                ],
-                'Nivel de Formación': ['Técnico', 'Tecnólogo', 'Técnico'],
-                'Código de Ficha': ['2024001', '2024002', '2024003'],
-                'Centro': [
-                    'Centro de Biotecnología Industrial',
-                    'Centro de Biotecnología Industrial',
-                    'Centro de Biotecnología Industrial'
-                ],
-                'Red Tecnologica': [
-                    'Tecnologías de Producción Industrial',
-                    'Tecnologías de Producción Industrial', 
-                    'Gestión y Negocios'
-                ],
-                'Fecha Finalización del Programa': ['31/12/2024', '30/06/2025', '15/11/2024']
-            }
             filename = 'plantilla_empleados_sena.xlsx'
             flash('Se descargó la plantilla con datos de ejemplo (no hay empleados registrados)', 'info')
         
-        # Crear DataFrame y archivo Excel
-        df = pd.DataFrame(data)
-        
-        # Crear archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-            df.to_excel(temp_file.name, index=False, sheet_name='Empleados SENA')
-            temp_file_path = temp_file.name
-        
-        return send_file(temp_file_path, as_attachment=True, download_name=filename)
+        ruta = buscar_en_cache(clave, 'xlsx')
+        if ruta:
+            return send_file(ruta, mimetype=MIME_XLSX, as_attachment=True, download_name=filename,
+                             etag=clave, conditional=True)
         
+        bloques = bloques_plantilla(conn, total)
     except Exception as e:
         print(f"Error generando plantilla: {e}")
         flash(f'Error al generar la plantilla: {str(e)}', 'error')
         return redirect(url_for('dashboard_admin'))
+    
+    # El libro se envía a medida que se leen las filas y queda en caché si se envió completo
+    respuesta = Response(
+        stream_with_context(guardar_en_cache(bloques, clave, 'xlsx')),
+        mimetype=MIME_XLSX,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+    respuesta.set_etag(clave)
+    return respuesta
 
 @app.route('/cargar_plantilla', methods=['GET', 'POST'])
 def cargar_plantilla():
@@ -1763,23 +1206,46 @@ def cargar_plantilla():
                 return jsonify({'success': False, 'message': 'No se seleccionó ningún archivo'})
             
             # Verificar extensión del archivo
-            if not file.filename.lower().endswith(('.xlsx', '.xls')):
-                return jsonify({'success': False, 'message': 'El archivo debe ser un Excel (.xlsx o .xls)'})
-            
-            print(f"🔄 Procesando archivo SENA: {file.filename}")
-            
-            # USAR LA NUEVA FUNCIÓN MEJORADA PARA EXCEL SENA (CON VERIFICACIÓN DE DUPLICADOS)
-            resultado = cargar_excel_sena_mejorado(file)
-            
-            print(f"✅ Resultado de carga: {resultado}")
-            
-            return jsonify(resultado)
+            if not file.filename.lower().endswith(EXTENSIONES_IMPORTACION):
+                return jsonify({'success': False, 'message': 'El archivo debe ser Excel (.xlsx), CSV (.csv) u OpenDocument (.ods)'})
+            
+            # Vista previa: se lee directo del archivo subido y no se escribe nada
+            if request.form.get('simulacion') in ('1', 'true'):
+                print(f"🔍 Vista previa de archivo SENA: {file.filename}")
+                extension = os.path.splitext(file.filename)[1].lower()
+                return jsonify(simular_importacion(file.stream, extension,
+                                                   alias=app.config['ALIAS_COLUMNAS']))
+            
+            print(f"🔄 Encolando archivo SENA: {file.filename}")
+            
+            # La importación corre en segundo plano; el avance se consulta en /api/import_jobs/<id>
+            job_id = crear_trabajo(file)
+            
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'estado': 'pendiente',
+                'status_url': url_for('api_import_job', job_id=job_id),
+                'message': 'Archivo recibido. La importación se está procesando...'
+            }), 202
                 
         except Exception as e:
             error_msg = f"Error general: {str(e)}"
             print(f"❌ {error_msg}")
             return jsonify({'success': False, 'message': error_msg})
 
+@app.route('/api/import_jobs/<job_id>')
+def api_import_job(job_id):
+    """Avance de una importación: filas procesadas, creados, actualizados, sin cambios y errores"""
+    if 'usuario' not in session or session.get('rol') != 'admin':
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    
+    trabajo = obtener_trabajo(job_id)
+    if not trabajo:
+        return jsonify({'success': False, 'message': 'Trabajo de importación no encontrado'}), 404
+    
+    return jsonify(trabajo)
+
 @app.route('/cargar_excel', methods=['GET', 'POST'])
 def cargar_excel():
     """Alias para cargar_plantilla - compatible con el dashboard"""
@@ -1848,17 +1314,15 @@ def actualizar_foto_rapido():
             return jsonify({'success': False, 'message': f'Error procesando foto: {mensaje}'})
         
         # Actualizar base de datos
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         cursor.execute("UPDATE empleados SET foto = ? WHERE cedula = ?", 
                      (nombre_archivo_foto, cedula_limpia))
         
         if cursor.rowcount == 0:
-            conn.close()
             return jsonify({'success': False, 'message': 'No se encontró el aprendiz para actualizar'}), 404
         
         conn.commit()
-        conn.close()
         
         print(f"✅ Foto cargada para: {cedula_limpia}")
         
@@ -1896,7 +1360,7 @@ def consultar_datos_aprendiz():
             if aprendiz:
                 # Guardar datos en sesión para el siguiente paso
                 session['aprendiz_cedula'] = cedula_limpia
-                session['aprendiz_datos'] = aprendiz
+                session['aprendiz_datos'] = aprendiz.a_dict()
                 
                 # Mensaje de éxito
                 flash(f'Datos encontrados para: {aprendiz["nombre"]}', 'success')
@@ -1953,12 +1417,11 @@ def cargar_foto_aprendiz():
             print(f"Foto procesada automáticamente con backup: {nombre_archivo_foto}")
             
             # Actualizar datos del aprendiz con la nueva foto en la base de datos
-            conn = sqlite3.connect('carnet.db')
+            conn = obtener_conexion()
             cursor = conn.cursor()
             cursor.execute("UPDATE empleados SET foto = ? WHERE cedula = ?", 
                          (nombre_archivo_foto, aprendiz_cedula))
             conn.commit()
-            conn.close()
             
             # Limpiar session data
             session.pop('aprendiz_cedula', None)
@@ -2099,12 +1562,11 @@ def gestionar_fotos():
                 
                 if exito:
                     # Actualizar base de datos
-                    conn = sqlite3.connect('carnet.db')
+                    conn = obtener_conexion()
                     cursor = conn.cursor()
                     cursor.execute("UPDATE empleados SET foto = ? WHERE cedula = ?", 
                                  (nombre_archivo_foto, cedula_limpia))
                     conn.commit()
-                    conn.close()
                     
                     flash(f'Foto actualizada exitosamente para {aprendiz["nombre"]} (con backup automático)', 'success')
                     
@@ -2130,7 +1592,7 @@ def eliminar_foto_por_cedula(cedula):
         return jsonify({'success': False, 'message': 'Acceso denegado'})
     
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         
         # Obtener la información del aprendiz por cédula
@@ -2172,7 +1634,6 @@ def eliminar_foto_por_cedula(cedula):
         # Actualizar base de datos - quitar la foto
         cursor.execute("UPDATE empleados SET foto = NULL WHERE cedula = ?", (cedula,))
         conn.commit()
-        conn.close()
         
         mensaje = f'Foto eliminada exitosamente para {nombre_aprendiz}. Las copias de respaldo se mantienen intactas.'
         if archivos_eliminados > 1:
@@ -2194,7 +1655,7 @@ def eliminar_foto_aprendiz(aprendiz_id):
         return redirect(url_for('dashboard_admin'))
     
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         
         # Obtener la información del aprendiz
@@ -2217,7 +1678,6 @@ def eliminar_foto_aprendiz(aprendiz_id):
         # Actualizar base de datos - quitar la foto
         cursor.execute("UPDATE empleados SET foto = NULL WHERE rowid = ?", (aprendiz_id,))
         conn.commit()
-        conn.close()
         
         flash(f'Foto eliminada exitosamente para {nombre_aprendiz}. Las copias de respaldo se mantienen intactas. El aprendiz puede subir una nueva foto.', 'success')
         
@@ -2378,16 +1838,12 @@ def archivo_carnets():
     agrupar_por = request.args.get('agrupar', 'ficha')
     
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz
         
         # Obtener TODOS los aprendices con foto (listos para carnet)
-        cursor.execute("""
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados 
+        cursor.execute(SELECT_APRENDIZ + """
             WHERE cargo = 'APRENDIZ' 
               AND foto IS NOT NULL 
               AND foto != ''
@@ -2395,26 +1851,7 @@ def archivo_carnets():
         """)
         
         aprendices_con_foto = []
-        for row in cursor.fetchall():
-            aprendiz = {
-                'nombre': row[0],
-                'cedula': row[1],
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4],
-                'fecha_emision': row[5],
-                'fecha_vencimiento': row[6],
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8],
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa General',
-                'codigo_ficha': row[13] or 'Sin Ficha',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico'
-            }
-            
+        for aprendiz in cursor:
             # Verificar si la foto existe físicamente
             ruta_foto = os.path.join('static/fotos', aprendiz['foto'])
             aprendiz['foto_existe'] = os.path.exists(ruta_foto)
@@ -2436,7 +1873,6 @@ def archivo_carnets():
             if aprendiz['foto_existe']:
                 aprendices_con_foto.append(aprendiz)
         
-        conn.close()
         
         print(f"📊 Total aprendices con foto: {len(aprendices_con_foto)}")
         
@@ -2531,16 +1967,9 @@ def ver_carnet_archivo(cedula):
                 return redirect(url_for('archivo_carnets'))
             
             try:
-                # Generar QR
-                ruta_qr = generar_qr(aprendiz["cedula"])
-                
-                # Generar carnet
-                ruta_carnet = generar_carnet(aprendiz, ruta_qr)
-                nombre_archivo = os.path.basename(ruta_carnet)
-                
-                # Combinar anverso y reverso
-                reverso_path = f"reverso_{aprendiz['cedula']}.png"
-                carnet_encontrado = combinar_anverso_reverso(nombre_archivo, reverso_path, aprendiz['nombre'])
+                # Generar carnet (QR, anverso, reverso y combinado en memoria)
+                archivos = renderizar_carnet(aprendiz, imagen_qr())
+                carnet_encontrado = archivos['completo']
                 
                 flash(f'✅ Carnet generado exitosamente para {aprendiz["nombre"]}', 'success')
                 
@@ -2551,6 +1980,7 @@ def ver_carnet_archivo(cedula):
         return render_template("ver_carnet.html", 
                              carnet=carnet_encontrado, 
                              empleado=aprendiz,
+                             reverso=reverso_compartido(aprendiz),
                              desde_archivo=True)
         
     except Exception as e:
@@ -2693,18 +2123,25 @@ def gestionar_fichas():
     
     try:
         # Obtener todas las fichas con sus aprendices
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         
+        # Agrupar por las claves enteras de los catálogos y luego unir los nombres
         cursor.execute("""
-            SELECT codigo_ficha, nombre_programa, COUNT(*) as total_aprendices,
-                   SUM(CASE WHEN foto IS NOT NULL AND foto != '' THEN 1 ELSE 0 END) as con_foto,
-                   MIN(fecha_emision) as primera_inscripcion,
-                   MAX(fecha_vencimiento) as fecha_finalizacion
-            FROM empleados 
-            WHERE codigo_ficha IS NOT NULL AND codigo_ficha != ''
-            GROUP BY codigo_ficha, nombre_programa
-            ORDER BY codigo_ficha DESC
+            SELECT f.codigo, p.nombre, g.total_aprendices, g.con_foto,
+                   g.primera_inscripcion, g.fecha_finalizacion
+            FROM (
+                SELECT ficha_id, programa_id, COUNT(*) as total_aprendices,
+                       SUM(CASE WHEN foto IS NOT NULL AND foto != '' THEN 1 ELSE 0 END) as con_foto,
+                       MIN(fecha_emision) as primera_inscripcion,
+                       MAX(fecha_vencimiento) as fecha_finalizacion
+                FROM empleados
+                WHERE ficha_id IS NOT NULL
+                GROUP BY ficha_id, programa_id
+            ) g
+            JOIN fichas f ON f.id = g.ficha_id
+            LEFT JOIN programas p ON p.id = g.programa_id
+            ORDER BY f.codigo DESC
         """)
         
         fichas = []
@@ -2721,7 +2158,6 @@ def gestionar_fichas():
             }
             fichas.append(ficha)
         
-        conn.close()
         
         # Estadísticas generales
         total_fichas = len(fichas)
@@ -2749,41 +2185,17 @@ def ver_ficha(codigo_ficha):
     
     try:
         # Obtener aprendices de la ficha
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz
         
-        cursor.execute("""
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados 
+        cursor.execute(SELECT_APRENDIZ + """
             WHERE codigo_ficha = ?
             ORDER BY nombre ASC
         """, (codigo_ficha,))
         
         aprendices = []
-        for row in cursor.fetchall():
-            aprendiz = {
-                'nombre': row[0],
-                'cedula': row[1],
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4],
-                'fecha_emision': row[5],
-                'fecha_vencimiento': row[6],
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8],
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa General',
-                'codigo_ficha': row[13] or 'Sin Ficha',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico',
-                'red_tecnologica': row[16] or 'Red Tecnológica'
-            }
-            
+        for aprendiz in cursor:
             # Verificar existencia de foto
             if aprendiz['foto']:
                 ruta_foto = os.path.join('static/fotos', aprendiz['foto'])
@@ -2793,7 +2205,6 @@ def ver_ficha(codigo_ficha):
             
             aprendices.append(aprendiz)
         
-        conn.close()
         
         if not aprendices:
             flash(f'No se encontraron aprendices en la ficha {codigo_ficha}', 'error')
@@ -2837,78 +2248,40 @@ def generar_carnets_ficha(codigo_ficha):
     
     try:
         # Obtener aprendices de la ficha que tengan foto
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = fabrica_aprendiz
         
-        cursor.execute("""
-            SELECT nombre, cedula, tipo_documento, cargo, codigo, 
-                   fecha_emision, fecha_vencimiento, tipo_sangre, foto,
-                   nis, primer_apellido, segundo_apellido, 
-                   nombre_programa, codigo_ficha, centro, nivel_formacion, red_tecnologica
-            FROM empleados 
+        cursor.execute(SELECT_APRENDIZ + """
             WHERE codigo_ficha = ? AND foto IS NOT NULL AND foto != ''
             ORDER BY nombre ASC
         """, (codigo_ficha,))
         
         aprendices_con_foto = []
-        for row in cursor.fetchall():
-            empleado = {
-                'nombre': row[0],
-                'cedula': row[1],
-                'tipo_documento': row[2] or 'CC',
-                'cargo': row[3] or 'APRENDIZ',
-                'codigo': row[4],
-                'fecha_emision': row[5],
-                'fecha_vencimiento': row[6],
-                'tipo_sangre': row[7] or 'O+',
-                'foto': row[8],
-                'nis': row[9] or 'N/A',
-                'primer_apellido': row[10] or '',
-                'segundo_apellido': row[11] or '',
-                'nombre_programa': row[12] or 'Programa General',
-                'codigo_ficha': row[13] or 'Sin Ficha',
-                'centro': row[14] or 'Centro de Biotecnología Industrial',
-                'nivel_formacion': row[15] or 'Técnico',
-                'red_tecnologica': row[16] or 'Red Tecnológica'
-            }
-            
+        for empleado in cursor:
             # Verificar que la foto existe físicamente
             ruta_foto = os.path.join('static/fotos', empleado['foto'])
             if os.path.exists(ruta_foto):
                 aprendices_con_foto.append(empleado)
         
-        conn.close()
         
         if not aprendices_con_foto:
             flash(f'No hay aprendices con foto en la ficha {codigo_ficha}', 'error')
             return redirect(url_for('ver_ficha', codigo_ficha=codigo_ficha))
         
-        # Generar carnets para todos los aprendices
-        carnets_generados = 0
-        errores = 0
-        
-        for empleado in aprendices_con_foto:
-            try:
-                # Generar QR
-                ruta_qr = generar_qr(empleado["cedula"])
-                
-                # Generar carnet
-                ruta_carnet = generar_carnet(empleado, ruta_qr)
-                
-                # Combinar anverso y reverso
-                nombre_archivo = os.path.basename(ruta_carnet)
-                reverso_path = f"reverso_{empleado['cedula']}.png"
-                archivo_combinado = combinar_anverso_reverso(nombre_archivo, reverso_path, empleado['nombre'])
-                
-                carnets_generados += 1
-                print(f"Carnet generado para: {empleado['nombre']}")
-                
-            except Exception as e:
-                errores += 1
-                print(f"Error generando carnet para {empleado['nombre']}: {e}")
-        
-        flash(f'Proceso completado para ficha {codigo_ficha}: {carnets_generados} carnets generados exitosamente, {errores} errores', 'success')
-        
+        # Los carnets se generan en el pool de procesos (lotes_carnets.py); la
+        # petición responde de inmediato y el avance se consulta en api_carnet_job
+        lote_id = crear_lote(codigo_ficha, aprendices_con_foto)
+        if request.args.get('async') == '1' or request.accept_mimetypes.best == 'application/json':
+            return jsonify({
+                'success': True,
+                'job_id': lote_id,
+                'total': len(aprendices_con_foto),
+                'url': url_for('api_carnet_job', job_id=lote_id),
+            }), 202
+        
+        flash(f'Generando {len(aprendices_con_foto)} carnets de la ficha {codigo_ficha} en segundo plano '
+              f'(lote {lote_id}). El avance se consulta en {url_for("api_carnet_job", job_id=lote_id)}', 'info')
         return redirect(url_for('ver_ficha', codigo_ficha=codigo_ficha))
         
     except Exception as e:
@@ -2916,6 +2289,18 @@ def generar_carnets_ficha(codigo_ficha):
         flash('Error al generar carnets masivamente.', 'error')
         return redirect(url_for('ver_ficha', codigo_ficha=codigo_ficha))
 
+@app.route('/api/carnet_jobs/<job_id>')
+def api_carnet_job(job_id):
+    """Avance de un lote de carnets: generados, errores y el detalle de cada carnet fallido"""
+    if 'usuario' not in session or session.get('rol') != 'admin':
+        return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
+    
+    lote = obtener_lote(job_id)
+    if not lote:
+        return jsonify({'success': False, 'message': 'Lote de carnets no encontrado'}), 404
+    
+    return jsonify(lote)
+
 @app.route('/api/estadisticas_fichas')
 def api_estadisticas_fichas():
     """API para obtener estadísticas de fichas en JSON"""
@@ -2923,29 +2308,34 @@ def api_estadisticas_fichas():
         return jsonify({'error': 'No autorizado'}), 401
     
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         
         cursor.execute("""
-            SELECT codigo_ficha, COUNT(*) as total,
-                   SUM(CASE WHEN foto IS NOT NULL AND foto != '' THEN 1 ELSE 0 END) as con_foto
-            FROM empleados 
-            WHERE codigo_ficha IS NOT NULL AND codigo_ficha != ''
-            GROUP BY codigo_ficha
-            ORDER BY codigo_ficha
+            SELECT f.codigo, g.total, g.con_foto, p.nombre
+            FROM (
+                SELECT ficha_id, COUNT(*) as total,
+                       SUM(CASE WHEN foto IS NOT NULL AND foto != '' THEN 1 ELSE 0 END) as con_foto
+                FROM empleados
+                WHERE ficha_id IS NOT NULL
+                GROUP BY ficha_id
+            ) g
+            JOIN fichas f ON f.id = g.ficha_id
+            LEFT JOIN programas p ON p.id = f.programa_id
+            ORDER BY f.codigo
         """)
         
         estadisticas = []
         for row in cursor.fetchall():
             estadisticas.append({
                 'ficha': row[0],
+                'programa': row[3] or '',
                 'total': row[1],
                 'con_foto': row[2],
                 'sin_foto': row[1] - row[2],
                 'porcentaje': round((row[2] / row[1]) * 100, 1) if row[1] > 0 else 0
             })
         
-        conn.close()
         return jsonify({'success': True, 'data': estadisticas})
         
     except Exception as e:
@@ -2956,9 +2346,9 @@ def api_estadisticas_fichas():
 def buscar_ficha(ficha):
     """Busca todos los aprendices de una ficha específica"""
     try:
-        conn = sqlite3.connect('carnet.db')
-        conn.row_factory = sqlite3.Row
+        conn = obtener_conexion()
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
         
         cursor.execute("""
             SELECT cedula, nombre, nombre_programa as programa
@@ -2975,7 +2365,6 @@ def buscar_ficha(ficha):
                 'programa': row['programa'] or 'Programa Técnico'
             })
         
-        conn.close()
         
         return jsonify({
             'success': True,
@@ -2998,7 +2387,7 @@ def api_editar_aprendiz():
     cedula = d.get('cedula','').strip()
     if not cedula:
         return jsonify({'success': False, 'message': 'Cédula requerida'})
-    conn = sqlite3.connect('carnet.db')
+    conn = obtener_conexion()
     cursor = conn.cursor()
     cursor.execute("""
         UPDATE empleados SET
@@ -3013,7 +2402,7 @@ def api_editar_aprendiz():
         d.get('nivel_formacion','Técnico'), d.get('fecha_vencimiento',''),
         cedula
     ))
-    conn.commit(); conn.close()
+    conn.commit()
     return jsonify({'success': True})
 
 
@@ -3027,7 +2416,7 @@ def eliminar_ficha():
         if not ficha:
             return jsonify({'success': False, 'message': 'Número de ficha requerido'}), 400
 
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
 
         # Obtener cédulas y fotos ANTES de eliminar
@@ -3039,7 +2428,6 @@ def eliminar_ficha():
         aprendices = cursor.fetchall()
 
         if not aprendices:
-            conn.close()
             return jsonify({'success': False, 'message': 'No se encontraron aprendices en esa ficha'})
 
         cedulas = [row[0] for row in aprendices]
@@ -3048,7 +2436,6 @@ def eliminar_ficha():
         cursor.execute("DELETE FROM empleados WHERE codigo_ficha = ?", (ficha,))
         eliminados = cursor.rowcount
         conn.commit()
-        conn.close()
 
         # ── Limpiar archivos de fotos y carnets ──
         archivos_eliminados = 0
@@ -3123,55 +2510,13 @@ def api_carnets_generados():
         return jsonify({'success': False, 'message': 'Acceso denegado'}), 403
 
     try:
-        carpeta = os.path.join('static', 'carnets')
-        cedulas_con_carnet = set()
-
-        if os.path.exists(carpeta):
-            for archivo in os.listdir(carpeta):
-                if not archivo.endswith('.png'):
-                    continue
-
-                # Patrón 1: carnet_1006224416.png  → cédula = 1006224416
-                if archivo.startswith('carnet_') and '_completo' not in archivo:
-                    cedula = archivo.replace('carnet_', '').replace('.png', '')
-                    if cedula.isdigit():
-                        cedulas_con_carnet.add(cedula)
-                        continue
-
-                # Patrón 2: NOMBRE_APELLIDO_completo.png
-                # Buscar cédula en BD comparando con todos los empleados
-                # (se resuelve con el patrón 1 para la mayoría)
-
-                # Patrón 3: carnet_combinado_1006224416.png
-                if archivo.startswith('carnet_combinado_'):
-                    cedula = archivo.replace('carnet_combinado_', '').replace('.png', '')
-                    if cedula.isdigit():
-                        cedulas_con_carnet.add(cedula)
-
-        # También verificar por archivos _completo.png → buscar cédula en BD
-        if os.path.exists(carpeta):
-            archivos_completo = [f for f in os.listdir(carpeta) if f.endswith('_completo.png')]
-            if archivos_completo:
-                try:
-                    conn = sqlite3.connect('carnet.db')
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT cedula, nombre FROM empleados")
-                    empleados_bd = cursor.fetchall()
-                    conn.close()
-
-                    for cedula_bd, nombre_bd in empleados_bd:
-                        nombre_archivo = nombre_bd.replace(' ', '_') + '_completo.png'
-                        if nombre_archivo in archivos_completo:
-                            cedulas_con_carnet.add(cedula_bd)
-                except Exception as e:
-                    print(f"Error buscando _completo.png: {e}")
-
-        print(f"[API] Carnets generados en disco: {len(cedulas_con_carnet)}")
+        cedulas = cedulas_con_carnet(obtener_conexion())
+        print(f"[API] Carnets generados en disco: {len(cedulas)}")
 
         return jsonify({
             'success': True,
-            'total': len(cedulas_con_carnet),
-            'cedulas': list(cedulas_con_carnet)
+            'total': len(cedulas),
+            'cedulas': list(cedulas)
         })
 
     except Exception as e:
@@ -3188,21 +2533,19 @@ def eliminar_empleado_por_cedula(cedula):
     try:
         cedula_limpia = ''.join(filter(str.isdigit, cedula))
 
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
 
         cursor.execute("SELECT nombre, foto FROM empleados WHERE cedula = ?", (cedula_limpia,))
         resultado = cursor.fetchone()
 
         if not resultado:
-            conn.close()
             return jsonify({'success': False, 'message': 'Aprendiz no encontrado'}), 404
 
         nombre, foto = resultado
 
         cursor.execute("DELETE FROM empleados WHERE cedula = ?", (cedula_limpia,))
         conn.commit()
-        conn.close()
 
         # Limpiar todos los archivos asociados
         archivos_a_eliminar = []
@@ -3312,20 +2655,6 @@ def mostrar_estadisticas_inicio():
 # INICIALIZACIÓN DE LA APLICACIÓN
 # =============================================
 
-# Ejecutar funciones de inicialización
-print("🚀 Iniciando Sistema de Carnetización SENA...")
-
-# Verificar directorios (incluye los de backup)
-verificar_directorios()
-
-# Crear carpetas específicas de backup
-crear_carpetas_backup()
-
-# Actualizar base de datos
-print("🔧 Verificando base de datos...")
-actualizar_base_datos_sena()
-print("✅ Base de datos verificada y actualizada")
-
 # Limpiar archivos temporales
 def limpiar_archivos_temporales():
     """Limpia archivos temporales antiguos"""
@@ -3347,10 +2676,34 @@ def limpiar_archivos_temporales():
     except Exception as e:
         print(f"Error limpiando archivos temporales: {e}")
 
-limpiar_archivos_temporales()
+def iniciar_aplicacion():
+    """Ejecutar funciones de inicialización"""
+    print("🚀 Iniciando Sistema de Carnetización SENA...")
+
+    # Verificar directorios (incluye los de backup)
+    verificar_directorios()
+
+    # Crear carpetas específicas de backup
+    crear_carpetas_backup()
+
+    # Crear / migrar base de datos (no hace nada si el esquema ya está al día)
+    aplicar_migraciones()
+
+    # Retomar importaciones que quedaron pendientes o interrumpidas
+    reanudar_trabajos()
+
+    # Fuentes de los carnets (se resuelven una vez por proceso)
+    registrar_fuentes()
+
+    limpiar_archivos_temporales()
+
+    # Mostrar estadísticas
+    mostrar_estadisticas_inicio()
 
-# Mostrar estadísticas
-mostrar_estadisticas_inicio()
+# Con `python app.py` los procesos de render (lotes_carnets.py) importan este
+# archivo como __mp_main__: solo el proceso web arranca la aplicación
+if __name__ != '__mp_main__':
+    iniciar_aplicacion()
 
 if __name__ == "__main__":
     print("🌟 Servidor Flask iniciado con sistema de backup automático")
@@ -0,0 +1,163 @@
+from flask.json.provider import DefaultJSONProvider
+
+# ============================================
+# REGISTRO COMPACTO DE APRENDIZ
+# Una sola definición de las 17 columnas que leen las rutas,
+# con los valores por defecto resueltos al construir la fila.
+# ============================================
+
+COLUMNAS_APRENDIZ = (
+    'nombre', 'cedula', 'tipo_documento', 'cargo', 'codigo',
+    'fecha_emision', 'fecha_vencimiento', 'tipo_sangre', 'foto',
+    'nis', 'primer_apellido', 'segundo_apellido',
+    'nombre_programa', 'codigo_ficha', 'centro', 'nivel_formacion', 'red_tecnologica',
+)
+
+SELECT_APRENDIZ = f"SELECT {', '.join(COLUMNAS_APRENDIZ)} FROM empleados"
+
+# Campos que las rutas agregan después de leer la fila
+CAMPOS_EXTRA = ('foto_existe', 'foto_url', 'carnet_archivo')
+
+_SIN_DEFECTO = object()
+
+
+def _perfil_defectos(**defectos):
+    """Convierte un dict de valores por defecto en una tupla alineada con las columnas"""
+    return tuple(defectos.get(col, _SIN_DEFECTO) for col in COLUMNAS_APRENDIZ)
+
+
+# Listados, fichas y archivo de carnets
+DEFECTOS_LISTADO = _perfil_defectos(
+    tipo_documento='CC',
+    cargo='APRENDIZ',
+    tipo_sangre='O+',
+    nis='N/A',
+    primer_apellido='',
+    segundo_apellido='',
+    nombre_programa='Programa General',
+    codigo_ficha='Sin Ficha',
+    centro='Centro de Biotecnología Industrial',
+    nivel_formacion='Técnico',
+    red_tecnologica='Red Tecnológica',
+)
+
+# Búsqueda con filtros del panel (buscar_empleados_con_filtros): como el
+# listado, pero con la red tecnológica de los carnets
+DEFECTOS_BUSQUEDA = _perfil_defectos(
+    tipo_documento='CC',
+    cargo='APRENDIZ',
+    tipo_sangre='O+',
+    nis='N/A',
+    primer_apellido='',
+    segundo_apellido='',
+    nombre_programa='Programa General',
+    codigo_ficha='Sin Ficha',
+    centro='Centro de Biotecnología Industrial',
+    nivel_formacion='Técnico',
+    red_tecnologica='Tecnologías de Producción Industrial',
+)
+
+# Búsqueda individual para generar el carnet
+DEFECTOS_CARNET = _perfil_defectos(
+    nombre='',
+    cedula='',
+    tipo_documento='CC',
+    cargo='APRENDIZ',
+    codigo='',
+    fecha_emision='',
+    fecha_vencimiento='',
+    tipo_sangre='O+',
+    foto=None,
+    nis='N/A',
+    primer_apellido='',
+    segundo_apellido='',
+    nombre_programa='Programa Técnico',
+    codigo_ficha='N/A',
+    centro='Centro de Biotecnología Industrial',
+    nivel_formacion='Técnico',
+    red_tecnologica='Tecnologías de Producción Industrial',
+)
+
+
+class Aprendiz:
+    """
+    Fila de la tabla empleados con acceso por atributo y por clave
+    (aprendiz.nombre o aprendiz['nombre']), para que plantillas,
+    imagen.renderizar_carnet y el código existente sigan funcionando.
+    """
+    __slots__ = COLUMNAS_APRENDIZ + CAMPOS_EXTRA
+
+    def __init__(self, fila, defectos=DEFECTOS_LISTADO):
+        for campo, valor, defecto in zip(COLUMNAS_APRENDIZ, fila, defectos):
+            if defecto is not _SIN_DEFECTO and not valor:
+                valor = defecto
+            setattr(self, campo, valor)
+        self.foto_existe = None
+        self.foto_url = None
+        self.carnet_archivo = None
+
+    def __getitem__(self, campo):
+        try:
+            return getattr(self, campo)
+        except (AttributeError, TypeError):
+            raise KeyError(campo)
+
+    def __setitem__(self, campo, valor):
+        try:
+            setattr(self, campo, valor)
+        except AttributeError:
+            raise KeyError(campo)
+
+    def __contains__(self, campo):
+        return campo in self.__slots__
+
+    def get(self, campo, defecto=None):
+        valor = getattr(self, campo, defecto)
+        return defecto if valor is None and campo in CAMPOS_EXTRA else valor
+
+    def keys(self):
+        return [campo for campo in self.__slots__
+                if campo in COLUMNAS_APRENDIZ or getattr(self, campo) is not None]
+
+    def a_dict(self):
+        """Dict serializable (JSON / sesión); los campos extra solo si se asignaron"""
+        datos = {campo: getattr(self, campo) for campo in COLUMNAS_APRENDIZ}
+        for campo in CAMPOS_EXTRA:
+            valor = getattr(self, campo)
+            if valor is not None:
+                datos[campo] = valor
+        return datos
+
+    def __repr__(self):
+        return f'<Aprendiz {self.nombre} {self.cedula}>'
+
+
+def aplicar_defectos(fila, defectos=DEFECTOS_LISTADO):
+    """Tupla con los mismos valores que tendría Aprendiz(fila), sin crear el objeto"""
+    return tuple(valor if defecto is _SIN_DEFECTO or valor else defecto
+                 for valor, defecto in zip(fila, defectos))
+
+
+def fabrica_aprendiz(cursor, fila):
+    """row_factory de sqlite3 para listados"""
+    return Aprendiz(fila, DEFECTOS_LISTADO)
+
+
+def fabrica_aprendiz_busqueda(cursor, fila):
+    """row_factory de sqlite3 para buscar_empleados_con_filtros"""
+    return Aprendiz(fila, DEFECTOS_BUSQUEDA)
+
+
+def fabrica_aprendiz_carnet(cursor, fila):
+    """row_factory de sqlite3 para la búsqueda individual (generación de carnet)"""
+    return Aprendiz(fila, DEFECTOS_CARNET)
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Permite pasar objetos Aprendiz directamente a jsonify"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Aprendiz):
+            return o.a_dict()
+        return DefaultJSONProvider.default(o)
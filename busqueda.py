@@ -0,0 +1,163 @@
+import re
+import sqlite3
+
+# ============================================
+# BÚSQUEDA DE TEXTO COMPLETO (FTS5)
+# Índice empleados_fts sobre las columnas que se escriben en el buscador,
+# sincronizado con empleados mediante triggers. Si el SQLite instalado
+# no trae FTS5 se vuelve al LIKE de siempre.
+# ============================================
+
+COLUMNAS_BUSQUEDA = ('nombre', 'cedula', 'codigo', 'nis', 'nombre_programa', 'codigo_ficha')
+
+# Columnas usadas por el LIKE de respaldo cuando no hay FTS5
+COLUMNAS_RESPALDO = ('nombre', 'cedula', 'codigo', 'nis')
+
+_fts_disponible = None
+
+
+def _columnas(prefijo=''):
+    return ', '.join(f'{prefijo}{col}' for col in COLUMNAS_BUSQUEDA)
+
+
+def crear_indice_busqueda(conn):
+    """
+    Crea la tabla virtual empleados_fts y sus triggers si no existen.
+    La primera vez reconstruye el índice con los registros actuales.
+    Devuelve True si FTS5 quedó disponible. Se ejecuta como migración
+    (migraciones.py), que hace el commit.
+    """
+    global _fts_disponible
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='empleados_fts'")
+    existia = cursor.fetchone() is not None
+
+    try:
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS empleados_fts USING fts5(
+                {_columnas()},
+                content='empleados',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ FTS5 no disponible, la búsqueda usará LIKE: {e}")
+        _fts_disponible = False
+        return False
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS empleados_fts_insert AFTER INSERT ON empleados BEGIN
+            INSERT INTO empleados_fts(rowid, {_columnas()})
+            VALUES (new.id, {_columnas('new.')});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS empleados_fts_delete AFTER DELETE ON empleados BEGIN
+            INSERT INTO empleados_fts(empleados_fts, rowid, {_columnas()})
+            VALUES ('delete', old.id, {_columnas('old.')});
+        END
+    """)
+    # Solo se reindexa cuando cambia una columna buscable (no al subir fotos)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS empleados_fts_update
+        AFTER UPDATE OF {_columnas()} ON empleados BEGIN
+            INSERT INTO empleados_fts(empleados_fts, rowid, {_columnas()})
+            VALUES ('delete', old.id, {_columnas('old.')});
+            INSERT INTO empleados_fts(rowid, {_columnas()})
+            VALUES (new.id, {_columnas('new.')});
+        END
+    """)
+
+    if not existia:
+        cursor.execute("INSERT INTO empleados_fts(empleados_fts) VALUES ('rebuild')")
+        print("✅ Índice de búsqueda empleados_fts creado")
+    _fts_disponible = True
+    return True
+
+
+def fts_disponible(conn):
+    """Indica si existe el índice empleados_fts (se consulta una sola vez por proceso)"""
+    global _fts_disponible
+    if _fts_disponible is None:
+        fila = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='empleados_fts'"
+        ).fetchone()
+        _fts_disponible = fila is not None
+    return _fts_disponible
+
+
+def consulta_fts(texto, columnas=None):
+    """
+    Convierte lo escrito por el usuario en una consulta MATCH de FTS5:
+    cada palabra se busca como prefijo y todas deben aparecer.
+    Con columnas se limita la búsqueda a esas columnas del índice.
+    Devuelve None si el texto no tiene palabras buscables.
+    """
+    terminos = re.findall(r'\w+', texto)
+    if not terminos:
+        return None
+    consulta = ' '.join(f'"{termino}"*' for termino in terminos)
+    if columnas:
+        consulta = '{' + ' '.join(columnas) + '} : (' + consulta + ')'
+    return consulta
+
+
+def filtro_busqueda(conn, texto, columnas=None):
+    """
+    Arma el filtro de búsqueda por texto sobre empleados.
+    Sin columnas busca en todo el índice (y en COLUMNAS_RESPALDO con LIKE).
+
+    Devuelve (union, condicion, params, orden):
+    - union: JOIN con empleados_fts que va antes del WHERE
+    - condicion: fragmento " AND ..." para el WHERE
+    - params: parámetros en el orden union + condicion
+    - orden: expresión ORDER BY por relevancia (bm25), o None con LIKE
+    """
+    consulta = consulta_fts(texto, columnas) if fts_disponible(conn) else None
+    if consulta:
+        union = (" JOIN (SELECT rowid, rank FROM empleados_fts WHERE empleados_fts MATCH ?)"
+                 " AS fts ON fts.rowid = empleados.id")
+        return union, "", [consulta], "fts.rank"
+
+    columnas_respaldo = columnas or COLUMNAS_RESPALDO
+    patron = f"%{texto}%"
+    condicion = " AND (" + " OR ".join(f"{col} LIKE ?" for col in columnas_respaldo) + ")"
+    return "", condicion, [patron] * len(columnas_respaldo), None
+
+
+# ============================================
+# FILTROS DEL LISTADO DE APRENDICES
+# Compartidos por la búsqueda de la pantalla de administración y las
+# exportaciones, para que ambas devuelvan exactamente los mismos aprendices.
+# ============================================
+
+def filtros_listado(conn, buscar='', filtro_foto='', filtro_programa='', filtro_nivel='', filtro_ficha=''):
+    """
+    Arma búsqueda de texto + filtros de foto, programa, nivel y ficha.
+    Devuelve (union, condicion, params, orden) igual que filtro_busqueda;
+    orden es la relevancia bm25 cuando se buscó con FTS5, si no None.
+    """
+    union, condicion, params, orden = "", "", [], None
+    if buscar:
+        union, condicion, params, orden = filtro_busqueda(conn, buscar)
+
+    if filtro_foto == 'con_foto':
+        condicion += " AND foto IS NOT NULL AND foto != ''"
+    elif filtro_foto == 'sin_foto':
+        condicion += " AND (foto IS NULL OR foto = '')"
+
+    if filtro_programa:
+        condicion += " AND nombre_programa LIKE ?"
+        params.append(f"%{filtro_programa}%")
+
+    if filtro_nivel:
+        condicion += " AND nivel_formacion = ?"
+        params.append(filtro_nivel)
+
+    if filtro_ficha:
+        condicion += " AND codigo_ficha = ?"
+        params.append(filtro_ficha)
+
+    return union, condicion, params, orden
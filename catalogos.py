@@ -0,0 +1,94 @@
+# ============================================
+# CATÁLOGOS DE PROGRAMAS Y FICHAS
+# Cada programa y cada ficha se guarda una vez con clave entera;
+# empleados.programa_id / empleados.ficha_id apuntan a ellos y los
+# triggers los mantienen al día cuando cambian las columnas de texto.
+# ============================================
+
+# Asigna programa_id y ficha_id de la fila new a partir de sus columnas de texto
+_REGISTRAR_FILA = """
+    INSERT OR IGNORE INTO programas (nombre, nivel_formacion, red_tecnologica)
+        SELECT new.nombre_programa, new.nivel_formacion, new.red_tecnologica
+        WHERE COALESCE(new.nombre_programa, '') != '';
+    INSERT OR IGNORE INTO fichas (codigo, programa_id, centro)
+        SELECT new.codigo_ficha,
+               (SELECT id FROM programas WHERE nombre = new.nombre_programa),
+               new.centro
+        WHERE COALESCE(new.codigo_ficha, '') != '';
+    UPDATE empleados SET
+        programa_id = (SELECT id FROM programas WHERE nombre = new.nombre_programa),
+        ficha_id = (SELECT id FROM fichas WHERE codigo = new.codigo_ficha)
+    WHERE id = new.id;
+"""
+
+
+def crear_catalogos(conn):
+    """
+    Crea las tablas programas y fichas, las columnas programa_id / ficha_id
+    en empleados, los triggers de sincronización y llena todo con los
+    datos existentes. Se ejecuta como migración (migraciones.py).
+    """
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS programas (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE,
+            nivel_formacion TEXT,
+            red_tecnologica TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fichas (
+            id INTEGER PRIMARY KEY,
+            codigo TEXT NOT NULL UNIQUE,
+            programa_id INTEGER REFERENCES programas(id),
+            centro TEXT
+        )
+    """)
+
+    cursor.execute("PRAGMA table_info(empleados)")
+    existentes = {fila[1] for fila in cursor.fetchall()}
+    if 'programa_id' not in existentes:
+        cursor.execute("ALTER TABLE empleados ADD COLUMN programa_id INTEGER REFERENCES programas(id)")
+    if 'ficha_id' not in existentes:
+        cursor.execute("ALTER TABLE empleados ADD COLUMN ficha_id INTEGER REFERENCES fichas(id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ficha_programa ON empleados(ficha_id, programa_id)")
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS catalogos_insert AFTER INSERT ON empleados BEGIN
+            {_REGISTRAR_FILA}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS catalogos_update
+        AFTER UPDATE OF nombre_programa, codigo_ficha ON empleados
+        WHEN old.nombre_programa IS NOT new.nombre_programa
+          OR old.codigo_ficha IS NOT new.codigo_ficha BEGIN
+            {_REGISTRAR_FILA}
+        END
+    """)
+
+    # Backfill: el primer registro de cada programa / ficha define sus datos
+    cursor.execute("""
+        INSERT OR IGNORE INTO programas (nombre, nivel_formacion, red_tecnologica)
+        SELECT nombre_programa, nivel_formacion, red_tecnologica
+        FROM empleados
+        WHERE COALESCE(nombre_programa, '') != ''
+        ORDER BY id
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO fichas (codigo, programa_id, centro)
+        SELECT e.codigo_ficha, p.id, e.centro
+        FROM empleados e
+        LEFT JOIN programas p ON p.nombre = e.nombre_programa
+        WHERE COALESCE(e.codigo_ficha, '') != ''
+        ORDER BY e.id
+    """)
+    cursor.execute("""
+        UPDATE empleados SET
+            programa_id = (SELECT id FROM programas WHERE nombre = empleados.nombre_programa),
+            ficha_id = (SELECT id FROM fichas WHERE codigo = empleados.codigo_ficha)
+    """)
+    print(f"✅ Catálogos creados: {cursor.execute('SELECT COUNT(*) FROM programas').fetchone()[0]} programas, "
+          f"{cursor.execute('SELECT COUNT(*) FROM fichas').fetchone()[0]} fichas")
@@ -0,0 +1,96 @@
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+DB_PATH = "carnet.db"
+
+# ============================================
+# AJUSTES DE SQLITE
+# WAL permite lectores concurrentes mientras un worker escribe,
+# y busy_timeout evita los "database is locked" inmediatos.
+# ============================================
+TIMEOUT_SEGUNDOS = 10
+TAMANO_POOL = 8
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",       # ~20 MB de caché de páginas
+    "PRAGMA mmap_size = 268435456",     # 256 MB mapeados en memoria
+    "PRAGMA busy_timeout = 10000",
+    "PRAGMA foreign_keys = ON",
+)
+
+_pool = queue.LifoQueue(maxsize=TAMANO_POOL)
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+_hilo = threading.local()
+
+
+def abrir_conexion(ruta=None):
+    """Abre una conexión nueva con los PRAGMAs de rendimiento aplicados"""
+    conexion = sqlite3.connect(ruta or DB_PATH, timeout=TIMEOUT_SEGUNDOS, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conexion.execute(pragma)
+    return conexion
+
+
+def _verificar_proceso():
+    """Descarta el pool heredado si gunicorn hizo fork después de crearlo"""
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = queue.LifoQueue(maxsize=TAMANO_POOL)
+                _pool_pid = os.getpid()
+                _hilo.__dict__.clear()
+
+
+def _tomar_del_pool():
+    _verificar_proceso()
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return abrir_conexion()
+
+
+def _devolver_al_pool(conexion):
+    try:
+        if conexion.in_transaction:
+            conexion.rollback()
+        _pool.put_nowait(conexion)
+    except (queue.Full, sqlite3.Error):
+        conexion.close()
+
+
+def obtener_conexion():
+    """
+    Devuelve la conexión de la petición actual (guardada en flask.g).
+    Fuera de una petición (arranque, hilos de fondo) usa una conexión por hilo.
+    No se debe cerrar: se libera sola al terminar la petición.
+    """
+    if has_app_context():
+        if '_conexion_db' not in g:
+            g._conexion_db = _tomar_del_pool()
+        return g._conexion_db
+
+    _verificar_proceso()
+    conexion = getattr(_hilo, 'conexion', None)
+    if conexion is None:
+        conexion = _hilo.conexion = abrir_conexion()
+    return conexion
+
+
+def liberar_conexion(exception=None):
+    """Devuelve al pool la conexión usada en la petición (teardown de Flask)"""
+    conexion = g.pop('_conexion_db', None)
+    if conexion is not None:
+        _devolver_al_pool(conexion)
+
+
+def init_app(app):
+    """Registra la liberación automática de conexiones al final de cada petición"""
+    app.teardown_appcontext(liberar_conexion)
@@ -0,0 +1,173 @@
+# ============================================
+# CONTADORES PARA EL DASHBOARD
+# Tabla contadores(dimension, clave, total) mantenida por triggers sobre
+# empleados, para que cada métrica del dashboard sea una lectura puntual
+# en lugar de un COUNT(*) / GROUP BY sobre toda la tabla.
+# ============================================
+
+# dimension -> expresión SQL (sobre la fila new./old.) que da la clave
+DIMENSIONES = {
+    'nivel': "COALESCE({f}.nivel_formacion, '')",
+    'programa': "COALESCE({f}.nombre_programa, '')",
+    'ficha': "COALESCE({f}.codigo_ficha, '')",
+    'fecha_emision': "COALESCE({f}.fecha_emision, '')",
+    'fecha_creacion': "COALESCE(DATE({f}.created_at), '')",
+}
+
+# Columnas de empleados de las que depende cada dimensión
+COLUMNAS_DIMENSION = {
+    'nivel': 'nivel_formacion',
+    'programa': 'nombre_programa',
+    'ficha': 'codigo_ficha',
+    'fecha_emision': 'fecha_emision',
+    'fecha_creacion': 'created_at',
+}
+
+CONDICION_FOTO = "({f}.foto IS NOT NULL AND {f}.foto != '')"
+
+_UPSERT = "INSERT INTO contadores (dimension, clave, total) VALUES {valores} " \
+          "ON CONFLICT(dimension, clave) DO UPDATE SET total = total + excluded.total"
+
+
+def _dimensiones_activas(conn):
+    """Dimensiones cuyas columnas existen (created_at falta en bases antiguas)"""
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(empleados)")}
+    return [dim for dim, col in COLUMNAS_DIMENSION.items() if col in columnas]
+
+
+def _valores(fila, signo, dimensiones):
+    """Filas VALUES que suman (o restan) la fila new./old. en cada dimensión"""
+    valores = [
+        f"('total', '', {signo}1)",
+        f"('con_foto', '', {signo}{CONDICION_FOTO.format(f=fila)})",
+    ]
+    for dim in dimensiones:
+        valores.append(f"('{dim}', {DIMENSIONES[dim].format(f=fila)}, {signo}1)")
+    return valores
+
+
+def crear_contadores(conn):
+    """
+    Crea la tabla contadores y sus triggers si no existen.
+    La primera vez la llena a partir de los registros actuales.
+    Se ejecuta como migración (migraciones.py), que hace el commit.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='contadores'")
+    existia = cursor.fetchone() is not None
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contadores (
+            dimension TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, clave)
+        ) WITHOUT ROWID
+    """)
+
+    dimensiones = _dimensiones_activas(conn)
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS contadores_insert AFTER INSERT ON empleados BEGIN
+            {_UPSERT.format(valores=', '.join(_valores('new', '+', dimensiones)))};
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS contadores_delete AFTER DELETE ON empleados BEGIN
+            {_UPSERT.format(valores=', '.join(_valores('old', '-', dimensiones)))};
+        END
+    """)
+
+    # En una actualización se resta la fila vieja y se suma la nueva,
+    # solo si cambió alguna columna contada (el total no cambia)
+    columnas = ['foto'] + [COLUMNAS_DIMENSION[dim] for dim in dimensiones]
+    cambio = ' OR '.join(f"old.{col} IS NOT new.{col}" for col in columnas)
+    valores = _valores('old', '-', dimensiones)[1:] + _valores('new', '+', dimensiones)[1:]
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS contadores_update
+        AFTER UPDATE OF {', '.join(columnas)} ON empleados
+        WHEN {cambio} BEGIN
+            {_UPSERT.format(valores=', '.join(valores))};
+        END
+    """)
+
+    if not existia:
+        recalcular_contadores(conn, dimensiones)
+        print("✅ Tabla de contadores creada")
+
+
+def recalcular_contadores(conn, dimensiones=None):
+    """Rellena contadores desde cero con agregados sobre empleados"""
+    if dimensiones is None:
+        dimensiones = _dimensiones_activas(conn)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM contadores")
+    cursor.execute(f"""
+        INSERT INTO contadores (dimension, clave, total)
+        SELECT 'total', '', COUNT(*) FROM empleados
+        UNION ALL
+        SELECT 'con_foto', '', COALESCE(SUM({CONDICION_FOTO.format(f='empleados')}), 0) FROM empleados
+    """)
+    for dim in dimensiones:
+        clave = DIMENSIONES[dim].format(f='empleados')
+        cursor.execute(f"""
+            INSERT INTO contadores (dimension, clave, total)
+            SELECT '{dim}', {clave}, COUNT(*) FROM empleados GROUP BY 1, 2
+        """)
+
+
+def leer_contador(conn, dimension, clave=''):
+    """Valor de un contador puntual (0 si no existe)"""
+    fila = conn.execute(
+        "SELECT total FROM contadores WHERE dimension = ? AND clave = ?", (dimension, clave)
+    ).fetchone()
+    return fila[0] if fila else 0
+
+
+def sumar_desde(conn, dimension, desde):
+    """Suma los contadores de una dimensión con clave >= desde (rangos de fecha)"""
+    return conn.execute(
+        "SELECT COALESCE(SUM(total), 0) FROM contadores WHERE dimension = ? AND clave >= ?",
+        (dimension, desde)
+    ).fetchone()[0]
+
+
+def distribucion(conn, dimension, limite=None):
+    """Lista (clave, total) de una dimensión, de mayor a menor"""
+    query = "SELECT clave, total FROM contadores WHERE dimension = ? AND total > 0 ORDER BY total DESC"
+    params = [dimension]
+    if limite:
+        query += " LIMIT ?"
+        params.append(limite)
+    return conn.execute(query, params).fetchall()
+
+
+# ============================================
+# VERSIÓN DE LOS DATOS
+# Número que sube con cada INSERT / UPDATE / DELETE sobre empleados.
+# Dos lecturas con la misma versión ven los mismos aprendices, así que
+# sirve de clave para la caché de exportaciones (exportacion.py).
+# ============================================
+
+def crear_version_datos(conn):
+    """Tabla version_datos (una fila) y sus triggers. Se ejecuta como migración (migraciones.py)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS version_datos (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO version_datos (id, version) VALUES (1, 0)")
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS version_datos_{evento.lower()} AFTER {evento} ON empleados BEGIN
+                UPDATE version_datos SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+
+def leer_version_datos(conn):
+    """Versión actual de los datos de empleados"""
+    fila = conn.execute("SELECT version FROM version_datos WHERE id = 1").fetchone()
+    return fila[0] if fila else 0
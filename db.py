@@ -1,69 +1,7 @@
-import sqlite3
 import os
 
-DB_PATH = "carnet.db"
-
-def crear_base_datos():
-    """Crea la base de datos con todas las columnas necesarias"""
-    try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
-        cursor = conexion.cursor()
-        
-        # ✅ TABLA ACTUALIZADA CON TODOS LOS CAMPOS SENA + nivel_formacion
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS empleados (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                cedula TEXT NOT NULL UNIQUE,
-                tipo_documento TEXT NOT NULL,
-                cargo TEXT NOT NULL,
-                codigo TEXT NOT NULL UNIQUE,
-                fecha_emision TEXT NOT NULL,
-                fecha_vencimiento TEXT NOT NULL,
-                tipo_sangre TEXT NOT NULL,
-                foto TEXT,
-                nis TEXT,
-                primer_apellido TEXT,
-                segundo_apellido TEXT,
-                nombre_programa TEXT,
-                codigo_ficha TEXT,
-                centro TEXT,
-                nivel_formacion TEXT DEFAULT 'Técnico'
-            )
-        ''')
-        conexion.commit()
-        print("✅ Base de datos creada correctamente")
-        
-        # ✅ AGREGAR COLUMNAS NUEVAS SI NO EXISTEN (para bases de datos existentes)
-        agregar_columnas_sena(cursor)
-        conexion.commit()
-        
-    except Exception as e:
-        print(f"❌ Error creando base de datos: {e}")
-    finally:
-        conexion.close()
-
-def agregar_columnas_sena(cursor):
-    """Agrega las nuevas columnas SENA si no existen"""
-    nuevas_columnas = [
-        'nis TEXT',
-        'primer_apellido TEXT',
-        'segundo_apellido TEXT',
-        'nombre_programa TEXT',
-        'codigo_ficha TEXT',
-        'centro TEXT',
-        'nivel_formacion TEXT DEFAULT "Técnico"'  # 🆕 NUEVA COLUMNA
-    ]
-    
-    for columna in nuevas_columnas:
-        try:
-            cursor.execute(f'ALTER TABLE empleados ADD COLUMN {columna}')
-            print(f"✅ Columna agregada: {columna}")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e):
-                print(f"⚠️ Columna ya existe: {columna.split()[0]}")
-            else:
-                print(f"❌ Error agregando columna {columna}: {e}")
+from conexion_db import DB_PATH, obtener_conexion
+from migraciones import aplicar_migraciones
 
 def insertar_empleado(datos):
     """Inserta un empleado con todos los campos SENA"""
@@ -74,7 +12,7 @@ def insertar_empleado(datos):
         raise ValueError("El código ya está registrado.")
 
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # ✅ INSERT ACTUALIZADO CON TODOS LOS CAMPOS SENA + nivel_formacion
@@ -109,13 +47,11 @@ def insertar_empleado(datos):
     except Exception as e:
         print(f"❌ Error insertando empleado: {e}")
         raise e
-    finally:
-        conexion.close()
 
 def cargar_empleado(cedula):
     """Carga un empleado por cédula con todos los campos"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         cursor.execute('SELECT * FROM empleados WHERE cedula = ?', (cedula,))
         fila = cursor.fetchone()
@@ -136,13 +72,11 @@ def cargar_empleado(cedula):
     except Exception as e:
         print(f"❌ Error cargando empleado: {e}")
         return None
-    finally:
-        conexion.close()
 
 def obtener_todos_empleados():
     """Obtiene todos los empleados de la base de datos"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         cursor.execute('SELECT * FROM empleados ORDER BY fecha_emision DESC')
         filas = cursor.fetchall()
@@ -167,13 +101,11 @@ def obtener_todos_empleados():
     except Exception as e:
         print(f"❌ Error obteniendo empleados: {e}")
         return []
-    finally:
-        conexion.close()
 
 def existe_codigo(codigo):
     """Verifica si un código ya existe"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         cursor.execute('SELECT 1 FROM empleados WHERE codigo = ?', (codigo,))
         resultado = cursor.fetchone()
@@ -181,13 +113,11 @@ def existe_codigo(codigo):
     except Exception as e:
         print(f"❌ Error verificando código: {e}")
         return False
-    finally:
-        conexion.close()
 
 def existe_cedula(cedula):
     """Verifica si una cédula ya existe"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         cursor.execute('SELECT 1 FROM empleados WHERE cedula = ?', (cedula,))
         resultado = cursor.fetchone()
@@ -195,13 +125,11 @@ def existe_cedula(cedula):
     except Exception as e:
         print(f"❌ Error verificando cédula: {e}")
         return False
-    finally:
-        conexion.close()
 
 def actualizar_empleado(cedula, datos):
     """Actualiza los datos de un empleado existente"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         cursor.execute('''
@@ -234,13 +162,11 @@ def actualizar_empleado(cedula, datos):
     except Exception as e:
         print(f"❌ Error actualizando empleado: {e}")
         return False
-    finally:
-        conexion.close()
 
 def eliminar_empleado(cedula):
     """Elimina un empleado por cédula"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         cursor.execute('DELETE FROM empleados WHERE cedula = ?', (cedula,))
         conexion.commit()
@@ -255,13 +181,11 @@ def eliminar_empleado(cedula):
     except Exception as e:
         print(f"❌ Error eliminando empleado: {e}")
         return False
-    finally:
-        conexion.close()
 
 def obtener_estadisticas():
     """Obtiene estadísticas básicas de la base de datos"""
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # Total empleados
@@ -292,8 +216,6 @@ def obtener_estadisticas():
     except Exception as e:
         print(f"❌ Error obteniendo estadísticas: {e}")
         return {'total': 0, 'por_cargo': {}, 'por_nivel_formacion': {}, 'registrados_hoy': 0}
-    finally:
-        conexion.close()
 
 # ================================================
 # 🆕🆕🆕 NUEVAS FUNCIONES PARA GESTIÓN DE FOTOS 🆕🆕🆕
@@ -305,7 +227,7 @@ def buscar_empleado_completo(cedula):
     Función mejorada para la gestión de fotos
     """
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # Buscar con todos los campos SENA (INCLUYENDO nivel_formacion)
@@ -354,8 +276,6 @@ def buscar_empleado_completo(cedula):
     except Exception as e:
         print(f"❌ Error buscando empleado: {e}")
         return None
-    finally:
-        conexion.close()
 
 def obtener_empleados_con_filtros(buscar='', filtro_foto=''):
     """
@@ -363,7 +283,7 @@ def obtener_empleados_con_filtros(buscar='', filtro_foto=''):
     Para la funcionalidad de gestión de fotos del admin
     """
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # Construir query base
@@ -428,8 +348,6 @@ def obtener_empleados_con_filtros(buscar='', filtro_foto=''):
     except Exception as e:
         print(f"❌ Error obteniendo empleados con filtros: {e}")
         return []
-    finally:
-        conexion.close()
 
 def eliminar_foto_empleado(cedula):
     """
@@ -437,7 +355,7 @@ def eliminar_foto_empleado(cedula):
     El archivo físico se elimina desde app.py
     """
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # Obtener info del empleado antes de eliminar
@@ -460,15 +378,13 @@ def eliminar_foto_empleado(cedula):
     except Exception as e:
         print(f"❌ Error eliminando foto de BD: {e}")
         return False, str(e)
-    finally:
-        conexion.close()
 
 def obtener_estadisticas_fotos():
     """
     Obtiene estadísticas específicas sobre fotos de empleados
     """
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # Total empleados
@@ -511,34 +427,6 @@ def obtener_estadisticas_fotos():
             'fotos_fisicas': 0,
             'fotos_huerfanas': 0
         }
-    finally:
-        conexion.close()
-
-# ✅ FUNCIÓN PARA MIGRAR DATOS EXISTENTES (OPCIONAL)
-def migrar_base_datos():
-    """
-    Función para migrar una base de datos antigua a la nueva estructura
-    Solo ejecutar si tienes datos importantes que no quieres perder
-    """
-    try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
-        cursor = conexion.cursor()
-        
-        # Verificar si existe la tabla antigua
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='empleados'")
-        if cursor.fetchone():
-            print("🔄 Migrando base de datos existente...")
-            agregar_columnas_sena(cursor)
-            conexion.commit()
-            print("✅ Migración completada")
-        else:
-            print("📋 Creando nueva base de datos...")
-            crear_base_datos()
-            
-    except Exception as e:
-        print(f"❌ Error en migración: {e}")
-    finally:
-        conexion.close()
 
 # 🆕 NUEVA FUNCIÓN: Verificar estructura de la base de datos
 def verificar_estructura_db():
@@ -546,7 +434,7 @@ def verificar_estructura_db():
     Verifica que la base de datos tenga todos los campos necesarios
     """
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         cursor.execute("PRAGMA table_info(empleados)")
@@ -574,15 +462,11 @@ def verificar_estructura_db():
         if 'nivel_formacion' in campos_existentes:
             print("\n🎯 ¡Campo 'nivel_formacion' encontrado! La base de datos está lista.")
         else:
-            print("\n⚠️ Falta el campo 'nivel_formacion'. Ejecutando actualización...")
-            agregar_columnas_sena(cursor)
-            conexion.commit()
-            print("✅ Campo 'nivel_formacion' agregado exitosamente")
+            print("\n⚠️ Falta el campo 'nivel_formacion'. Ejecutando migraciones...")
+            aplicar_migraciones()
             
     except Exception as e:
         print(f"❌ Error verificando estructura: {e}")
-    finally:
-        conexion.close()
 
 # 🆕 NUEVA FUNCIÓN: Actualizar empleados existentes para que tengan nivel_formacion
 def actualizar_empleados_sin_nivel():
@@ -590,7 +474,7 @@ def actualizar_empleados_sin_nivel():
     Actualiza empleados existentes que no tienen nivel_formacion definido
     """
     try:
-        conexion = sqlite3.connect(DB_PATH, timeout=10)
+        conexion = obtener_conexion()
         cursor = conexion.cursor()
         
         # Buscar empleados sin nivel_formacion o con valor NULL
@@ -613,132 +497,12 @@ def actualizar_empleados_sin_nivel():
             
     except Exception as e:
         print(f"❌ Error actualizando empleados: {e}")
-    finally:
-        conexion.close()
-
-# ✅ EJECUTAR VERIFICACIÓN Y ACTUALIZACIÓN AL IMPORTAR
-if __name__ == "__main__":
-    print("🚀 INICIALIZANDO BASE DE DATOS...")
-    crear_base_datos()
-    verificar_estructura_db()
-    actualizar_empleados_sin_nivel()
-    print("✅ Base de datos inicializada correctamente con nivel_formacion")
-else:
-    # Cuando se importe desde app.py, verificar silenciosamente
-    try:
-        conexion = sqlite3.connect(DB_PATH, timeout=5)
-        cursor = conexion.cursor()
-        cursor.execute("PRAGMA table_info(empleados)")
-        columnas = [col[1] for col in cursor.fetchall()]
-        
-        if 'nivel_formacion' not in columnas:
-            print("🔄 Agregando campo nivel_formacion...")
-            agregar_columnas_sena(cursor)
-            conexion.commit()
-            print("✅ Campo nivel_formacion agregado")
-        
-        conexion.close()
-    except:
-        pass  # Silenciosamente continuar si hay problemas
-
-def actualizar_base_datos_completa():
-    """
-    Actualiza la base de datos para asegurar que tenga todas las columnas necesarias
-    EJECUTAR SOLO UNA VEZ al iniciar la aplicación
-    """
-    try:
-        conn = sqlite3.connect('carnet.db')
-        cursor = conn.cursor()
-        
-        # Verificar si la tabla existe
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='empleados'")
-        if not cursor.fetchone():
-            print("Creando tabla empleados...")
-            # Crear tabla completa desde el inicio
-            cursor.execute("""
-                CREATE TABLE empleados (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nombre TEXT NOT NULL,
-                    cedula TEXT UNIQUE NOT NULL,
-                    tipo_documento TEXT DEFAULT 'CC',
-                    cargo TEXT DEFAULT 'APRENDIZ',
-                    codigo TEXT UNIQUE,
-                    fecha_emision TEXT,
-                    fecha_vencimiento TEXT,
-                    tipo_sangre TEXT,
-                    foto TEXT,
-                    nis TEXT,
-                    primer_apellido TEXT,
-                    segundo_apellido TEXT,
-                    nombre_programa TEXT,
-                    codigo_ficha TEXT,
-                    centro TEXT,
-                    nivel_formacion TEXT DEFAULT 'Técnico',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            print("✅ Tabla empleados creada exitosamente")
-        else:
-            print("Tabla empleados existe, verificando columnas...")
-            
-            # Obtener columnas existentes
-            cursor.execute("PRAGMA table_info(empleados)")
-            columnas_existentes = [col[1] for col in cursor.fetchall()]
-            print(f"Columnas existentes: {columnas_existentes}")
-            
-            # Columnas que deben existir
-            columnas_necesarias = {
-                'nis': 'TEXT',
-                'primer_apellido': 'TEXT',
-                'segundo_apellido': 'TEXT',
-                'nombre_programa': 'TEXT',
-                'codigo_ficha': 'TEXT',
-                'centro': 'TEXT',
-                'nivel_formacion': 'TEXT DEFAULT "Técnico"',
-                'created_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
-                'updated_at': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
-            }
-            
-            # Agregar columnas faltantes
-            for columna, tipo in columnas_necesarias.items():
-                if columna not in columnas_existentes:
-                    try:
-                        cursor.execute(f'ALTER TABLE empleados ADD COLUMN {columna} {tipo}')
-                        print(f"✅ Columna agregada: {columna}")
-                    except sqlite3.OperationalError as e:
-                        if "duplicate column name" in str(e):
-                            print(f"⚠️ Columna ya existe: {columna}")
-                        else:
-                            print(f"❌ Error agregando columna {columna}: {e}")
-        
-        # Crear índices para mejorar rendimiento
-        indices = [
-            "CREATE INDEX IF NOT EXISTS idx_cedula ON empleados(cedula)",
-            "CREATE INDEX IF NOT EXISTS idx_codigo ON empleados(codigo)",
-            "CREATE INDEX IF NOT EXISTS idx_nombre_programa ON empleados(nombre_programa)",
-            "CREATE INDEX IF NOT EXISTS idx_codigo_ficha ON empleados(codigo_ficha)",
-            "CREATE INDEX IF NOT EXISTS idx_fecha_emision ON empleados(fecha_emision)"
-        ]
-        
-        for indice in indices:
-            cursor.execute(indice)
-            print(f"✅ Índice creado: {indice.split('idx_')[1].split(' ')[0] if 'idx_' in indice else 'índice'}")
-        
-        conn.commit()
-        conn.close()
-        print("🎉 Base de datos actualizada correctamente")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error actualizando base de datos: {e}")
-        return False
 
 # FUNCIÓN PARA VERIFICAR LA INTEGRIDAD DE LOS DATOS
 def verificar_datos_empleados():
     """Verifica que los datos se estén guardando correctamente"""
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         
         # Contar total de empleados
@@ -771,7 +535,6 @@ def verificar_datos_empleados():
         for emp in ultimos:
             print(f"  {emp[0]} - {emp[1]} - {emp[2]} - {emp[3]}")
         
-        conn.close()
         return True
         
     except Exception as e:
@@ -782,7 +545,7 @@ def verificar_datos_empleados():
 def limpiar_datos_empleados():
     """Limpia datos duplicados o incorrectos"""
     try:
-        conn = sqlite3.connect('carnet.db')
+        conn = obtener_conexion()
         cursor = conn.cursor()
         
         # Eliminar registros de ejemplo
@@ -818,7 +581,6 @@ def limpiar_datos_empleados():
             print(f"✅ Actualizados {actualizados_centro} registros sin centro")
         
         conn.commit()
-        conn.close()
         print("🧹 Limpieza de datos completada")
         return True
         
@@ -826,14 +588,18 @@ def limpiar_datos_empleados():
         print(f"Error limpiando datos: {e}")
         return False
 
-# EJECUTAR AL INICIAR LA APLICACIÓN
+# EJECUTAR DESDE LA LÍNEA DE COMANDOS (python db.py)
+# Al importar no se hace nada: el esquema lo maneja migraciones.aplicar_migraciones()
 if __name__ == "__main__":
     print("🚀 Iniciando actualización de base de datos...")
     
     # Actualizar estructura
-    if actualizar_base_datos_completa():
+    if aplicar_migraciones():
         print("✅ Estructura de BD actualizada")
     
+    verificar_estructura_db()
+    actualizar_empleados_sin_nivel()
+    
     # Limpiar datos incorrectos
     if limpiar_datos_empleados():
         print("✅ Datos limpiados")
@@ -842,6 +608,3 @@ if __name__ == "__main__":
     verificar_datos_empleados()
     
     print("🎉 Proceso completado!")
-
-# LLAMAR ESTA FUNCIÓN AL FINAL DE TU app.py, ANTES DEL if __name__ == "__main__":
-actualizar_base_datos_completa()
\ No newline at end of file
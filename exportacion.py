@@ -0,0 +1,373 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter
+
+from aprendiz import COLUMNAS_APRENDIZ, SELECT_APRENDIZ, aplicar_defectos, fabrica_aprendiz_carnet
+from busqueda import filtros_listado
+from contadores import leer_version_datos
+
+# ============================================
+# EXPORTACIÓN DE APRENDICES
+# Las filas se leen del cursor de SQLite una a una y se escriben como
+# XML de la hoja dentro de un zip que se va enviando por bloques: el
+# libro nunca está completo en memoria ni en disco antes de enviarse.
+# Mientras se envía queda también en la caché de exportaciones.
+# ============================================
+
+HOJA_PLANTILLA = 'Empleados SENA'
+
+MIME_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Mismas columnas que reconoce el importador (ALIAS_COLUMNAS)
+ENCABEZADOS_PLANTILLA = (
+    'NIS', 'Primer Apellido', 'Segundo Apellido', 'Nombre', 'Tipo de documento',
+    'Número de documento', 'Tipo de Sangre', 'Nombre del Programa', 'Nivel de Formación',
+    'Código de Ficha', 'Centro', 'Red Tecnologica', 'Fecha Finalización del Programa',
+)
+
+# Plantilla de ejemplo cuando no hay aprendices registrados
+FILAS_EJEMPLO = (
+    ('12345678901', 'PEREZ', 'LOPEZ', 'JUAN CARLOS', 'CC', '12345678', 'O+',
+     'Análisis y Desarrollo de Sistemas de Información', 'Técnico', '2024001',
+     'Centro de Biotecnología Industrial', 'Tecnologías de Producción Industrial', '31/12/2024'),
+    ('12345678902', 'GARCIA', 'RODRIGUEZ', 'MARIA ALEJANDRA', 'CC', '87654321', 'A-',
+     'Biotecnología Industrial', 'Tecnólogo', '2024002',
+     'Centro de Biotecnología Industrial', 'Tecnologías de Producción Industrial', '30/06/2025'),
+    ('12345678903', 'MARTINEZ', 'SILVA', 'CARLOS ANDRES', 'TI', '11223344', 'B+',
+     'Gestión Empresarial', 'Técnico', '2024003',
+     'Centro de Biotecnología Industrial', 'Gestión y Negocios', '15/11/2024'),
+)
+
+
+def dividir_nombre(nombre):
+    """(nombres, primer_apellido, segundo_apellido) a partir del nombre completo"""
+    partes = nombre.split()
+    if len(partes) >= 3:
+        return partes[0], partes[1], ' '.join(partes[2:])
+    if len(partes) == 2:
+        return partes[0], partes[1], ''
+    return nombre, '', ''
+
+
+def fila_plantilla(aprendiz):
+    """Fila de la plantilla en el orden de ENCABEZADOS_PLANTILLA"""
+    nombres, primer_apellido, segundo_apellido = dividir_nombre(aprendiz['nombre'])
+    return (
+        aprendiz['nis'], primer_apellido, segundo_apellido, nombres,
+        aprendiz['tipo_documento'], aprendiz['cedula'], aprendiz['tipo_sangre'],
+        aprendiz['nombre_programa'], aprendiz['nivel_formacion'], aprendiz['codigo_ficha'],
+        aprendiz['centro'], aprendiz['red_tecnologica'], aprendiz['fecha_vencimiento'],
+    )
+
+
+def cursor_plantilla(conn):
+    """Cursor sobre todos los aprendices, en el orden de la plantilla descargable"""
+    cursor = conn.cursor()
+    cursor.row_factory = fabrica_aprendiz_carnet
+    cursor.execute(SELECT_APRENDIZ + " ORDER BY created_at DESC, nombre ASC")
+    return cursor
+
+
+# Partes fijas de un libro XLSX mínimo con una sola hoja
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_NS_HOJA = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_NS_RELACIONES = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PARTES_XLSX = {
+    '[Content_Types].xml': _XML +
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels': _XML +
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS_RELACIONES}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/_rels/workbook.xml.rels': _XML +
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{_NS_RELACIONES}/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>',
+}
+
+# Caracteres de control que XML no admite (openpyxl los rechaza con un error)
+_ILEGALES_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _SalidaZip(io.RawIOBase):
+    """Destino sin seek para zipfile: guarda lo escrito hasta que se retira"""
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def retirar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+def _fila_xml(numero, valores, columnas):
+    """<row> de la hoja: números como valor, el resto como texto en línea"""
+    celdas = []
+    for columna, valor in zip(columnas, valores):
+        if valor is None or valor == '':
+            continue
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            celdas.append(f'<c r="{columna}{numero}"><v>{valor}</v></c>')
+        else:
+            texto = escape(_ILEGALES_XML.sub('', str(valor)))
+            celdas.append(f'<c r="{columna}{numero}" t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>')
+    return f'<row r="{numero}">{"".join(celdas)}</row>'.encode('utf-8')
+
+
+def bloques_xlsx(filas, hoja=HOJA_PLANTILLA, encabezados=ENCABEZADOS_PLANTILLA):
+    """
+    Libro XLSX con encabezados + filas, en bloques de bytes: uno por cada
+    FILAS_POR_BLOQUE filas leídas y el último con el cierre del zip.
+    """
+    columnas = [get_column_letter(indice) for indice in range(1, len(encabezados) + 1)]
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _PARTES_XLSX.items():
+            libro.writestr(nombre, contenido)
+        libro.writestr('xl/workbook.xml', _XML +
+                       f'<workbook xmlns="{_NS_HOJA}" xmlns:r="{_NS_RELACIONES}"><sheets>'
+                       f'<sheet name="{escape(hoja)}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        with libro.open('xl/worksheets/sheet1.xml', 'w') as pestana:
+            pestana.write(f'{_XML}<worksheet xmlns="{_NS_HOJA}"><sheetData>'.encode('utf-8'))
+            pestana.write(_fila_xml(1, encabezados, columnas))
+            for numero, fila in enumerate(filas, start=2):
+                pestana.write(_fila_xml(numero, fila, columnas))
+                if numero % FILAS_POR_BLOQUE == 0:
+                    bloque = salida.retirar()
+                    if bloque:
+                        yield bloque
+            pestana.write(b'</sheetData></worksheet>')
+    yield salida.retirar()
+
+
+def bloques_plantilla(conn, total):
+    """Plantilla XLSX con todos los aprendices, o FILAS_EJEMPLO si `total` es 0"""
+    filas = map(fila_plantilla, cursor_plantilla(conn)) if total else FILAS_EJEMPLO
+    return bloques_xlsx(filas)
+
+
+# ============================================
+# EXPORTACIÓN CSV / JSON LINES
+# Generadores que leen el cursor por bloques de FILAS_POR_BLOQUE y
+# entregan cada bloque ya serializado, para enviarlos en una Response
+# en streaming. Los valores son los mismos que devuelve el listado
+# (/api/lista_aprendices_filtrada), con sus valores por defecto.
+# ============================================
+
+FILAS_POR_BLOQUE = 500
+
+# formato -> tipo MIME de la respuesta (Flask agrega charset=utf-8 a los text/*)
+FORMATOS_EXPORTACION = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def cursor_exportacion(conn, buscar='', filtro_foto='', filtro_programa='', filtro_nivel='', filtro_ficha=''):
+    """Cursor sobre los aprendices que pasan los filtros del listado (filtros_listado)"""
+    union, condicion, params, orden = filtros_listado(
+        conn, buscar, filtro_foto, filtro_programa, filtro_nivel, filtro_ficha)
+    # nombre, cedula recorre idx_nombre_cedula: las primeras filas salen sin ordenar todo
+    orden = f"{orden}, nombre ASC, cedula ASC" if orden else "nombre ASC, cedula ASC"
+    cursor = conn.cursor()
+    cursor.execute(SELECT_APRENDIZ + union + " WHERE 1=1" + condicion + f" ORDER BY {orden}", params)
+    return cursor
+
+
+def _bloques(cursor):
+    """Filas del cursor en listas de FILAS_POR_BLOQUE, con los valores por defecto aplicados"""
+    while True:
+        filas = cursor.fetchmany(FILAS_POR_BLOQUE)
+        if not filas:
+            return
+        yield [aplicar_defectos(fila) for fila in filas]
+
+
+def bloques_csv(cursor):
+    """Encabezado + filas en CSV, un bloque de texto por cada FILAS_POR_BLOQUE filas"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_APRENDIZ)
+    for filas in _bloques(cursor):
+        escritor.writerows(filas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Sin filas: solo el encabezado
+        yield buffer.getvalue()
+
+
+def bloques_jsonl(cursor):
+    """Un objeto JSON por línea, un bloque de texto por cada FILAS_POR_BLOQUE filas"""
+    for filas in _bloques(cursor):
+        yield ''.join(json.dumps(dict(zip(COLUMNAS_APRENDIZ, fila)), ensure_ascii=False) + '\n'
+                      for fila in filas)
+
+
+GENERADORES_EXPORTACION = {
+    'csv': bloques_csv,
+    'jsonl': bloques_jsonl,
+}
+
+
+# ============================================
+# CACHÉ DE EXPORTACIONES
+# Cada archivo generado se guarda en CARPETA_CACHE_EXPORTACIONES con la
+# clave (versión de los datos, formato, filtros). Mientras nadie escriba
+# en empleados la versión no cambia, así que una descarga repetida solo
+# envía el archivo ya generado; la clave sirve también de ETag. Al
+# guardar un archivo de una versión nueva se borran los de versiones
+# anteriores. Solo se guardan exportaciones sin búsqueda de texto y con
+# filtros que son valores de los catálogos, y a lo sumo
+# MAXIMO_ARCHIVOS_POR_VERSION por versión: cualquier otro texto sería un
+# archivo nuevo.
+# ============================================
+
+CARPETA_CACHE_EXPORTACIONES = os.path.join('uploads', 'exportaciones')
+
+MAXIMO_ARCHIVOS_POR_VERSION = 50
+
+VALORES_FILTRO_FOTO = ('con_foto', 'sin_foto')
+
+# filtro -> consulta que confirma que el valor existe en los catálogos
+CONSULTAS_CATALOGO = {
+    'filtro_programa': "SELECT 1 FROM programas WHERE nombre = ?",
+    'filtro_nivel': "SELECT 1 FROM programas WHERE nivel_formacion = ? LIMIT 1",
+    'filtro_ficha': "SELECT 1 FROM fichas WHERE codigo = ?",
+}
+
+
+def iniciar_lectura(conn):
+    """
+    Abre una transacción de lectura y devuelve la versión de los datos:
+    las filas que se lean después corresponden a esa misma versión. La
+    transacción se descarta al devolver la conexión al pool.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    return leer_version_datos(conn)
+
+
+def clave_exportacion(version, formato, filtros=None):
+    """Clave del archivo en caché (y ETag de la respuesta)"""
+    resumen = hashlib.blake2b(json.dumps(filtros or {}, sort_keys=True).encode('utf-8'),
+                              digest_size=8).hexdigest()
+    return f"{version}-{formato}-{resumen}"
+
+
+def se_guarda_en_cache(conn, filtros):
+    """
+    True si la exportación no busca texto y cada filtro usado es un valor
+    conocido: con_foto / sin_foto o un programa, nivel o ficha de los catálogos
+    """
+    for campo, valor in (filtros or {}).items():
+        if not valor:
+            continue
+        if campo == 'filtro_foto':
+            if valor not in VALORES_FILTRO_FOTO:
+                return False
+        elif campo in CONSULTAS_CATALOGO:
+            if conn.execute(CONSULTAS_CATALOGO[campo], (valor,)).fetchone() is None:
+                return False
+        else:
+            return False
+    return True
+
+
+def ruta_en_cache(clave, formato):
+    return os.path.join(CARPETA_CACHE_EXPORTACIONES, f"{clave}.{formato}")
+
+
+def buscar_en_cache(clave, formato):
+    """Ruta del archivo ya generado para la clave, o None"""
+    ruta = ruta_en_cache(clave, formato)
+    return ruta if os.path.exists(ruta) else None
+
+
+def _version_de(nombre):
+    """Versión de los datos al inicio de una clave o nombre de archivo, o None"""
+    try:
+        return int(nombre.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def _archivos_de_version(clave):
+    """Archivos en caché (incluidos los .tmp en curso) de la versión de la clave"""
+    if not os.path.isdir(CARPETA_CACHE_EXPORTACIONES):
+        return 0
+    version = _version_de(clave)
+    return sum(1 for nombre in os.listdir(CARPETA_CACHE_EXPORTACIONES) if _version_de(nombre) == version)
+
+
+def _borrar_versiones_anteriores(clave):
+    """
+    Borra los archivos de versiones menores que la de la clave. Los de
+    versiones mayores son de peticiones más recientes y se conservan; los
+    .tmp los borra quien los escribe.
+    """
+    version = _version_de(clave)
+    for nombre in os.listdir(CARPETA_CACHE_EXPORTACIONES):
+        anterior = _version_de(nombre)
+        if anterior is not None and anterior < version and not nombre.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(CARPETA_CACHE_EXPORTACIONES, nombre))
+            except OSError:
+                pass
+
+
+@contextmanager
+def escribir_en_cache(clave, formato):
+    """
+    Archivo binario temporal dentro de la caché. Si el bloque termina sin
+    error se publica con os.replace (nunca se ve un archivo a medias); si
+    falla o se interrumpe, se borra.
+    """
+    os.makedirs(CARPETA_CACHE_EXPORTACIONES, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(prefix=f"{clave}.", suffix='.tmp', dir=CARPETA_CACHE_EXPORTACIONES)
+    try:
+        with os.fdopen(descriptor, 'w+b') as archivo:
+            yield archivo
+        os.replace(temporal, ruta_en_cache(clave, formato))
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    _borrar_versiones_anteriores(clave)
+
+
+def guardar_en_cache(bloques, clave, formato):
+    """Reenvía los bloques (texto o bytes) de una exportación mientras los guarda en la caché"""
+    if _archivos_de_version(clave) >= MAXIMO_ARCHIVOS_POR_VERSION:
+        yield from bloques
+        return
+    with escribir_en_cache(clave, formato) as archivo:
+        for bloque in bloques:
+            archivo.write(bloque if isinstance(bloque, bytes) else bloque.encode('utf-8'))
+            yield bloque
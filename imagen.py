@@ -1,63 +1,96 @@
 from PIL import Image, ImageDraw, ImageFont
+from functools import lru_cache
+import hashlib
 import os
+import threading
+
+from qr import imagen_qr
 
 
 # ============================================
-# SISTEMA ROBUSTO DE CARGA DE FUENTES
-# Prueba múltiples rutas hasta encontrar una
+# REGISTRO DE FUENTES
+# Cada familia prueba sus candidatas una sola vez y se queda con la
+# primera que FreeType puede abrir; cada fuente cargada se guarda por
+# (familia, tamaño), así que un lote de carnets no vuelve a leer los TTF.
 # ============================================
 
-def cargar_fuente(tamaño, bold=False, tipo='sans'):
-    """
-    Carga fuente con múltiples alternativas para garantizar
-    que SIEMPRE se use una fuente legible, nunca la default de 8px
-    """
-    candidatas = []
-    
-    if tipo == 'serif':
-        candidatas = [
-            "static/fonts/times.ttf",
-            "C:/Windows/Fonts/times.ttf",
-            "/usr/share/fonts/truetype/liberation/LiberationSerif-Regular.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf",
-            "/usr/share/fonts/truetype/freefont/FreeSerif.ttf",
-        ]
-    
-    elif bold:
-        candidatas = [
+CANDIDATAS_FUENTES = {
+    'serif': [
+        "static/fonts/times.ttf",
+        "C:/Windows/Fonts/times.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSerif-Regular.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf",
+        "/usr/share/fonts/truetype/freefont/FreeSerif.ttf",
+    ],
+    'sans_bold': [
         "static/fonts/arialbd.ttf",
         "C:/Windows/Fonts/arialbd.ttf",
         "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
         "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
         "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf",
-    ]
-    else:
-        candidatas = [
-            "static/fonts/arial.ttf",
-            "C:/Windows/Fonts/arial.ttf",
-            "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-            "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
-        ]
+    ],
+    'sans': [
+        "static/fonts/arial.ttf",
+        "C:/Windows/Fonts/arial.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+    ],
+}
+
+# familia -> ruta elegida (None si ninguna candidata abre)
+_rutas_fuentes = {}
+
+
+def _familia(tipo, bold):
+    """Familia del registro; serif no tiene variante bold"""
+    if tipo == 'serif':
+        return 'serif'
+    return 'sans_bold' if bold else 'sans'
 
-    for ruta in candidatas:
-        try:
-            return ImageFont.truetype(ruta, tamaño)
-        except:
-            continue
 
-    # Último recurso: crear fuente bitmap escalada
-    # Usamos un truco: ImageFont.load_default() es 8px pero podemos
-    # generar texto más grande dibujando en una imagen mayor
-    try:
-        # Intentar con la fuente por defecto pero notificar
-        print(f"⚠️  ADVERTENCIA: No se encontró fuente TTF para tamaño {tamaño}. "
-              f"El carnet puede verse diferente al esperado.")
-        print(f"   Instala fuentes en: C:/Windows/Fonts/ o /usr/share/fonts/")
-        # Devolver default — al menos algo
-        return ImageFont.load_default()
-    except:
-        return ImageFont.load_default()
+def ruta_fuente(familia):
+    """Primera candidata de la familia que FreeType puede abrir, o None"""
+    if familia not in _rutas_fuentes:
+        _rutas_fuentes[familia] = None
+        for ruta in CANDIDATAS_FUENTES[familia]:
+            try:
+                ImageFont.truetype(ruta, 12)
+            except OSError:
+                continue
+            _rutas_fuentes[familia] = ruta
+            break
+    return _rutas_fuentes[familia]
+
+
+@lru_cache(maxsize=None)
+def _fuente(familia, tamaño):
+    ruta = ruta_fuente(familia)
+    if ruta:
+        return ImageFont.truetype(ruta, tamaño)
+    # Sin TTF la fuente por defecto (8px) se ve muy distinta al carnet esperado
+    print(f"⚠️  ADVERTENCIA: No se encontró fuente TTF '{familia}' para tamaño {tamaño}. "
+          f"El carnet puede verse diferente al esperado.")
+    print(f"   Instala fuentes en: C:/Windows/Fonts/ o /usr/share/fonts/")
+    return ImageFont.load_default()
+
+
+def cargar_fuente(tamaño, bold=False, tipo='sans'):
+    """
+    Fuente TTF de la familia pedida (serif, sans o sans bold) en ese tamaño.
+    Se carga una vez por proceso; las siguientes llamadas la reutilizan.
+    """
+    return _fuente(_familia(tipo, bold), tamaño)
+
+
+def registrar_fuentes():
+    """Resuelve las rutas de todas las familias al arrancar e informa cuál usa cada una"""
+    for familia in CANDIDATAS_FUENTES:
+        ruta = ruta_fuente(familia)
+        if ruta:
+            print(f"🔤 Fuente {familia}: {ruta}")
+        else:
+            print(f"⚠️  Fuente {familia}: ninguna candidata disponible, se usará la fuente por defecto")
 
 
 def wrap_text(texto, font, draw, max_ancho):
@@ -82,147 +115,106 @@ def wrap_text(texto, font, draw, max_ancho):
     return lineas
 
 
-def generar_carnet(empleado, ruta_qr):
-    # MEDIDAS EXACTAS DEL CARNET SENA: 5.5cm ancho x 8.7cm alto (formato vertical)
-    # A 300 DPI para impresión de calidad: 650px ancho x 1028px alto (5.5cm x 8.7cm)
-    ancho, alto = 650, 1028
-    fondo_color = (255, 255, 255)
-    img = Image.new("RGB", (ancho, alto), fondo_color)
-    draw = ImageDraw.Draw(img)
-
-    # ============================================
-    # FUENTES — tamaños ajustados para coincidir con carnet de referencia
-    # ============================================
-    font_nombre       = cargar_fuente(44, bold=True)   # nombre aprendiz (bold verde)
-    font_cedula       = cargar_fuente(40, tipo='serif')  # CC. 1.114.543.155
-    font_rh_label     = cargar_fuente(40, bold=False)  # Rh O+
-    font_footer       = cargar_fuente(30, bold=False)  # Regional / Centro
-    font_aprendiz     = cargar_fuente(34, bold=True)   # APRENDIZ (bold negro)
-    font_vertical_bold= cargar_fuente(32, bold=True)
-    font_logo         = cargar_fuente(30, bold=False)
+# ============================================
+# CAPAS FIJAS DEL CARNET
+# Todo lo que no depende del aprendiz (fondo, logo, línea verde y pie
+# del anverso; fondo, texto legal, firma y texto de carné extraviado
+# del reverso) se dibuja una vez en una imagen base. Cada carnet parte
+# de una copia de esa base y solo dibuja los datos de la persona. Una
+# base se vuelve a construir cuando cambia la fecha o el tamaño de los
+# archivos que usa.
+# ============================================
 
-    # ========== LOGO SENA ==========
-    ruta_logo = os.path.join("static", "fotos", "logo_sena.png")
-    try:
-        logo = Image.open(ruta_logo).convert("RGBA")
-        logo = logo.resize((160, 160))
-        img.paste(logo, (50, 30), logo)
-    except:
-        draw.text((30, 30), "SENA", fill=(0, 128, 0), font=font_logo)
+# MEDIDAS EXACTAS DEL CARNET SENA: 5.5cm ancho x 8.7cm alto (formato vertical)
+# A 300 DPI para impresión de calidad: 650px ancho x 1028px alto (5.5cm x 8.7cm)
+ANCHO_CARNET, ALTO_CARNET = 650, 1028
 
-    # ========== FOTO DEL APRENDIZ ==========
-    foto = None
-    posibles_rutas = []
+RUTA_LOGO = os.path.join("static", "fotos", "logo_sena.png")
+RUTA_FONDO_REVERSO = os.path.join("static", "fondos", "trasero.png")
+RUTA_FIRMA = os.path.join("static", "fotos", "firma_directora.png")
 
-    if empleado.get('cedula'):
-        posibles_rutas += [
-            os.path.join("static", "fotos", f"foto_{empleado['cedula']}.png"),
-            os.path.join("static", "fotos", f"foto_{empleado['cedula']}.jpg"),
-            os.path.join("static", "fotos", f"{empleado['cedula']}.png"),
-            os.path.join("static", "fotos", f"{empleado['cedula']}.jpg"),
-        ]
+# Borde superior de la línea del pie del anverso (línea en y=900, grosor 9)
+Y_PIE = 895
 
-    if empleado.get('foto'):
-        posibles_rutas.append(os.path.join("static", "fotos", empleado['foto']))
+# Tamaño fijo de la foto en el anverso
+TAMANO_FOTO = (224, 257)
 
-    for ruta in posibles_rutas:
-        if os.path.exists(ruta):
-            try:
-                foto = Image.open(ruta).convert("RGB")
-                break
-            except:
-                continue
+# Márgenes del texto del reverso
+MARGEN_IZQ_REVERSO = 43
+MARGEN_DER_REVERSO = 50
 
-    if foto is None:
-        foto = Image.new("RGB", (220, 260), (235, 235, 235))
-        draw_ph = ImageDraw.Draw(foto)
-        font_ph = cargar_fuente(18)
-        draw_ph.text((55, 115), "SIN FOTO", fill=(150, 150, 150), font=font_ph)
+# nombre -> (versión de los archivos de la capa, imagen)
+_capas = {}
 
-    # Siempre redimensionar a tamaño fijo — independiente de la foto original
-    foto = foto.resize((224, 257), Image.LANCZOS)
-    img.paste(foto, (390, 20))
 
-    # ========== CARGO ==========
-    cargo_texto = empleado.get('cargo', 'APRENDIZ').upper()
-    # CARGO "APRENDIZ" — justo debajo de la foto+logo
-    draw.text((30, 245), cargo_texto, fill=(0, 0, 0), font=font_aprendiz)
+def _version_archivo(ruta):
+    """(mtime, tamaño) del archivo, o None si no existe"""
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        return None
+    return estado.st_mtime_ns, estado.st_size
 
-    # Línea verde horizontal separadora
-    draw.line((30, 293, 610, 293), fill=(0, 128, 0), width=9)
 
-    # ========== NOMBRE — dividido en líneas si es largo ==========
-    nombre_completo = empleado['nombre'].upper()
-    partes = nombre_completo.split()
+def _capa(nombre, archivos, construir):
+    """Copia de la capa `nombre`; se reconstruye si cambió alguno de sus archivos"""
+    version = tuple(_version_archivo(ruta) for ruta in archivos)
+    guardada = _capas.get(nombre)
+    if guardada is None or guardada[0] != version:
+        guardada = _capas[nombre] = (version, construir())
+    return guardada[1].copy()
 
-    y_nombre = 315
-    espaciado = 60   # espacio entre líneas del nombre
 
-    # Siempre máximo 2 palabras por línea para consistencia visual
-    # "JOHAN QUINTERO HERNANDEZ" → "JOHAN QUINTERO" / "HERNANDEZ"
-    # "ANA MARIA TOQUICA MILLAN" → "ANA MARIA" / "TOQUICA MILLAN"
-    lineas_nombre = []
-    for i in range(0, len(partes), 2):
-        lineas_nombre.append(" ".join(partes[i:i+2]))
+def _dibujar_pie(draw):
+    font_footer = cargar_fuente(30, bold=False)  # Regional / Centro
+    draw.line((30, 900, 90, 900), fill=(0, 120, 0), width=9)
+    draw.text((30, 927), "Regional Valle del Cauca",           fill=(79, 160, 70), font=font_footer, )
+    draw.text((30, 971), "Centro de Biotecnología Industrial",  fill=(79, 160, 70), font=font_footer)
 
-    for idx, linea in enumerate(lineas_nombre):
-        draw.text((30, y_nombre + espaciado * idx), linea, fill=(0, 128, 0), font=font_nombre)
 
-    siguiente_y = y_nombre + espaciado * len(lineas_nombre) + 10
+def _construir_anverso(con_pie):
+    img = Image.new("RGB", (ANCHO_CARNET, ALTO_CARNET), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
 
-    # ========== CÉDULA ==========
-    tipo_doc = empleado.get('tipo_documento', 'CC')
+    # ========== LOGO SENA ==========
     try:
-        cedula_formateada = str(empleado['cedula'])
+        logo = Image.open(RUTA_LOGO).convert("RGBA")
+        logo = logo.resize((160, 160))
+        img.paste(logo, (50, 30), logo)
     except:
-        cedula_formateada = str(empleado['cedula'])
-    texto_cedula = f"{tipo_doc}. {cedula_formateada}"
-    draw.text((30, siguiente_y + 44), texto_cedula, fill=(0, 0, 0), font=font_cedula)
-
-    # ========== RH / TIPO SANGRE ==========
-    tipo_sangre = empleado.get('tipo_sangre', 'O+').upper()
-    draw.text((30, siguiente_y + 110), f"Rh {tipo_sangre}", fill=(0, 0, 0), font=font_rh_label)
+        draw.text((30, 30), "SENA", fill=(0, 128, 0), font=cargar_fuente(30, bold=False))
 
-    # ========== CÓDIGO QR — esquina inferior derecha ==========
-    try:
-        qr = Image.open(ruta_qr).convert("RGB")
-        qr = qr.resize((310, 329), Image.LANCZOS)
-        img.paste(qr, (330, siguiente_y +25))
-    except:
-        draw.rectangle([(377, siguiente_y + 10), (630, siguiente_y + 250)], outline=(0, 0, 0), width=2)
-        draw.text((480, siguiente_y + 120), "QR", fill=(0, 0, 0), font=font_footer)
+    # Línea verde horizontal separadora
+    draw.line((30, 293, 610, 293), fill=(0, 128, 0), width=9)
 
     # ========== FOOTER ==========
-    draw.line((30, 900, 90, 900), fill=(0, 120, 0), width=9)
-    draw.text((30, 927), "Regional Valle del Cauca",           fill=(79, 160, 70), font=font_footer, )
-    draw.text((30, 971), "Centro de Biotecnología Industrial",  fill=(79, 160, 70), font=font_footer)
+    if con_pie:
+        _dibujar_pie(draw)
+    return img
 
-    # Guardar anverso
-    ruta_anverso = os.path.join("static", "carnets", f"carnet_{empleado['cedula']}.png")
-    img.save(ruta_anverso, dpi=(300, 300))
-    print(f"✅ Anverso guardado: {ruta_anverso}")
 
-    # ===== REVERSO DEL CARNET =====
+def _construir_foto_vacia():
+    foto = Image.new("RGB", (220, 260), (235, 235, 235))
+    draw_ph = ImageDraw.Draw(foto)
+    draw_ph.text((55, 115), "SIN FOTO", fill=(150, 150, 150), font=cargar_fuente(18))
+    return foto.resize(TAMANO_FOTO, Image.LANCZOS)
+
+
+def _construir_reverso():
     try:
-        ruta_fondo_reverso = os.path.join("static", "fondos", "trasero.png")
-        reverso = Image.open(ruta_fondo_reverso).convert("RGB")
-        reverso = reverso.resize((ancho, alto))
+        reverso = Image.open(RUTA_FONDO_REVERSO).convert("RGB")
+        reverso = reverso.resize((ANCHO_CARNET, ALTO_CARNET))
     except:
-        reverso = Image.new("RGB", (ancho, alto), (255, 255, 255))
+        reverso = Image.new("RGB", (ANCHO_CARNET, ALTO_CARNET), (255, 255, 255))
 
     draw_reverso = ImageDraw.Draw(reverso)
-
-    # Fuentes del reverso — también con sistema robusto
-    font_reverso       = cargar_fuente(29, tipo='serif')
-    font_extraviado    = cargar_fuente(26, tipo='serif')
-    font_programa_bold = cargar_fuente(26, tipo='serif')
-    font_firma_titulo  = cargar_fuente(26, tipo='serif')
-    font_ficha         = cargar_fuente(26, tipo='serif')
+    font_reverso      = cargar_fuente(29, tipo='serif')
+    font_extraviado   = cargar_fuente(26, tipo='serif')
+    font_firma_titulo = cargar_fuente(26, tipo='serif')
 
     # ========== TEXTO PRINCIPAL DEL REVERSO ==========
-    margen_izq = 43
-    margen_der = 50
-    max_ancho_texto = ancho - margen_izq - margen_der
+    margen_izq = MARGEN_IZQ_REVERSO
+    max_ancho_texto = ANCHO_CARNET - MARGEN_IZQ_REVERSO - MARGEN_DER_REVERSO
     texto_y = 35
     sep = 40  # separación entre líneas
 
@@ -261,11 +253,10 @@ def generar_carnet(empleado, ruta_qr):
 
     # ========== FIRMA ==========
     firma_y = 400
-    firma_x = (ancho - 100) // 3
+    firma_x = (ANCHO_CARNET - 100) // 3
     try:
-        ruta_firma = os.path.join("static", "fotos", "firma_directora.png")
-        if os.path.exists(ruta_firma):
-            firma_img = Image.open(ruta_firma).convert("RGBA")
+        if os.path.exists(RUTA_FIRMA):
+            firma_img = Image.open(RUTA_FIRMA).convert("RGBA")
             firma_img = firma_img.resize((350, 250), Image.LANCZOS)
             reverso.paste(firma_img, (firma_x, firma_y), firma_img)
     except:
@@ -273,11 +264,8 @@ def generar_carnet(empleado, ruta_qr):
 
     # "Firma y Autoriza"
     firma_texto_y = firma_y + 230
-    texto_firma = "Firma y Autoriza"
-    bbox_firma = draw_reverso.textbbox((0, 0), texto_firma, font=font_firma_titulo)
-    pos_x_firma = margen_izq
-    draw_reverso.text((pos_x_firma, firma_texto_y),
-                      texto_firma, fill=(0, 0, 0), font=font_firma_titulo)
+    draw_reverso.text((margen_izq, firma_texto_y),
+                      "Firma y Autoriza", fill=(0, 0, 0), font=font_firma_titulo)
 
     # ========== TEXTO CARNÉ EXTRAVIADO ==========
     info_y = 700
@@ -289,10 +277,141 @@ def generar_carnet(empleado, ruta_qr):
     for i, linea in enumerate(texto_extraviado):
         draw_reverso.text((margen_izq, info_y + i * 42),
                           linea, fill=(0, 0, 0), font=font_extraviado)
+    return reverso
+
+
+def base_anverso(con_pie=True):
+    """Anverso sin datos del aprendiz (copia nueva en cada llamada)"""
+    return _capa('anverso' if con_pie else 'anverso_sin_pie', (RUTA_LOGO,),
+                 lambda: _construir_anverso(con_pie))
+
 
-    # ========== PROGRAMA Y FICHA ==========
-    nombre_programa = empleado.get('nombre_programa', 'Programa Técnico')
-    codigo_ficha    = empleado.get('codigo_ficha', '0000')
+def base_reverso():
+    """Reverso sin programa ni ficha (copia nueva en cada llamada)"""
+    return _capa('reverso', (RUTA_FONDO_REVERSO, RUTA_FIRMA), _construir_reverso)
+
+
+def dibujar_anverso(empleado, qr):
+    """Anverso del aprendiz en memoria. `qr` es una imagen PIL o la ruta de un PNG."""
+    # ============================================
+    # FUENTES — tamaños ajustados para coincidir con carnet de referencia
+    # ============================================
+    font_nombre       = cargar_fuente(44, bold=True)   # nombre aprendiz (bold verde)
+    font_cedula       = cargar_fuente(40, tipo='serif')  # CC. 1.114.543.155
+    font_rh_label     = cargar_fuente(40, bold=False)  # Rh O+
+    font_footer       = cargar_fuente(30, bold=False)  # Regional / Centro
+    font_aprendiz     = cargar_fuente(34, bold=True)   # APRENDIZ (bold negro)
+
+    # ========== NOMBRE — dividido en líneas si es largo ==========
+    nombre_completo = empleado['nombre'].upper()
+    partes = nombre_completo.split()
+
+    y_nombre = 315
+    espaciado = 60   # espacio entre líneas del nombre
+
+    # Siempre máximo 2 palabras por línea para consistencia visual
+    # "JOHAN QUINTERO HERNANDEZ" → "JOHAN QUINTERO" / "HERNANDEZ"
+    # "ANA MARIA TOQUICA MILLAN" → "ANA MARIA" / "TOQUICA MILLAN"
+    lineas_nombre = []
+    for i in range(0, len(partes), 2):
+        lineas_nombre.append(" ".join(partes[i:i+2]))
+
+    siguiente_y = y_nombre + espaciado * len(lineas_nombre) + 10
+
+    # Con nombres muy largos el QR llega al pie: el pie se dibuja encima, como siempre
+    qr_sobre_pie = siguiente_y + 25 + 329 > Y_PIE
+    img = base_anverso(con_pie=not qr_sobre_pie)
+    draw = ImageDraw.Draw(img)
+
+    # ========== FOTO DEL APRENDIZ ==========
+    foto = None
+    posibles_rutas = []
+
+    if empleado.get('cedula'):
+        posibles_rutas += [
+            os.path.join("static", "fotos", f"foto_{empleado['cedula']}.png"),
+            os.path.join("static", "fotos", f"foto_{empleado['cedula']}.jpg"),
+            os.path.join("static", "fotos", f"{empleado['cedula']}.png"),
+            os.path.join("static", "fotos", f"{empleado['cedula']}.jpg"),
+        ]
+
+    if empleado.get('foto'):
+        posibles_rutas.append(os.path.join("static", "fotos", empleado['foto']))
+
+    for ruta in posibles_rutas:
+        if os.path.exists(ruta):
+            try:
+                foto = Image.open(ruta).convert("RGB")
+                break
+            except:
+                continue
+
+    if foto is None:
+        foto = _capa('foto_vacia', (), _construir_foto_vacia)
+    else:
+        # Siempre redimensionar a tamaño fijo — independiente de la foto original
+        foto = foto.resize(TAMANO_FOTO, Image.LANCZOS)
+    img.paste(foto, (390, 20))
+
+    # ========== CARGO ==========
+    cargo_texto = empleado.get('cargo', 'APRENDIZ').upper()
+    # CARGO "APRENDIZ" — justo debajo de la foto+logo
+    draw.text((30, 245), cargo_texto, fill=(0, 0, 0), font=font_aprendiz)
+
+    for idx, linea in enumerate(lineas_nombre):
+        draw.text((30, y_nombre + espaciado * idx), linea, fill=(0, 128, 0), font=font_nombre)
+
+    # ========== CÉDULA ==========
+    tipo_doc = empleado.get('tipo_documento', 'CC')
+    texto_cedula = f"{tipo_doc}. {empleado['cedula']}"
+    draw.text((30, siguiente_y + 44), texto_cedula, fill=(0, 0, 0), font=font_cedula)
+
+    # ========== RH / TIPO SANGRE ==========
+    tipo_sangre = empleado.get('tipo_sangre', 'O+').upper()
+    draw.text((30, siguiente_y + 110), f"Rh {tipo_sangre}", fill=(0, 0, 0), font=font_rh_label)
+
+    # ========== CÓDIGO QR — esquina inferior derecha ==========
+    try:
+        if isinstance(qr, str):
+            qr = Image.open(qr)
+        qr = qr.convert("RGB").resize((310, 329), Image.LANCZOS)
+        img.paste(qr, (330, siguiente_y +25))
+    except:
+        draw.rectangle([(377, siguiente_y + 10), (630, siguiente_y + 250)], outline=(0, 0, 0), width=2)
+        draw.text((480, siguiente_y + 120), "QR", fill=(0, 0, 0), font=font_footer)
+
+    if qr_sobre_pie:
+        _dibujar_pie(draw)
+
+    return img
+
+
+# ============================================
+# REVERSO COMPARTIDO POR FICHA
+# El reverso solo depende de la plantilla (fondo, firma, fuente) y del
+# programa y la ficha, así que se dibuja una vez por combinación y todos
+# los aprendices de la ficha usan el mismo archivo. El nombre lleva la
+# versión de la plantilla: si cambia un archivo de la plantilla se
+# generan reversos nuevos y se borran los de versiones anteriores.
+# ============================================
+
+CARPETA_REVERSOS = os.path.join("static", "carnets", "reversos")
+
+
+def version_plantilla_reverso():
+    """Resumen corto de los archivos y la fuente con que se dibuja el reverso"""
+    datos = repr((_version_archivo(RUTA_FONDO_REVERSO), _version_archivo(RUTA_FIRMA), ruta_fuente('serif')))
+    return hashlib.blake2b(datos.encode('utf-8'), digest_size=6).hexdigest()
+
+
+def dibujar_reverso(nombre_programa, codigo_ficha):
+    """Reverso completo: base de la plantilla + programa y ficha"""
+    reverso = base_reverso()
+    draw_reverso = ImageDraw.Draw(reverso)
+    font_programa_bold = cargar_fuente(26, tipo='serif')
+    font_ficha         = cargar_fuente(26, tipo='serif')
+    margen_izq = MARGEN_IZQ_REVERSO
+    max_ancho_texto = ANCHO_CARNET - MARGEN_IZQ_REVERSO - MARGEN_DER_REVERSO
 
     # Wrap del nombre de programa si es muy largo
     lineas_programa = wrap_text(nombre_programa, font_programa_bold, draw_reverso,
@@ -305,24 +424,59 @@ def generar_carnet(empleado, ruta_qr):
     ficha_y = prog_y + (len(lineas_programa[:2])) * 34 + 25
     draw_reverso.text((margen_izq, ficha_y),
                       f"FICHA {codigo_ficha}", fill=(0, 0, 0), font=font_ficha)
+    return reverso
 
-    ruta_reverso = os.path.join("static", "carnets", f"reverso_{empleado['cedula']}.png")
-    reverso.save(ruta_reverso, dpi=(300, 300))
-    print(f" Reverso guardado: {ruta_reverso}")
 
-    return ruta_anverso
+# Cada reverso ocupa ~2 MB; un lote usa uno por ficha
+@lru_cache(maxsize=8)
+def _reverso_en_memoria(version, nombre_programa, codigo_ficha):
+    # version solo forma parte de la clave: otra plantilla, otra entrada
+    return dibujar_reverso(nombre_programa, codigo_ficha)
 
 
-def combinar_anverso_reverso(nombre_archivo_anverso, nombre_archivo_reverso, nombre_aprendiz):
-    ruta_anverso = os.path.join("static", "carnets", nombre_archivo_anverso)
-    ruta_reverso = os.path.join("static", "carnets", nombre_archivo_reverso)
+def _datos_reverso(empleado):
+    return empleado.get('nombre_programa', 'Programa Técnico'), empleado.get('codigo_ficha', '0000')
 
-    try:
-        anverso = Image.open(ruta_anverso)
-        reverso = Image.open(ruta_reverso)
-    except Exception as e:
-        raise Exception(f"Error al cargar las imágenes: {e}")
 
+def imagen_reverso(empleado):
+    """Reverso de la ficha del aprendiz en memoria (no se debe modificar: es compartido)"""
+    return _reverso_en_memoria(version_plantilla_reverso(), *_datos_reverso(empleado))
+
+
+def _borrar_reversos_anteriores(version):
+    for nombre in os.listdir(CARPETA_REVERSOS):
+        if nombre.endswith('.png') and not nombre.startswith(f"reverso_{version}_"):
+            try:
+                os.remove(os.path.join(CARPETA_REVERSOS, nombre))
+            except OSError:
+                pass
+
+
+def reverso_compartido(empleado):
+    """
+    Archivo del reverso del aprendiz, relativo a static/carnets como las
+    demás salidas de renderizar_carnet. Lo escribe si todavía no existe.
+    """
+    nombre_programa, codigo_ficha = _datos_reverso(empleado)
+    version = version_plantilla_reverso()
+    clave = hashlib.blake2b(repr((nombre_programa, codigo_ficha)).encode('utf-8'), digest_size=8).hexdigest()
+    nombre_archivo = f"reverso_{version}_{clave}.png"
+    ruta_reverso = os.path.join(CARPETA_REVERSOS, nombre_archivo)
+
+    if not os.path.exists(ruta_reverso):
+        os.makedirs(CARPETA_REVERSOS, exist_ok=True)
+        # Archivo temporal + os.replace: otro proceso nunca lee un PNG a medias
+        temporal = f"{ruta_reverso}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _reverso_en_memoria(version, nombre_programa, codigo_ficha).save(temporal, format='PNG', dpi=(300, 300))
+        os.replace(temporal, ruta_reverso)
+        print(f" Reverso guardado: {ruta_reverso} (ficha {codigo_ficha})")
+        _borrar_reversos_anteriores(version)
+
+    return f"reversos/{nombre_archivo}"
+
+
+def combinar_imagenes(anverso, reverso):
+    """Anverso y reverso lado a lado con sus etiquetas"""
     # Padding entre las dos caras
     padding = 40
     ancho_total = anverso.width + reverso.width + padding
@@ -339,10 +493,77 @@ def combinar_anverso_reverso(nombre_archivo_anverso, nombre_archivo_reverso, nom
               "ANVERSO", fill=(80, 80, 80), font=font_label)
     draw.text((anverso.width + padding + reverso.width // 2 - 40, reverso.height + 15),
               "REVERSO", fill=(80, 80, 80), font=font_label)
+    return combinado
+
+
+# ============================================
+# GENERACIÓN DEL CARNET EN MEMORIA
+# Anverso, reverso y carnet combinado pasan de una etapa a otra como
+# imágenes PIL; solo se escriben los PNG de las salidas pedidas, con
+# una sola codificación cada uno.
+# ============================================
+
+SALIDAS_CARNET = ('anverso', 'reverso', 'completo')
+
+
+def nombre_archivo_completo(nombre_aprendiz):
+    return f"{nombre_aprendiz.replace(' ', '_')}_completo.png"
+
+
+def renderizar_carnet(empleado, qr, salidas=SALIDAS_CARNET):
+    """
+    Dibuja el carnet del aprendiz y guarda en static/carnets las salidas
+    pedidas ('anverso', 'reverso', 'completo'). `qr` es una imagen PIL o
+    la ruta de un PNG. Devuelve {salida: archivo relativo a static/carnets}.
+    """
+    anverso = dibujar_anverso(empleado, qr)
+    archivos = {}
+
+    if 'anverso' in salidas:
+        archivos['anverso'] = f"carnet_{empleado['cedula']}.png"
+        anverso.save(os.path.join("static", "carnets", archivos['anverso']), dpi=(300, 300))
+
+    if 'reverso' in salidas:
+        # Compartido por la ficha: solo se escribe la primera vez
+        archivos['reverso'] = reverso_compartido(empleado)
+
+    if 'completo' in salidas:
+        archivos['completo'] = nombre_archivo_completo(empleado['nombre'])
+        combinado = combinar_imagenes(anverso, imagen_reverso(empleado))
+        combinado.save(os.path.join("static", "carnets", archivos['completo']), dpi=(300, 300))
+
+    print(f"✅ Carnet de {empleado['nombre']} guardado: {', '.join(archivos.values())}")
+    return archivos
+
+
+# ============================================
+# PROCESOS DE RENDER PARA LOTES (lotes_carnets.py)
+# Cada proceso del pool se prepara una vez al arrancar: dibuja un
+# carnet de ejemplo en memoria, lo que deja cargadas las fuentes, las
+# capas fijas y el QR antes de recibir el primer aprendiz.
+# ============================================
+
+APRENDIZ_EJEMPLO = {
+    'nombre': 'APRENDIZ DE EJEMPLO', 'cedula': '0000000', 'tipo_documento': 'CC',
+    'cargo': 'APRENDIZ', 'tipo_sangre': 'O+', 'foto': None,
+    'nombre_programa': 'Programa Técnico', 'codigo_ficha': '0000',
+}
+
+
+# QR de los carnets del proceso de render: es el mismo para todos, así que
+# se genera una vez en preparar_proceso_render (dibujar_anverso no lo modifica)
+_qr_proceso = None
+
+
+def preparar_proceso_render():
+    """Inicializador de los procesos del pool de lotes"""
+    global _qr_proceso
+    _qr_proceso = imagen_qr()
+    base_anverso(con_pie=False)
+    combinar_imagenes(dibujar_anverso(APRENDIZ_EJEMPLO, _qr_proceso),
+                      dibujar_reverso(APRENDIZ_EJEMPLO['nombre_programa'], APRENDIZ_EJEMPLO['codigo_ficha']))
 
-    nombre_archivo = f"{nombre_aprendiz.replace(' ', '_')}_completo.png"
-    ruta_combinada = os.path.join("static", "carnets", nombre_archivo)
-    combinado.save(ruta_combinada, dpi=(300, 300))
-    print(f"✅ Carnet combinado guardado: {ruta_combinada}")
 
-    return nombre_archivo
\ No newline at end of file
+def renderizar_en_proceso(empleado, salidas):
+    """Tarea del pool: carnet de un aprendiz (dict) con el QR del proceso; devuelve los archivos escritos"""
+    return renderizar_carnet(empleado, _qr_proceso, salidas)
@@ -0,0 +1,851 @@
+import codecs
+import csv
+import hashlib
+import io
+import os
+import random
+import unicodedata
+import zipfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+from xml.etree import ElementTree
+
+import openpyxl
+
+from conexion_db import obtener_conexion
+
+# ============================================
+# IMPORTADOR DE EXCEL SENA
+# Lee el archivo (Excel en modo read_only, CSV con el módulo csv u ODS)
+# y procesa las filas en lotes de tamaño fijo en una sola pasada. Cada
+# fila importada guarda una huella (hash de sus campos); al volver a
+# cargar el mismo listado solo se escriben las filas nuevas o cuya huella
+# cambió, conservando código y fecha de emisión.
+# ============================================
+
+TAMANO_LOTE = 500
+
+# Formatos aceptados en la carga
+EXTENSIONES_IMPORTACION = ('.xlsx', '.xlsm', '.csv', '.ods')
+
+# Bytes del CSV que se leen para detectar codificación y delimitador
+TAMANO_MUESTRA_CSV = 64 * 1024
+DELIMITADORES_CSV = ',;\t|'
+
+# Espacios de nombres de content.xml en un .ods
+_OFFICE = '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}'
+_TABLE = '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}'
+_TEXT = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+CENTRO_POR_DEFECTO = 'Centro de Biotecnología Industrial'
+
+# Campo -> encabezados aceptados, en orden de preferencia. La comparación
+# ignora mayúsculas, tildes y espacios repetidos. Es la tabla por defecto:
+# la app usa app.config['ALIAS_COLUMNAS'], que se puede reemplazar desde
+# el archivo de configuración para aceptar otra plantilla.
+ALIAS_COLUMNAS = {
+    'primer_apellido': ('Primer Apellido',),
+    'segundo_apellido': ('Segundo Apellido',),
+    'nombre': ('Nombre',),
+    'tipo_documento': ('Tipo de documento',),
+    'cedula': ('Número de documento',),
+    'tipo_sangre': ('Tipo de Sangre',),
+    'nombre_programa': ('Nombre del Programa',),
+    'codigo_ficha': ('Código de Ficha',),
+    'centro': ('Centro',),
+    'red_tecnologica': ('Red Tecnologica',),
+    'nis_archivo': ('NIS',),
+    'fecha_archivo': (
+        'Fecha Finalización del Programa',
+        'FECHA FINALIZACION',
+        'Fecha de Finalización',
+        'Fecha Finalizacion',
+        'Fecha Final',
+        'Fecha Fin',
+    ),
+}
+
+CAMPOS_REQUERIDOS = ('primer_apellido', 'nombre', 'tipo_documento', 'cedula')
+
+# Valor de los campos cuya celda viene vacía o cuya columna no está
+VALORES_POR_DEFECTO = {
+    'tipo_documento': 'CC',
+    'tipo_sangre': 'O+',
+    'centro': CENTRO_POR_DEFECTO,
+}
+
+# Aprendiz nuevo (si otra carga lo insertó entretanto, no se pisa)
+SQL_INSERTAR_APRENDIZ = """
+    INSERT INTO empleados (
+        nombre, cedula, tipo_documento, cargo, codigo,
+        fecha_emision, fecha_vencimiento, tipo_sangre, foto,
+        nis, primer_apellido, segundo_apellido,
+        nombre_programa, codigo_ficha, centro,
+        nivel_formacion, red_tecnologica, huella
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(cedula) DO NOTHING
+"""
+
+# Aprendiz existente cuyos datos cambiaron: se conservan foto, código y fecha
+# de emisión (el carnet impreso sigue siendo válido); NIS y fecha de
+# vencimiento solo se reemplazan si el archivo los trae
+SQL_ACTUALIZAR_APRENDIZ = """
+    UPDATE empleados SET
+        nombre = ?, tipo_documento = ?, tipo_sangre = ?,
+        fecha_vencimiento = COALESCE(NULLIF(?, ''), fecha_vencimiento),
+        nis = COALESCE(NULLIF(?, ''), nis),
+        primer_apellido = ?, segundo_apellido = ?,
+        nombre_programa = ?, codigo_ficha = ?, centro = ?,
+        nivel_formacion = ?, red_tecnologica = ?,
+        huella = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE cedula = ?
+"""
+
+# Campos del archivo que entran en la huella (los valores generados no)
+CAMPOS_HUELLA = (
+    'nombre', 'tipo_documento', 'tipo_sangre', 'fecha_archivo', 'nis_archivo',
+    'primer_apellido', 'segundo_apellido', 'nombre_programa', 'codigo_ficha',
+    'centro', 'nivel_formacion', 'red_tecnologica',
+)
+_campos_huella = itemgetter(*CAMPOS_HUELLA)
+
+
+# =============================================
+# CONVERSIONES DE CAMPOS
+# =============================================
+
+def convertir_fecha_excel(fecha_serial):
+    """Convierte fecha serial de Excel a formato YYYY-MM-DD"""
+    try:
+        if fecha_serial == "" or fecha_serial is None:
+            return ""
+
+        # Celdas con formato de fecha llegan como datetime
+        if isinstance(fecha_serial, (datetime, date)):
+            return fecha_serial.strftime("%Y-%m-%d")
+
+        # Si ya es una cadena de fecha, devolverla
+        if isinstance(fecha_serial, str):
+            if "/" in fecha_serial or "-" in fecha_serial:
+                return fecha_serial
+
+        # Convertir número serial de Excel a fecha
+        fecha_serial = float(fecha_serial)
+        # Excel cuenta desde 1900-01-01, pero tiene un bug que cuenta 1900 como año bisiesto
+        base_date = datetime(1899, 12, 30)  # Ajuste por el bug de Excel
+        fecha_convertida = base_date + timedelta(days=fecha_serial)
+        return fecha_convertida.strftime("%Y-%m-%d")
+
+    except (ValueError, TypeError):
+        return ""
+
+
+def generar_nis_automatico():
+    """Genera un NIS automático de 11 dígitos"""
+    return str(random.randint(10000000000, 99999999999))
+
+
+@lru_cache(maxsize=None)
+def determinar_nivel_formacion(programa):
+    """Determina el nivel de formación basado en el programa (memorizado por programa)"""
+    programa_lower = programa.lower() if programa else ""
+
+    # Palabras clave para tecnólogo
+    tecnologicas = ["tecnología", "tecnológico", "tecnólogo", "gestión", "desarrollo", "análisis"]
+
+    # Palabras clave para técnico
+    tecnicas = ["técnico", "auxiliar", "operación", "mantenimiento"]
+
+    for palabra in tecnologicas:
+        if palabra in programa_lower:
+            return "Tecnólogo"
+
+    for palabra in tecnicas:
+        if palabra in programa_lower:
+            return "Técnico"
+
+    # Por defecto, si el programa es largo (más de 50 caracteres), probablemente sea tecnólogo
+    if len(programa) > 50:
+        return "Tecnólogo"
+
+    return "Técnico"
+
+
+# =============================================
+# LECTURA POR STREAMING
+# =============================================
+
+def extension_de(fuente, extension=None):
+    """Extensión en minúsculas; de la ruta (o del nombre del stream) si no se indica"""
+    if extension:
+        return extension.lower()
+    nombre = fuente if isinstance(fuente, (str, os.PathLike)) else getattr(fuente, 'name', '')
+    return os.path.splitext(str(nombre))[1].lower()
+
+
+@contextmanager
+def abrir_binario(fuente):
+    """
+    Archivo binario a partir de una ruta o de un stream ya abierto (el
+    archivo subido, un BytesIO). El stream no se cierra: se rebobina al
+    salir para poder leerlo otra vez.
+    """
+    if isinstance(fuente, (str, os.PathLike)):
+        with open(fuente, 'rb') as archivo:
+            yield archivo
+        return
+
+    posicion = fuente.tell()
+    try:
+        yield fuente
+    finally:
+        fuente.seek(posicion)
+
+
+def leer_filas(fuente, extension=None):
+    """Filas del archivo según su extensión: .csv, .ods o Excel (.xlsx / .xlsm)"""
+    extension = extension_de(fuente, extension)
+    if extension == '.csv':
+        return leer_filas_csv(fuente)
+    if extension == '.ods':
+        return leer_filas_ods(fuente)
+    return leer_filas_excel(fuente)
+
+
+def leer_filas_excel(fuente):
+    """Genera las filas (tuplas de valores) de la hoja activa sin cargar el libro completo"""
+    with abrir_binario(fuente) as archivo:
+        workbook = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield row
+        finally:
+            workbook.close()
+
+
+def detectar_csv(fuente):
+    """
+    (codificación, delimitador) de un CSV a partir de sus primeros bytes.
+    Las exportaciones de Excel en español suelen venir en cp1252 y con ';'.
+    """
+    with abrir_binario(fuente) as archivo:
+        muestra = archivo.read(TAMANO_MUESTRA_CSV)
+    try:
+        codecs.getincrementaldecoder('utf-8-sig')().decode(muestra, final=False)
+        codificacion = 'utf-8-sig'
+    except UnicodeDecodeError:
+        codificacion = 'cp1252'
+
+    # El delimitador es el candidato que más aparece en la fila de encabezados
+    encabezados = muestra.decode(codificacion, errors='ignore').splitlines()[:1] or ['']
+    delimitador = max(DELIMITADORES_CSV, key=encabezados[0].count)
+    return codificacion, delimitador if encabezados[0].count(delimitador) else ','
+
+
+def leer_filas_csv(fuente):
+    """Genera las filas de un CSV (tuplas de textos) leyendo el archivo por streaming"""
+    codificacion, delimitador = detectar_csv(fuente)
+    with abrir_binario(fuente) as archivo:
+        texto = io.TextIOWrapper(archivo, encoding=codificacion, newline='')
+        try:
+            for row in csv.reader(texto, delimiter=delimitador):
+                yield tuple(row)
+        finally:
+            # Suelta el binario sin cerrarlo (es de quien lo abrió)
+            texto.detach()
+
+
+def leer_filas_ods(fuente):
+    """
+    Genera las filas de la primera hoja de un OpenDocument (.ods) leyendo
+    content.xml por streaming, sin cargar la hoja completa en memoria
+    """
+    with abrir_binario(fuente) as archivo, zipfile.ZipFile(archivo) as paquete, \
+            paquete.open('content.xml') as contenido:
+        vacias = 0
+        for _evento, elemento in ElementTree.iterparse(contenido):
+            if elemento.tag == _TABLE + 'table':
+                return
+            if elemento.tag != _TABLE + 'table-row':
+                continue
+
+            row = _fila_ods(elemento)
+            repetir = int(elemento.get(_TABLE + 'number-rows-repeated', 1))
+            elemento.clear()
+            # Las filas vacías repetidas del final de la hoja no se generan
+            if not row:
+                vacias += repetir
+                continue
+            for _ in range(vacias):
+                yield ()
+            vacias = 0
+            for _ in range(repetir):
+                yield row
+
+
+def _fila_ods(fila):
+    """Valores de una fila del .ods; las celdas vacías del final se descartan"""
+    valores, vacias = [], 0
+    for celda in fila:
+        if celda.tag not in (_TABLE + 'table-cell', _TABLE + 'covered-table-cell'):
+            continue
+        repetir = int(celda.get(_TABLE + 'number-columns-repeated', 1))
+        valor = _valor_celda_ods(celda)
+        if valor is None:
+            vacias += repetir
+            continue
+        valores.extend([None] * vacias)
+        valores.extend([valor] * repetir)
+        vacias = 0
+    return tuple(valores)
+
+
+def _valor_celda_ods(celda):
+    """Valor de una celda según su office:value-type (número, fecha, booleano o texto)"""
+    tipo = celda.get(_OFFICE + 'value-type')
+    if tipo in ('float', 'percentage', 'currency'):
+        return float(celda.get(_OFFICE + 'value'))
+    if tipo == 'date':
+        return datetime.fromisoformat(celda.get(_OFFICE + 'date-value'))
+    if tipo == 'boolean':
+        return celda.get(_OFFICE + 'boolean-value') == 'true'
+    texto = '\n'.join(''.join(parrafo.itertext()) for parrafo in celda.findall(_TEXT + 'p'))
+    return texto or None
+
+
+def en_lotes(iterable, tamano=TAMANO_LOTE):
+    """Agrupa un iterable en listas de hasta `tamano` elementos"""
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def _clave_encabezado(texto):
+    """Encabezado normalizado: sin tildes, minúsculas y espacios simples"""
+    if texto is None:
+        return ''
+    sin_tildes = unicodedata.normalize('NFKD', str(texto))
+    sin_tildes = ''.join(c for c in sin_tildes if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.casefold().split())
+
+
+def resolver_columnas(headers_row, alias=None):
+    """
+    Campo -> índice de columna según la tabla de alias (ALIAS_COLUMNAS por
+    defecto). Devuelve (posiciones, faltantes) con los encabezados que
+    faltan de los campos requeridos.
+    """
+    alias = alias or ALIAS_COLUMNAS
+    indices = {}
+    for idx, header in enumerate(headers_row or ()):
+        indices.setdefault(_clave_encabezado(header), idx)
+    indices.pop('', None)
+
+    posiciones = {}
+    for campo, nombres in alias.items():
+        for nombre in nombres:
+            idx = indices.get(_clave_encabezado(nombre))
+            if idx is not None:
+                posiciones[campo] = idx
+                break
+
+    faltantes = [alias.get(campo, (campo,))[0] for campo in CAMPOS_REQUERIDOS if campo not in posiciones]
+    return posiciones, faltantes
+
+
+def _celda_texto(valor):
+    """Texto de una celda; los números enteros guardados como float pierden el '.0'"""
+    if type(valor) is str:
+        return valor.strip()
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _texto(defecto=''):
+    return lambda valor: _celda_texto(valor) if valor else defecto
+
+
+def _mayusculas(defecto=''):
+    return lambda valor: _celda_texto(valor).upper() if valor else defecto
+
+
+def _sin_none(valor):
+    texto = _celda_texto(valor) if valor else ''
+    return '' if texto == 'None' else texto
+
+
+def _solo_digitos(valor):
+    return ''.join(filter(str.isdigit, _sin_none(valor)))
+
+
+def _fecha(valor):
+    return convertir_fecha_excel(valor) if valor and valor != 'None' else ''
+
+
+def _repetido(normalizar):
+    """Memoriza un normalizador de columnas con pocos valores distintos"""
+    return lru_cache(maxsize=4096)(normalizar)
+
+
+# Normalizador de cada campo (recibe el valor crudo de la celda)
+NORMALIZADORES = {
+    'primer_apellido': _mayusculas(),
+    'segundo_apellido': _mayusculas(),
+    'nombre': _mayusculas(),
+    'tipo_documento': _repetido(_texto(VALORES_POR_DEFECTO['tipo_documento'])),
+    'cedula': _solo_digitos,
+    'tipo_sangre': _repetido(_mayusculas(VALORES_POR_DEFECTO['tipo_sangre'])),
+    'nombre_programa': _repetido(_texto()),
+    'codigo_ficha': _repetido(_texto()),
+    'centro': _repetido(_texto(VALORES_POR_DEFECTO['centro'])),
+    'red_tecnologica': _repetido(_texto()),
+    'nis_archivo': _sin_none,
+    'fecha_archivo': _repetido(_fecha),
+}
+
+
+def _aplicar(normalizar, valor):
+    return normalizar(valor)
+
+
+def compilar_extractor(posiciones):
+    """
+    Función fila -> dict campo -> valor normalizado, armada una sola vez por
+    archivo con itemgetter sobre las columnas resueltas.
+    """
+    campos = list(posiciones)
+    indices = [posiciones[campo] for campo in campos]
+    normalizadores = [NORMALIZADORES[campo] for campo in campos]
+    ausentes = {campo: VALORES_POR_DEFECTO.get(campo, '')
+                for campo in NORMALIZADORES if campo not in posiciones}
+    ancho = max(indices) + 1
+    tomar = itemgetter(*indices) if len(indices) > 1 else (lambda row: (row[indices[0]],))
+
+    def extraer(row):
+        if len(row) < ancho:
+            row = tuple(row) + (None,) * (ancho - len(row))
+        valores = dict(ausentes)
+        valores.update(zip(campos, map(_aplicar, normalizadores, tomar(row))))
+        return valores
+
+    return extraer
+
+
+def parsear_fila(campos, row_idx):
+    """
+    Completa los campos extraídos de una fila (nombre completo, nivel de
+    formación y huella). Devuelve (datos, None) o (None, mensaje_error).
+    """
+    # Validar datos mínimos
+    if not (campos['primer_apellido'] and campos['nombre'] and campos['cedula']):
+        return None, f"Fila {row_idx}: Faltan datos obligatorios (Primer Apellido, Nombre, Número de documento)"
+
+    datos = dict(campos)
+
+    # Construir nombre completo
+    datos['nombre'] = f"{campos['nombre']} {campos['primer_apellido']}"
+    if campos['segundo_apellido']:
+        datos['nombre'] += f" {campos['segundo_apellido']}"
+
+    datos['nivel_formacion'] = determinar_nivel_formacion(campos['nombre_programa'])
+    datos['huella'] = calcular_huella(datos)
+    return datos, None
+
+
+def calcular_huella(datos):
+    """Hash de los campos importados, para saber si la fila cambió desde la última carga"""
+    contenido = '\x1f'.join(_campos_huella(datos))
+    return hashlib.blake2b(contenido.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def generar_codigo_unico(nombre_completo, codigos_usados):
+    """Código de carnet (iniciales + 4 dígitos) que no esté en codigos_usados, o None"""
+    iniciales = ''.join([parte[0] for parte in nombre_completo.split() if parte])[:4]
+    for _ in range(10):
+        codigo_temp = f"{iniciales}{random.randint(1000, 9999)}"
+        if codigo_temp not in codigos_usados:
+            codigos_usados.add(codigo_temp)
+            return codigo_temp
+    return None
+
+
+def cargar_cedulas_temporales(cursor, cedulas):
+    """
+    Deja `cedulas` en la tabla TEMP cedulas_importacion para cruzarlas con un JOIN.
+    La tabla queda en la conexión y se vacía antes de cada uso: un DROP al
+    terminar podía deshacerlo el rollback del pool y dejarla con filas viejas.
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS cedulas_importacion (cedula TEXT PRIMARY KEY) WITHOUT ROWID
+    """)
+    cursor.execute("DELETE FROM temp.cedulas_importacion")
+    cursor.executemany("INSERT OR IGNORE INTO temp.cedulas_importacion VALUES (?)",
+                       ((cedula,) for cedula in cedulas))
+
+
+def huellas_en_bd(cursor, cedulas):
+    """cedula -> huella de las `cedulas` que ya existen (huella None si nunca se importó)"""
+    if not cedulas:
+        return {}
+    # Un JOIN contra la tabla TEMP en lugar de un IN (?, ?, ...) con un parámetro por fila
+    cargar_cedulas_temporales(cursor, cedulas)
+    cursor.execute("""
+        SELECT e.cedula, e.huella
+        FROM temp.cedulas_importacion t
+        JOIN empleados e ON e.cedula = t.cedula
+    """)
+    return dict(cursor.fetchall())
+
+
+# =============================================
+# IMPORTACIÓN
+# =============================================
+
+def abrir_excel(fuente, extension=None, alias=None):
+    """
+    Abre el archivo (Excel, CSV u ODS; ruta o stream) y resuelve sus encabezados.
+    Devuelve (filas, extraer, error): `filas` es el generador ya posicionado
+    después del encabezado; si hay error el generador queda cerrado.
+    """
+    filas = leer_filas(fuente, extension)
+    headers_row = next(filas, None)
+    if headers_row is None:
+        filas.close()
+        return None, None, 'El archivo no contiene datos válidos'
+
+    posiciones, faltantes = resolver_columnas(headers_row, alias)
+    print(f"Columnas reconocidas: {posiciones}")
+
+    if faltantes:
+        filas.close()
+        return None, None, f'Faltan columnas requeridas: {", ".join(faltantes)}'
+
+    return filas, compilar_extractor(posiciones), None
+
+
+def filas_estimadas(fuente, extension=None):
+    """Filas de datos según la dimensión guardada en la hoja (None si no la trae)"""
+    extension = extension_de(fuente, extension)
+    if extension == '.csv':
+        # Cuenta saltos de línea por bloques, sin decodificar
+        with abrir_binario(fuente) as archivo:
+            lineas = sum(bloque.count(b'\n') for bloque in iter(lambda: archivo.read(1 << 20), b''))
+        return max(lineas - 1, 0)
+    if extension != '.xlsx' and extension != '.xlsm':
+        return None
+
+    with abrir_binario(fuente) as archivo:
+        workbook = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            max_row = workbook.active.max_row
+            return max_row - 1 if max_row else None
+        finally:
+            workbook.close()
+
+
+def nuevo_progreso(creados=0, actualizados=0, sin_cambios=0, errores=0, detalles=None):
+    """Contadores acumulados de una importación"""
+    return {
+        'creados': creados,
+        'actualizados': actualizados,
+        'sin_cambios': sin_cambios,
+        'errores': errores,
+        'detalles': list(detalles or []),
+        'hubo_filas': False,
+    }
+
+
+def _registrar_error(progreso, mensaje):
+    progreso['errores'] += 1
+    if len(progreso['detalles']) < 10:  # Máximo 10 errores para mostrar
+        progreso['detalles'].append(mensaje)
+
+
+def filas_validas(lote, extraer, progreso):
+    """
+    Recorre un lote de filas (row_idx, row) y devuelve (row_idx, datos) de
+    las que pasan la validación; las demás quedan registradas como error.
+    """
+    for row_idx, row in lote:
+        # Saltar filas vacías o sin número de documento
+        if not any(row):
+            continue
+        progreso['hubo_filas'] = True
+
+        try:
+            campos = extraer(row)
+            if not campos['cedula']:
+                continue
+
+            if len(campos['cedula']) < 7:
+                _registrar_error(progreso, f"Fila {row_idx}: Número de documento inválido")
+                continue
+
+            datos, error = parsear_fila(campos, row_idx)
+            if error:
+                _registrar_error(progreso, error)
+                continue
+
+        except Exception as e:
+            error_msg = f"Fila {row_idx}: Error - {str(e)}"
+            _registrar_error(progreso, error_msg)
+            print(error_msg)
+            continue
+
+        yield row_idx, datos
+
+
+def procesar_lote(cursor, lote, extraer, progreso, codigos_usados, huellas_importadas, hoy):
+    """
+    Valida un lote de filas (row_idx, row), lo compara por huella con la base
+    y escribe solo lo nuevo o cambiado. `huellas_importadas` (cedula -> huella)
+    recuerda lo escrito en esta misma carga, por si una cédula se repite.
+    """
+    validas = list(filas_validas(lote, extraer, progreso))
+    huellas_actuales = huellas_en_bd(cursor, {datos['cedula'] for _, datos in validas})
+
+    filas_insertar = []
+    filas_actualizar = []
+    for row_idx, datos in validas:
+        numero_documento = datos['cedula']
+        if numero_documento in huellas_importadas:
+            existe, huella_actual = True, huellas_importadas[numero_documento]
+        else:
+            existe = numero_documento in huellas_actuales
+            huella_actual = huellas_actuales.get(numero_documento)
+
+        if existe and huella_actual == datos['huella']:
+            progreso['sin_cambios'] += 1
+            continue
+
+        if existe:
+            filas_actualizar.append((
+                datos['nombre'], datos['tipo_documento'], datos['tipo_sangre'],
+                datos['fecha_archivo'], datos['nis_archivo'],
+                datos['primer_apellido'], datos['segundo_apellido'],
+                datos['nombre_programa'], datos['codigo_ficha'], datos['centro'],
+                datos['nivel_formacion'], datos['red_tecnologica'],
+                datos['huella'], numero_documento
+            ))
+            progreso['actualizados'] += 1
+        else:
+            codigo_generado = generar_codigo_unico(datos['nombre'], codigos_usados)
+            if not codigo_generado:
+                _registrar_error(progreso, f"Fila {row_idx}: No se pudo generar código único")
+                continue
+
+            # Si no se encontró fecha, usar fecha por defecto (1 año desde hoy)
+            fecha_finalizacion = datos['fecha_archivo'] or \
+                (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d")
+            filas_insertar.append((
+                datos['nombre'], numero_documento, datos['tipo_documento'],
+                'APRENDIZ', codigo_generado, hoy,
+                fecha_finalizacion, datos['tipo_sangre'], None,
+                datos['nis_archivo'] or generar_nis_automatico(),
+                datos['primer_apellido'], datos['segundo_apellido'],
+                datos['nombre_programa'], datos['codigo_ficha'], datos['centro'],
+                datos['nivel_formacion'], datos['red_tecnologica'], datos['huella']
+            ))
+            progreso['creados'] += 1
+
+        huellas_importadas[numero_documento] = datos['huella']
+
+    # Primero los nuevos: una cédula repetida más abajo en el lote se actualiza después
+    cursor.executemany(SQL_INSERTAR_APRENDIZ, filas_insertar)
+    cursor.executemany(SQL_ACTUALIZAR_APRENDIZ, filas_actualizar)
+
+
+def codigos_existentes(cursor):
+    return {fila[0] for fila in cursor.execute(
+        "SELECT codigo FROM empleados WHERE codigo IS NOT NULL")}
+
+
+def resultado_exitoso(progreso):
+    """Dict de resultado que muestran las pantallas de carga"""
+    print(f"=== CARGA COMPLETADA ===")
+    print(f"Nuevos: {progreso['creados']}")
+    print(f"Actualizados: {progreso['actualizados']}")
+    print(f"Sin cambios: {progreso['sin_cambios']}")
+    print(f"Errores: {progreso['errores']}")
+
+    return {
+        'success': True,
+        'created': progreso['creados'],
+        'updated': progreso['actualizados'],
+        'unchanged': progreso['sin_cambios'],
+        'errors': progreso['errores'],
+        'error_details': progreso['detalles'],
+        'message': f'✅ Carga exitosa del SENA: {progreso["creados"]} aprendices nuevos, '
+                   f'{progreso["actualizados"]} actualizados, {progreso["sin_cambios"]} sin cambios.'
+    }
+
+
+def importar_excel_por_lotes(fuente, progreso, filas_ya_procesadas=0, al_confirmar_lote=None, extension=None,
+                             alias=None):
+    """
+    Importa confirmando (commit) cada lote, para trabajos en segundo plano.
+    Retoma después de `filas_ya_procesadas` filas de datos. Antes de cada
+    commit llama `al_confirmar_lote(cursor, filas_procesadas, progreso)` para
+    que el avance quede guardado en la misma transacción que los datos.
+    Al retomar, las filas ya escritas se reconocen por su huella.
+    `alias` es la tabla de encabezados (ALIAS_COLUMNAS por defecto).
+    """
+    filas, extraer, error = abrir_excel(fuente, extension, alias)
+    if error:
+        raise ValueError(error)
+
+    conn = obtener_conexion()
+    cursor = conn.cursor()
+    try:
+        huellas_importadas = {}
+        codigos_usados = codigos_existentes(cursor)
+        hoy = date.today().strftime("%Y-%m-%d")
+        filas_procesadas = filas_ya_procesadas
+
+        pendientes = islice(enumerate(filas, start=2), filas_ya_procesadas, None)
+        for lote in en_lotes(pendientes):
+            try:
+                procesar_lote(cursor, lote, extraer, progreso, codigos_usados, huellas_importadas, hoy)
+                filas_procesadas += len(lote)
+                if al_confirmar_lote:
+                    al_confirmar_lote(cursor, filas_procesadas, progreso)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        if not filas_procesadas and not progreso['hubo_filas']:
+            raise ValueError('El archivo no contiene datos válidos')
+
+        return filas_procesadas
+    finally:
+        filas.close()
+
+
+# =============================================
+# VISTA PREVIA (SIN ESCRIBIR)
+# =============================================
+
+# Columna de empleados -> campo de parsear_fila que la alimenta
+CAMPOS_COMPARADOS = {
+    'nombre': 'nombre',
+    'tipo_documento': 'tipo_documento',
+    'tipo_sangre': 'tipo_sangre',
+    'fecha_vencimiento': 'fecha_archivo',
+    'nis': 'nis_archivo',
+    'primer_apellido': 'primer_apellido',
+    'segundo_apellido': 'segundo_apellido',
+    'nombre_programa': 'nombre_programa',
+    'codigo_ficha': 'codigo_ficha',
+    'centro': 'centro',
+    'nivel_formacion': 'nivel_formacion',
+    'red_tecnologica': 'red_tecnologica',
+}
+
+# Columnas que la importación solo reemplaza si el archivo trae valor
+CAMPOS_OPCIONALES = ('fecha_vencimiento', 'nis')
+
+MUESTRA_CAMBIOS = 20
+
+
+def simular_importacion(fuente, extension=None, muestra=MUESTRA_CAMBIOS, alias=None):
+    """
+    Vista previa de una importación: cuántas filas serían nuevas, cambiadas,
+    sin cambios o con error, y una muestra de los campos que cambiarían.
+    Las filas se cargan en una tabla TEMP (que nunca se confirma) y se
+    comparan con empleados en un solo JOIN; no se escribe nada en la base.
+    """
+    filas, extraer, error = abrir_excel(fuente, extension, alias)
+    if error:
+        return {'success': False, 'message': error}
+
+    columnas = list(CAMPOS_COMPARADOS)
+    conn = obtener_conexion()
+    cursor = conn.cursor()
+    progreso = nuevo_progreso()
+    filas_leidas = 0
+    try:
+        # La tabla queda en la conexión para la próxima vista previa; solo se vacían las filas.
+        # Un DROP dentro de la transacción lo desharía el rollback del pool.
+        cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS importacion_previa (
+                cedula TEXT PRIMARY KEY, fila INTEGER, huella TEXT, {', '.join(columnas)}
+            )
+        """)
+        cursor.execute("DELETE FROM temp.importacion_previa")
+        # Si la cédula se repite en el archivo, prevalece la última fila (como al importar)
+        sql_insertar = f"INSERT OR REPLACE INTO temp.importacion_previa VALUES ({', '.join('?' * (len(columnas) + 3))})"
+        for lote in en_lotes(enumerate(filas, start=2)):
+            validas = list(filas_validas(lote, extraer, progreso))
+            filas_leidas += len(validas)
+            cursor.executemany(sql_insertar, [
+                (datos['cedula'], row_idx, datos['huella'],
+                 *(datos[CAMPOS_COMPARADOS[col]] for col in columnas))
+                for row_idx, datos in validas
+            ])
+
+        if not progreso['hubo_filas']:
+            return {'success': False, 'message': 'El archivo no contiene datos válidos'}
+
+        cambios = []
+        cursor.execute(f"""
+            SELECT p.cedula, p.fila, e.id IS NULL, p.huella IS e.huella,
+                   {', '.join('p.' + col for col in columnas)},
+                   {', '.join('e.' + col for col in columnas)}
+            FROM temp.importacion_previa p
+            LEFT JOIN empleados e ON e.cedula = p.cedula
+            ORDER BY p.fila
+        """)
+        for fila in cursor:
+            cedula, row_idx, es_nueva, igual = fila[:4]
+            if es_nueva:
+                progreso['creados'] += 1
+                continue
+            if igual:
+                progreso['sin_cambios'] += 1
+                continue
+
+            progreso['actualizados'] += 1
+            if len(cambios) >= muestra:
+                continue
+            nuevos = fila[4:4 + len(columnas)]
+            actuales = fila[4 + len(columnas):]
+            campos = {
+                col: {'actual': actual, 'nuevo': nuevo}
+                for col, nuevo, actual in zip(columnas, nuevos, actuales)
+                if (actual or '') != (nuevo or '') and not (col in CAMPOS_OPCIONALES and not nuevo)
+            }
+            # Filas sin huella previa se reescriben una vez aunque no cambien campos
+            if campos:
+                cambios.append({'fila': row_idx, 'cedula': cedula, 'campos': campos})
+
+    finally:
+        # Nada de la vista previa se confirma: el rollback descarta las filas cargadas
+        conn.rollback()
+        filas.close()
+
+    repetidas = filas_leidas - (progreso['creados'] + progreso['actualizados'] + progreso['sin_cambios'])
+    print(f"🔍 Vista previa: {progreso['creados']} nuevos, {progreso['actualizados']} con cambios, "
+          f"{progreso['sin_cambios']} sin cambios, {progreso['errores']} errores")
+
+    return {
+        'success': True,
+        'simulacion': True,
+        'created': progreso['creados'],
+        'updated': progreso['actualizados'],
+        'unchanged': progreso['sin_cambios'],
+        'repeated': repetidas,
+        'errors': progreso['errores'],
+        'error_details': progreso['detalles'],
+        'changes': cambios,
+        'message': f'🔍 Vista previa: {progreso["creados"]} aprendices nuevos, '
+                   f'{progreso["actualizados"]} con cambios, {progreso["sin_cambios"]} sin cambios. '
+                   f'No se guardó ningún dato.'
+    }
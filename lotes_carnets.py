@@ -0,0 +1,195 @@
+import json
+import multiprocessing
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from conexion_db import obtener_conexion
+from imagen import preparar_proceso_render, renderizar_en_proceso
+
+# ============================================
+# GENERACIÓN DE CARNETS POR LOTES
+# crear_lote registra el lote en lotes_carnets y devuelve su id; un hilo
+# del proceso web reparte los aprendices en un pool de procesos y anota
+# en la fila cada carnet terminado o fallido. El pool se crea con el
+# primer lote del proceso; sus procesos se preparan una sola vez
+# (imagen.preparar_proceso_render) y se reutilizan entre lotes, así que
+# un lote solo paga el dibujo.
+# ============================================
+
+# Procesos de render por proceso web (con gunicorn se multiplica por los
+# workers): variable de entorno PROCESOS_RENDER o la mitad de los núcleos
+PROCESOS_RENDER = int(os.environ.get('PROCESOS_RENDER') or max(1, (os.cpu_count() or 1) // 2))
+
+# La ficha se ve con su reverso compartido: el lote solo escribe anverso y combinado
+SALIDAS_LOTE = ('anverso', 'completo')
+
+# Un lote 'procesando' sin latido en este tiempo quedó huérfano (proceso reiniciado)
+LATIDO_VENCIDO_SEGUNDOS = 120
+# Cada cuánto se renueva el latido aunque ningún carnet haya terminado
+INTERVALO_LATIDO_SEGUNDOS = 15
+
+ESTADOS_TERMINADOS = ('completado', 'error')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def crear_tabla_lotes(conn):
+    """Tabla de lotes de carnets. Se ejecuta como migración (migraciones.py)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lotes_carnets (
+            id TEXT PRIMARY KEY,
+            codigo_ficha TEXT,
+            estado TEXT NOT NULL DEFAULT 'procesando',
+            total INTEGER NOT NULL DEFAULT 0,
+            generados INTEGER NOT NULL DEFAULT 0,
+            errores INTEGER NOT NULL DEFAULT 0,
+            error_detalles TEXT,
+            mensaje TEXT,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            latido TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# =============================================
+# API DEL MÓDULO
+# =============================================
+
+def crear_lote(codigo_ficha, aprendices, salidas=SALIDAS_LOTE):
+    """
+    Registra el lote y empieza a generar los carnets en segundo plano.
+    Devuelve el id para consultar el avance con obtener_lote.
+    """
+    lote_id = uuid.uuid4().hex
+    tareas = [aprendiz.a_dict() if hasattr(aprendiz, 'a_dict') else dict(aprendiz)
+              for aprendiz in aprendices]
+
+    conn = obtener_conexion()
+    conn.execute("INSERT INTO lotes_carnets (id, codigo_ficha, total) VALUES (?, ?, ?)",
+                 (lote_id, codigo_ficha, len(tareas)))
+    conn.commit()
+
+    print(f"🪪 Lote {lote_id} creado: {len(tareas)} carnets de la ficha {codigo_ficha}")
+    threading.Thread(target=_ejecutar, args=(lote_id, tareas, salidas),
+                     name=f'lote-{lote_id[:8]}', daemon=True).start()
+    return lote_id
+
+
+def obtener_lote(lote_id):
+    """Avance del lote, con el detalle de cada carnet que falló, o None"""
+    conn = obtener_conexion()
+    fila = conn.execute("""
+        SELECT id, codigo_ficha, estado, total, generados, errores, error_detalles, mensaje,
+               latido < datetime('now', ?)
+        FROM lotes_carnets WHERE id = ?
+    """, (f'-{LATIDO_VENCIDO_SEGUNDOS} seconds', lote_id)).fetchone()
+    if not fila:
+        return None
+
+    estado, mensaje = fila[2], fila[7]
+    if estado == 'procesando' and fila[8]:
+        estado, mensaje = 'error', 'El lote se interrumpió antes de terminar'
+    return {
+        'success': estado != 'error',
+        'job_id': fila[0],
+        'ficha': fila[1],
+        'estado': estado,
+        'terminado': estado in ESTADOS_TERMINADOS,
+        'total': fila[3],
+        'generados': fila[4],
+        'errors': fila[5],
+        'error_details': json.loads(fila[6]) if fila[6] else [],
+        'message': mensaje or f'Generando carnets... {fila[4] + fila[5]}/{fila[3]}',
+    }
+
+
+# =============================================
+# POOL DE PROCESOS
+# =============================================
+
+def _contexto():
+    """
+    forkserver: los procesos no heredan los hilos ni las conexiones del
+    servidor web. El servidor de forks precarga solo imagen, no el módulo
+    principal (app.py no arranca la aplicación al importarse como __mp_main__).
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    contexto = multiprocessing.get_context('forkserver')
+    contexto.set_forkserver_preload(['imagen'])
+    return contexto
+
+
+def _obtener_pool():
+    """Crea el pool si no existe en este proceso (gunicorn hace fork)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool_pid = os.getpid()
+            _pool = ProcessPoolExecutor(max_workers=PROCESOS_RENDER, mp_context=_contexto(),
+                                        initializer=preparar_proceso_render)
+            print(f"🧵 Pool de render con {PROCESOS_RENDER} procesos")
+        return _pool
+
+
+def _descartar_pool(pool):
+    """Un proceso del pool murió: el próximo lote arranca uno nuevo"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# =============================================
+# HILO DEL LOTE
+# =============================================
+
+def _ejecutar(lote_id, tareas, salidas):
+    conn = obtener_conexion()
+    generados, detalles = 0, []
+
+    def guardar_avance(estado='procesando', mensaje=None):
+        conn.execute("""
+            UPDATE lotes_carnets SET
+                estado = ?, generados = ?, errores = ?, error_detalles = ?, mensaje = ?,
+                latido = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (estado, generados, len(detalles), json.dumps(detalles, ensure_ascii=False),
+              mensaje, lote_id))
+        conn.commit()
+
+    try:
+        pool = _obtener_pool()
+        futuros = {pool.submit(renderizar_en_proceso, aprendiz, salidas): aprendiz for aprendiz in tareas}
+        pendientes = set(futuros)
+        while pendientes:
+            terminados, pendientes = wait(pendientes, timeout=INTERVALO_LATIDO_SEGUNDOS,
+                                          return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                aprendiz = futuros[futuro]
+                try:
+                    futuro.result()
+                    generados += 1
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        _descartar_pool(pool)
+                    print(f"Error generando carnet para {aprendiz['nombre']}: {e}")
+                    detalles.append({'cedula': aprendiz['cedula'], 'nombre': aprendiz['nombre'], 'error': str(e)})
+            # También sin carnets terminados: el latido muestra que el lote sigue vivo
+            guardar_avance()
+
+        guardar_avance('completado', f'{generados} carnets generados exitosamente, {len(detalles)} errores')
+        print(f"✅ Lote {lote_id}: {generados}/{len(tareas)} carnets generados")
+
+    except Exception as e:
+        print(f"❌ Error en lote de carnets {lote_id}: {e}")
+        traceback.print_exc()
+        guardar_avance('error', f'Error al generar carnets: {str(e)}')
+
@@ -0,0 +1,177 @@
+from conexion_db import abrir_conexion
+from busqueda import crear_indice_busqueda
+from contadores import crear_contadores, crear_version_datos
+from catalogos import crear_catalogos
+from lotes_carnets import crear_tabla_lotes
+from trabajos_importacion import agregar_extension, agregar_sin_cambios, crear_tabla_trabajos, quitar_contenido
+
+# ============================================
+# MIGRACIONES DE ESQUEMA
+# Cada migración se aplica una sola vez y queda registrada en
+# PRAGMA user_version. Si la base ya está al día el arranque solo
+# lee ese número; si no, BEGIN IMMEDIATE hace que un único worker
+# de gunicorn aplique los cambios mientras los demás esperan.
+# ============================================
+
+# Espera máxima por el lock de migración (otro worker migrando)
+ESPERA_LOCK_MS = 120000
+
+COLUMNAS_EMPLEADOS = (
+    ('nombre', 'TEXT NOT NULL'),
+    ('cedula', 'TEXT UNIQUE NOT NULL'),
+    ('tipo_documento', "TEXT DEFAULT 'CC'"),
+    ('cargo', "TEXT DEFAULT 'APRENDIZ'"),
+    ('codigo', 'TEXT UNIQUE'),
+    ('fecha_emision', 'TEXT'),
+    ('fecha_vencimiento', 'TEXT'),
+    ('tipo_sangre', 'TEXT'),
+    ('foto', 'TEXT'),
+    ('nis', 'TEXT'),
+    ('primer_apellido', 'TEXT'),
+    ('segundo_apellido', 'TEXT'),
+    ('nombre_programa', 'TEXT'),
+    ('codigo_ficha', 'TEXT'),
+    ('centro', 'TEXT'),
+    ('nivel_formacion', "TEXT DEFAULT 'Técnico'"),
+    ('red_tecnologica', 'TEXT'),
+    ('created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+    ('updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+)
+
+# Columnas que ALTER TABLE no puede agregar tal cual (default no constante)
+TIPO_AL_AGREGAR = {
+    'created_at': 'TIMESTAMP',
+    'updated_at': 'TIMESTAMP',
+}
+
+
+def _crear_empleados(cursor):
+    """Tabla empleados completa; en bases antiguas agrega las columnas que falten"""
+    definicion = ',\n'.join(f'    {col} {tipo}' for col, tipo in COLUMNAS_EMPLEADOS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS empleados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        {definicion}
+        )
+    """)
+
+    cursor.execute("PRAGMA table_info(empleados)")
+    existentes = {fila[1] for fila in cursor.fetchall()}
+    for columna, tipo in COLUMNAS_EMPLEADOS:
+        if columna not in existentes:
+            tipo = TIPO_AL_AGREGAR.get(columna, tipo)
+            cursor.execute(f'ALTER TABLE empleados ADD COLUMN {columna} {tipo}')
+            print(f"✅ Columna agregada: {columna}")
+
+
+def _crear_indices(cursor):
+    """Índices de búsqueda y ordenamiento"""
+    indices = [
+        "CREATE INDEX IF NOT EXISTS idx_cedula ON empleados(cedula)",
+        "CREATE INDEX IF NOT EXISTS idx_codigo ON empleados(codigo)",
+        "CREATE INDEX IF NOT EXISTS idx_nombre_programa ON empleados(nombre_programa)",
+        "CREATE INDEX IF NOT EXISTS idx_codigo_ficha ON empleados(codigo_ficha)",
+        "CREATE INDEX IF NOT EXISTS idx_fecha_emision ON empleados(fecha_emision)",
+        "CREATE INDEX IF NOT EXISTS idx_nombre_cedula ON empleados(nombre, cedula)",
+    ]
+    for indice in indices:
+        cursor.execute(indice)
+
+
+def _crear_busqueda(cursor):
+    crear_indice_busqueda(cursor.connection)
+
+
+def _crear_contadores(cursor):
+    crear_contadores(cursor.connection)
+
+
+def _crear_catalogos(cursor):
+    crear_catalogos(cursor.connection)
+
+
+def _crear_trabajos_importacion(cursor):
+    crear_tabla_trabajos(cursor.connection)
+
+
+def _agregar_huellas(cursor):
+    """Huella de importación por aprendiz (NULL hasta la próxima carga que lo incluya)"""
+    cursor.execute("PRAGMA table_info(empleados)")
+    if 'huella' not in {fila[1] for fila in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE empleados ADD COLUMN huella TEXT")
+    agregar_sin_cambios(cursor.connection)
+
+
+def _agregar_extension_trabajos(cursor):
+    agregar_extension(cursor.connection)
+
+
+def _crear_version_datos(cursor):
+    crear_version_datos(cursor.connection)
+
+
+def _crear_lotes_carnets(cursor):
+    crear_tabla_lotes(cursor.connection)
+
+
+def _quitar_contenido_trabajos(cursor):
+    quitar_contenido(cursor.connection)
+
+
+# (versión, descripción, función). Nunca renumerar: solo agregar al final.
+MIGRACIONES = [
+    (1, "tabla empleados con columnas SENA", _crear_empleados),
+    (2, "índices de empleados", _crear_indices),
+    (3, "índice de texto completo empleados_fts", _crear_busqueda),
+    (4, "contadores del dashboard", _crear_contadores),
+    (5, "catálogos de programas y fichas", _crear_catalogos),
+    (6, "trabajos de importación en segundo plano", _crear_trabajos_importacion),
+    (7, "huellas para importación incremental", _agregar_huellas),
+    (8, "extensión del archivo en los trabajos de importación", _agregar_extension_trabajos),
+    (9, "versión de los datos para la caché de exportaciones", _crear_version_datos),
+    (10, "lotes de generación de carnets", _crear_lotes_carnets),
+    (11, "archivos de importación fuera de la BD", _quitar_contenido_trabajos),
+]
+
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+def version_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar_migraciones(ruta=None):
+    """
+    Lleva la base de datos a VERSION_ACTUAL.
+    Cada migración corre en su propia transacción junto con el cambio
+    de user_version, así que un fallo no deja la versión adelantada.
+    """
+    conn = abrir_conexion(ruta)
+    try:
+        if version_esquema(conn) >= VERSION_ACTUAL:
+            return True
+
+        conn.execute(f"PRAGMA busy_timeout = {ESPERA_LOCK_MS}")
+        for version, descripcion, migrar in MIGRACIONES:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Otro worker pudo haberla aplicado mientras esperábamos el lock
+                if version_esquema(conn) >= version:
+                    conn.rollback()
+                    continue
+                print(f"🔧 Migración {version}: {descripcion}")
+                migrar(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        print(f"✅ Esquema de base de datos en versión {VERSION_ACTUAL}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error aplicando migraciones: {e}")
+        return False
+    finally:
+        conn.close()
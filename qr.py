@@ -1,23 +1,15 @@
 import qrcode
-import os
 
-def generar_qr(cedula):
-    enlace = "https://oferta.senasofiaplus.edu.co/sofia-oferta/inicio-sofia-plus.html"
-    nombre_archivo = f"{cedula}.png"
-    ruta = os.path.join("static", "qr", nombre_archivo)
+ENLACE_QR = "https://oferta.senasofiaplus.edu.co/sofia-oferta/inicio-sofia-plus.html"
 
-    # Eliminar QR viejo si existe
-    if os.path.exists(ruta):
-        os.remove(ruta)
 
+def imagen_qr():
+    """QR del carnet (ENLACE_QR, el mismo para todos) como imagen PIL, sin pasar por disco"""
     qr = qrcode.QRCode(
         version=1,
         box_size=10,
         border=4
     )
-    qr.add_data(enlace)
+    qr.add_data(ENLACE_QR)
     qr.make(fit=True)
-
-    imagen = qr.make_image(fill="black", back_color="white")
-    imagen.save(ruta)
-    return ruta
\ No newline at end of file
+    return qr.make_image(fill="black", back_color="white").get_image()
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conexion_db
+from migraciones import aplicar_migraciones
+
+
+@pytest.fixture
+def bd(tmp_path, monkeypatch):
+    """Base de datos nueva y migrada en un directorio temporal; devuelve la conexión del hilo"""
+    monkeypatch.chdir(tmp_path)
+    ruta = str(tmp_path / 'carnet.db')
+    monkeypatch.setattr(conexion_db, 'DB_PATH', ruta)
+    conexion_db._hilo.__dict__.clear()
+    assert aplicar_migraciones(ruta)
+    conn = conexion_db.obtener_conexion()
+    yield conn
+    conn.close()
+    conexion_db._hilo.__dict__.clear()
+
+
+def insertar_empleado(conn, cedula, **campos):
+    """Inserta un aprendiz con valores mínimos; `campos` reemplaza columnas"""
+    fila = {'nombre': f'APRENDIZ {cedula}', 'cedula': cedula, 'codigo': f'COD{cedula}'}
+    fila.update(campos)
+    columnas = ', '.join(fila)
+    marcas = ', '.join('?' for _ in fila)
+    conn.execute(f"INSERT INTO empleados ({columnas}) VALUES ({marcas})", tuple(fila.values()))
+    conn.commit()
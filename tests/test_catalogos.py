@@ -0,0 +1,71 @@
+import sqlite3
+
+from conftest import insertar_empleado
+from migraciones import aplicar_migraciones
+
+
+def ids_de(conn, cedula):
+    return conn.execute("""
+        SELECT p.nombre, f.codigo
+        FROM empleados e
+        LEFT JOIN programas p ON p.id = e.programa_id
+        LEFT JOIN fichas f ON f.id = e.ficha_id
+        WHERE e.cedula = ?
+    """, (cedula,)).fetchone()
+
+
+def test_insert_registra_programa_y_ficha(bd):
+    insertar_empleado(bd, '1', nombre_programa='Sistemas', codigo_ficha='100', centro='CBI')
+    insertar_empleado(bd, '2', nombre_programa='Sistemas', codigo_ficha='100')
+
+    assert bd.execute("SELECT COUNT(*) FROM programas").fetchone() == (1,)
+    assert bd.execute("""
+        SELECT f.codigo, p.nombre, f.centro FROM fichas f JOIN programas p ON p.id = f.programa_id
+    """).fetchall() == [('100', 'Sistemas', 'CBI')]
+    assert ids_de(bd, '1') == ids_de(bd, '2') == ('Sistemas', '100')
+
+
+def test_sin_programa_ni_ficha_no_crea_catalogo(bd):
+    insertar_empleado(bd, '1', nombre_programa='', codigo_ficha=None)
+    assert bd.execute("SELECT COUNT(*) FROM programas").fetchone() == (0,)
+    assert bd.execute("SELECT COUNT(*) FROM fichas").fetchone() == (0,)
+    assert ids_de(bd, '1') == (None, None)
+
+
+def test_update_de_ficha_cambia_la_referencia(bd):
+    insertar_empleado(bd, '1', nombre_programa='Sistemas', codigo_ficha='100')
+    bd.execute("UPDATE empleados SET codigo_ficha = '200', nombre_programa = 'Cocina' WHERE cedula = '1'")
+    bd.commit()
+    assert ids_de(bd, '1') == ('Cocina', '200')
+
+
+def test_migracion_llena_catalogos_con_filas_existentes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ruta = str(tmp_path / 'carnet.db')
+    conn = sqlite3.connect(ruta)
+    conn.execute("""
+        CREATE TABLE empleados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, cedula TEXT UNIQUE NOT NULL,
+            codigo TEXT UNIQUE, nombre_programa TEXT, codigo_ficha TEXT, centro TEXT, nivel_formacion TEXT
+        )
+    """)
+    conn.executemany("""
+        INSERT INTO empleados (nombre, cedula, nombre_programa, codigo_ficha, centro, nivel_formacion)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        ('A', '1', 'Sistemas', '100', 'CBI', 'Técnico'),
+        ('B', '2', 'Sistemas', '101', 'CBI', 'Técnico'),
+        ('C', '3', 'Cocina', '200', 'CTA', 'Tecnólogo'),
+        ('D', '4', None, None, None, None),
+    ])
+    conn.commit()
+    conn.close()
+
+    assert aplicar_migraciones(ruta)
+    conn = sqlite3.connect(ruta)
+    assert conn.execute("SELECT nombre, nivel_formacion FROM programas ORDER BY nombre").fetchall() == [
+        ('Cocina', 'Tecnólogo'), ('Sistemas', 'Técnico')]
+    assert conn.execute("SELECT COUNT(*) FROM fichas").fetchone() == (3,)
+    assert ids_de(conn, '2') == ('Sistemas', '101')
+    assert ids_de(conn, '4') == (None, None)
+    conn.close()
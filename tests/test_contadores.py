@@ -0,0 +1,53 @@
+from conftest import insertar_empleado
+from contadores import distribucion, leer_contador, recalcular_contadores
+
+
+def contadores(conn):
+    return conn.execute(
+        "SELECT dimension, clave, total FROM contadores WHERE total != 0 ORDER BY 1, 2").fetchall()
+
+
+def test_insert_suma_en_cada_dimension(bd):
+    insertar_empleado(bd, '1', nombre_programa='Sistemas', codigo_ficha='100', foto='1.jpg')
+    insertar_empleado(bd, '2', nombre_programa='Sistemas', codigo_ficha='100')
+    insertar_empleado(bd, '3', nombre_programa='Cocina', codigo_ficha='200', nivel_formacion='Tecnólogo')
+
+    assert leer_contador(bd, 'total') == 3
+    assert leer_contador(bd, 'con_foto') == 1
+    assert distribucion(bd, 'programa') == [('Sistemas', 2), ('Cocina', 1)]
+    assert leer_contador(bd, 'ficha', '200') == 1
+    assert leer_contador(bd, 'nivel', 'Técnico') == 2
+
+
+def test_update_mueve_el_conteo(bd):
+    insertar_empleado(bd, '1', nombre_programa='Sistemas')
+    bd.execute("UPDATE empleados SET nombre_programa = 'Cocina', foto = 'f.jpg' WHERE cedula = '1'")
+    bd.commit()
+
+    assert leer_contador(bd, 'total') == 1
+    assert leer_contador(bd, 'con_foto') == 1
+    assert leer_contador(bd, 'programa', 'Sistemas') == 0
+    assert leer_contador(bd, 'programa', 'Cocina') == 1
+
+
+def test_delete_resta(bd):
+    insertar_empleado(bd, '1', foto='f.jpg')
+    insertar_empleado(bd, '2')
+    bd.execute("DELETE FROM empleados WHERE cedula = '1'")
+    bd.commit()
+
+    assert leer_contador(bd, 'total') == 1
+    assert leer_contador(bd, 'con_foto') == 0
+
+
+def test_triggers_coinciden_con_recalcular(bd):
+    for cedula, programa in (('1', 'Sistemas'), ('2', 'Cocina'), ('3', None), ('4', 'Sistemas')):
+        insertar_empleado(bd, cedula, nombre_programa=programa, codigo_ficha=cedula)
+    bd.execute("UPDATE empleados SET codigo_ficha = '9', foto = 'x.jpg' WHERE cedula IN ('2', '3')")
+    bd.execute("DELETE FROM empleados WHERE cedula = '4'")
+    bd.commit()
+    por_triggers = contadores(bd)
+
+    recalcular_contadores(bd)
+    bd.commit()
+    assert contadores(bd) == por_triggers
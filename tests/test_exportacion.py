@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+import os
+
+from openpyxl import load_workbook
+
+import exportacion
+from aprendiz import COLUMNAS_APRENDIZ
+from conftest import insertar_empleado
+from contadores import leer_version_datos
+from exportacion import (
+    ENCABEZADOS_PLANTILLA, FILAS_EJEMPLO, FILAS_POR_BLOQUE, HOJA_PLANTILLA, bloques_csv, bloques_jsonl,
+    bloques_plantilla, bloques_xlsx, buscar_en_cache, clave_exportacion, cursor_exportacion,
+    guardar_en_cache, se_guarda_en_cache,
+)
+from importador_sena import importar_excel_por_lotes, nuevo_progreso
+
+
+def leer_xlsx(bloques):
+    libro = load_workbook(io.BytesIO(b''.join(bloques)), read_only=True)
+    return libro.sheetnames, list(libro.active.iter_rows(values_only=True))
+
+
+# =============================================
+# PLANTILLA XLSX
+# =============================================
+
+def test_xlsx_se_entrega_por_bloques():
+    filas = [(str(i), f'APELLIDO {i}') for i in range(FILAS_POR_BLOQUE * 3)]
+    bloques = list(bloques_xlsx(filas, encabezados=('NIS', 'Primer Apellido')))
+    assert len(bloques) > 1
+
+    hojas, leidas = leer_xlsx(bloques)
+    assert hojas == [HOJA_PLANTILLA]
+    assert leidas[0] == ('NIS', 'Primer Apellido')
+    assert leidas[1:] == filas
+
+
+def test_xlsx_valores():
+    _, leidas = leer_xlsx(bloques_xlsx([('<a> & "b"', None, 7, 2.5, 'con\x01control', ' espacios ')],
+                                       encabezados=tuple('ABCDEF')))
+    assert leidas[1] == ('<a> & "b"', None, 7, 2.5, 'concontrol', ' espacios ')
+
+
+def test_plantilla_sin_aprendices_usa_filas_de_ejemplo(bd):
+    _, leidas = leer_xlsx(bloques_plantilla(bd, 0))
+    assert leidas == [ENCABEZADOS_PLANTILLA, *FILAS_EJEMPLO]
+
+
+def test_plantilla_con_aprendices_se_puede_volver_a_importar(bd):
+    insertar_empleado(bd, '10000001', nombre='ANA PEREZ LOPEZ', tipo_documento='CC',
+                      nombre_programa='Sistemas', codigo_ficha='100')
+    insertar_empleado(bd, '10000002', nombre='LUIS GOMEZ', tipo_documento='TI')
+    _, leidas = leer_xlsx(bloques_plantilla(bd, 2))
+    assert [fila[1:6] for fila in leidas[1:]] == [
+        ('PEREZ', 'LOPEZ', 'ANA', 'CC', '10000001'),
+        ('GOMEZ', None, 'LUIS', 'TI', '10000002'),
+    ]
+
+    # Mismos encabezados que el importador: cada fila se reconoce como un aprendiz existente
+    progreso = nuevo_progreso()
+    importar_excel_por_lotes(io.BytesIO(b''.join(bloques_plantilla(bd, 2))), progreso, extension='.xlsx')
+    assert (progreso['creados'], progreso['errores']) == (0, 0)
+    assert progreso['actualizados'] + progreso['sin_cambios'] == 2
+
+
+# =============================================
+# CSV / JSON LINES
+# =============================================
+
+def llenar(conn):
+    insertar_empleado(conn, '1', nombre='ANA', nombre_programa='Sistemas', codigo_ficha='100', foto='a.jpg')
+    insertar_empleado(conn, '2', nombre='LUIS', nombre_programa='Sistemas', codigo_ficha='200')
+    insertar_empleado(conn, '3', nombre='EVA', nombre_programa='Cocina', codigo_ficha='300',
+                      nivel_formacion='Tecnólogo')
+
+
+def exportar_csv(conn, **filtros):
+    texto = ''.join(bloques_csv(cursor_exportacion(conn, **filtros)))
+    return list(csv.DictReader(io.StringIO(texto)))
+
+
+def test_csv_con_filtros(bd):
+    llenar(bd)
+    assert [fila['cedula'] for fila in exportar_csv(bd)] == ['1', '3', '2']
+    assert [fila['cedula'] for fila in exportar_csv(bd, filtro_programa='sist')] == ['1', '2']
+    assert [fila['cedula'] for fila in exportar_csv(bd, filtro_foto='sin_foto', filtro_ficha='200')] == ['2']
+    assert [fila['cedula'] for fila in exportar_csv(bd, filtro_nivel='Tecnólogo')] == ['3']
+
+
+def test_csv_aplica_los_valores_por_defecto(bd):
+    insertar_empleado(bd, '1', tipo_sangre=None, nis='')
+    fila, = exportar_csv(bd)
+    assert (fila['tipo_sangre'], fila['nis'], fila['cargo']) == ('O+', 'N/A', 'APRENDIZ')
+
+
+def test_csv_sin_filas_solo_trae_el_encabezado(bd):
+    assert ''.join(bloques_csv(cursor_exportacion(bd))).splitlines() == [','.join(COLUMNAS_APRENDIZ)]
+
+
+def test_jsonl_un_objeto_por_linea_y_bloques(bd, monkeypatch):
+    llenar(bd)
+    monkeypatch.setattr(exportacion, 'FILAS_POR_BLOQUE', 2)
+    bloques = list(bloques_jsonl(cursor_exportacion(bd)))
+    assert len(bloques) == 2
+
+    objetos = [json.loads(linea) for linea in ''.join(bloques).splitlines()]
+    assert [objeto['nombre'] for objeto in objetos] == ['ANA', 'EVA', 'LUIS']
+    assert set(objetos[0]) == set(COLUMNAS_APRENDIZ)
+
+
+# =============================================
+# CACHÉ DE EXPORTACIONES
+# =============================================
+
+def archivos_en_cache():
+    return sorted(os.listdir(exportacion.CARPETA_CACHE_EXPORTACIONES))
+
+
+def test_version_sube_con_cada_escritura(bd):
+    versiones = [leer_version_datos(bd)]
+    insertar_empleado(bd, '1')
+    versiones.append(leer_version_datos(bd))
+    for sql in ("UPDATE empleados SET foto = 'a.jpg'", "DELETE FROM empleados"):
+        bd.execute(sql)
+        bd.commit()
+        versiones.append(leer_version_datos(bd))
+    assert versiones == sorted(set(versiones))
+
+
+def test_clave_depende_de_version_formato_y_filtros():
+    clave = clave_exportacion(4, 'csv', {'filtro_ficha': '100', 'filtro_foto': ''})
+    assert clave.startswith('4-csv-')
+    assert clave == clave_exportacion(4, 'csv', {'filtro_foto': '', 'filtro_ficha': '100'})
+    assert clave != clave_exportacion(5, 'csv', {'filtro_ficha': '100', 'filtro_foto': ''})
+    assert clave != clave_exportacion(4, 'jsonl', {'filtro_ficha': '100', 'filtro_foto': ''})
+    assert clave != clave_exportacion(4, 'csv', {'filtro_ficha': '200', 'filtro_foto': ''})
+
+
+def test_solo_se_guardan_filtros_del_catalogo(bd):
+    llenar(bd)
+    assert se_guarda_en_cache(bd, {})
+    assert se_guarda_en_cache(bd, {'buscar': '', 'filtro_foto': 'con_foto', 'filtro_programa': 'Sistemas',
+                                   'filtro_nivel': 'Tecnólogo', 'filtro_ficha': '300'})
+    assert not se_guarda_en_cache(bd, {'buscar': 'ana'})
+    assert not se_guarda_en_cache(bd, {'filtro_foto': 'cualquiera'})
+    # programa es un LIKE: un fragmento filtra igual pero no se guarda
+    assert not se_guarda_en_cache(bd, {'filtro_programa': 'Sist'})
+    assert not se_guarda_en_cache(bd, {'filtro_ficha': '999'})
+    assert not se_guarda_en_cache(bd, {'filtro_nivel': 'Doctorado'})
+
+
+def test_guardar_en_cache_reenvia_y_publica_al_terminar(bd):
+    bloques = guardar_en_cache(iter(['a,b\n', b'1,2\n']), '7-csv-x', 'csv')
+    assert next(bloques) == 'a,b\n'
+    assert buscar_en_cache('7-csv-x', 'csv') is None
+    assert list(bloques) == [b'1,2\n']
+
+    ruta = buscar_en_cache('7-csv-x', 'csv')
+    with open(ruta, 'rb') as archivo:
+        assert archivo.read() == b'a,b\n1,2\n'
+
+
+def test_exportacion_interrumpida_no_queda_en_cache(bd):
+    bloques = guardar_en_cache(iter(['a\n', 'b\n']), '7-csv-x', 'csv')
+    next(bloques)
+    bloques.close()
+    assert archivos_en_cache() == []
+
+
+def test_solo_se_borran_versiones_anteriores(bd):
+    for clave in ('9-csv-a', '10-csv-b'):
+        list(guardar_en_cache(iter(['x']), clave, 'csv'))
+    assert archivos_en_cache() == ['10-csv-b.csv']
+
+    list(guardar_en_cache(iter(['x']), '100-csv-c', 'csv'))
+    assert archivos_en_cache() == ['100-csv-c.csv']
+
+    # Una petición lenta que aún lee la versión 10 no borra la 100
+    list(guardar_en_cache(iter(['x']), '10-jsonl-d', 'jsonl'))
+    assert archivos_en_cache() == ['10-jsonl-d.jsonl', '100-csv-c.csv']
+
+
+def test_tope_de_archivos_por_version(bd, monkeypatch):
+    monkeypatch.setattr(exportacion, 'MAXIMO_ARCHIVOS_POR_VERSION', 2)
+    for resumen in 'abc':
+        assert list(guardar_en_cache(iter(['x']), f'5-csv-{resumen}', 'csv')) == ['x']
+    assert archivos_en_cache() == ['5-csv-a.csv', '5-csv-b.csv']
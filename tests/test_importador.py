@@ -0,0 +1,270 @@
+import io
+import zipfile
+
+import pytest
+
+from contadores import leer_version_datos
+from importador_sena import (
+    ALIAS_COLUMNAS, CENTRO_POR_DEFECTO, cargar_cedulas_temporales, compilar_extractor, detectar_csv,
+    huellas_en_bd, importar_excel_por_lotes, leer_filas_ods, nuevo_progreso, resolver_columnas,
+    simular_importacion,
+)
+
+ENCABEZADOS = ('Primer Apellido', 'Segundo Apellido', 'Nombre', 'Tipo de documento',
+               'Número de documento', 'Nombre del Programa', 'Código de Ficha')
+
+ANA = ('PEREZ', 'LOPEZ', 'ANA MARIA', 'CC', '10000001', 'Sistemas', '100')
+LUIS = ('GOMEZ', 'RUIZ', 'LUIS CARLOS', 'TI', '10000002', 'Cocina', '200')
+
+
+def csv_de(filas, encabezados=ENCABEZADOS, delimitador=',', codificacion='utf-8'):
+    lineas = [delimitador.join(encabezados)] + [delimitador.join(fila) for fila in filas]
+    return io.BytesIO(('\r\n'.join(lineas) + '\r\n').encode(codificacion))
+
+
+def importar(fuente, extension='.csv', **opciones):
+    progreso = nuevo_progreso()
+    importar_excel_por_lotes(fuente, progreso, extension=extension, **opciones)
+    return progreso
+
+
+def conteos(progreso):
+    return progreso['creados'], progreso['actualizados'], progreso['sin_cambios'], progreso['errores']
+
+
+# =============================================
+# HUELLAS (importación incremental)
+# =============================================
+
+def test_reimportar_sin_cambios_no_escribe(bd):
+    assert conteos(importar(csv_de([ANA, LUIS]))) == (2, 0, 0, 0)
+    version = leer_version_datos(bd)
+
+    assert conteos(importar(csv_de([ANA, LUIS]))) == (0, 0, 2, 0)
+    assert leer_version_datos(bd) == version
+
+
+def test_fila_cambiada_se_actualiza_y_conserva_foto(bd):
+    importar(csv_de([ANA, LUIS]))
+    bd.execute("UPDATE empleados SET foto = 'ana.jpg' WHERE cedula = '10000001'")
+    bd.commit()
+
+    ana_nueva = ANA[:5] + ('Cocina', '200')
+    assert conteos(importar(csv_de([ana_nueva, LUIS]))) == (0, 1, 1, 0)
+    assert bd.execute(
+        "SELECT nombre_programa, codigo_ficha, foto FROM empleados WHERE cedula = '10000001'"
+    ).fetchone() == ('Cocina', '200', 'ana.jpg')
+
+    assert conteos(importar(csv_de([ana_nueva, LUIS]))) == (0, 0, 2, 0)
+
+
+def test_cedula_repetida_en_el_archivo(bd):
+    ana_nueva = ANA[:5] + ('Cocina', '200')
+    assert conteos(importar(csv_de([ANA, ANA, ana_nueva]))) == (1, 1, 1, 0)
+    assert bd.execute("SELECT nombre_programa FROM empleados").fetchall() == [('Cocina',)]
+
+
+def test_retomar_salta_las_filas_ya_procesadas(bd):
+    assert conteos(importar(csv_de([ANA, LUIS]), filas_ya_procesadas=1)) == (1, 0, 0, 0)
+    assert bd.execute("SELECT cedula FROM empleados").fetchall() == [('10000002',)]
+
+
+# =============================================
+# VISTA PREVIA
+# =============================================
+
+def test_vista_previa_cuenta_sin_escribir(bd):
+    importar(csv_de([ANA]))
+    version = leer_version_datos(bd)
+    ana_nueva = ANA[:5] + ('Cocina', '200')
+
+    resultado = simular_importacion(csv_de([ana_nueva, LUIS, ('X', '', 'Y', 'CC', '123', '', '')]), '.csv')
+
+    assert (resultado['created'], resultado['updated'], resultado['unchanged'], resultado['errors']) == (1, 1, 0, 1)
+    assert resultado['changes'] == [{'fila': 2, 'cedula': '10000001', 'campos': {
+        'nombre_programa': {'actual': 'Sistemas', 'nuevo': 'Cocina'},
+        'codigo_ficha': {'actual': '100', 'nuevo': '200'},
+    }}]
+    assert leer_version_datos(bd) == version
+    assert bd.execute("SELECT COUNT(*) FROM empleados").fetchone() == (1,)
+
+
+def test_vista_previa_sin_filas(bd):
+    resultado = simular_importacion(csv_de([]), '.csv')
+    assert not resultado['success']
+
+
+# =============================================
+# TABLA TEMPORAL DE CÉDULAS
+# =============================================
+
+def test_huellas_en_bd_cruza_muchas_cedulas(bd):
+    importar(csv_de([ANA, LUIS]))
+    # Más cédulas que parámetros admite un IN (?, ...) en SQLite antiguos
+    cedulas = {str(20000000 + i) for i in range(5000)} | {'10000002'}
+
+    huellas = huellas_en_bd(bd.cursor(), cedulas)
+    assert list(huellas) == ['10000002']
+    assert huellas['10000002']
+
+
+def test_tabla_temporal_se_vacia_entre_usos(bd):
+    cursor = bd.cursor()
+    cargar_cedulas_temporales(cursor, ['1', '2', '2'])
+    assert cursor.execute("SELECT cedula FROM temp.cedulas_importacion ORDER BY 1").fetchall() == [('1',), ('2',)]
+
+    # El rollback del pool deja la tabla creada; el siguiente uso no ve las filas viejas
+    bd.commit()
+    cargar_cedulas_temporales(cursor, ['3'])
+    bd.rollback()
+    cargar_cedulas_temporales(cursor, ['4'])
+    assert cursor.execute("SELECT cedula FROM temp.cedulas_importacion").fetchall() == [('4',)]
+
+
+def test_huellas_en_bd_sin_cedulas(bd):
+    assert huellas_en_bd(bd.cursor(), set()) == {}
+
+
+# =============================================
+# ENCABEZADOS Y EXTRACTOR
+# =============================================
+
+def test_resolver_columnas_ignora_tildes_mayusculas_y_espacios():
+    posiciones, faltantes = resolver_columnas(
+        ('  primer   apellido', 'NOMBRE', 'tipo de DOCUMENTO', 'Numero de documento', 'codigo de ficha', None))
+    assert faltantes == []
+    assert posiciones == {'primer_apellido': 0, 'nombre': 1, 'tipo_documento': 2, 'cedula': 3, 'codigo_ficha': 4}
+
+
+def test_resolver_columnas_usa_el_primer_alias_presente():
+    posiciones, _ = resolver_columnas(ENCABEZADOS + ('Fecha Fin', 'FECHA FINALIZACION'))
+    assert posiciones['fecha_archivo'] == len(ENCABEZADOS) + 1
+
+
+def test_resolver_columnas_nombra_las_faltantes_con_su_primer_alias():
+    _, faltantes = resolver_columnas(('Nombre', 'Cedula'))
+    assert faltantes == ['Primer Apellido', 'Tipo de documento', 'Número de documento']
+
+
+def test_resolver_columnas_con_alias_propios():
+    alias = dict(ALIAS_COLUMNAS, cedula=('Documento', 'Número de documento'))
+    posiciones, faltantes = resolver_columnas(('Primer Apellido', 'Nombre', 'Tipo de documento', 'Documento'), alias)
+    assert faltantes == []
+    assert posiciones['cedula'] == 3
+
+    _, faltantes = resolver_columnas(('Primer Apellido', 'Nombre', 'Tipo de documento'), alias)
+    assert faltantes == ['Documento']
+
+
+def test_extractor_normaliza_y_completa_columnas_ausentes():
+    posiciones, _ = resolver_columnas(ENCABEZADOS)
+    extraer = compilar_extractor(posiciones)
+    # Fila más corta que el encabezado y números como float (así llegan de Excel)
+    campos = extraer(('perez ', None, 'ana', None, 1.0000001e7, 'Sistemas'))
+    assert campos['primer_apellido'] == 'PEREZ'
+    assert campos['segundo_apellido'] == ''
+    assert campos['cedula'] == '10000001'
+    assert campos['tipo_documento'] == 'CC'
+    assert campos['codigo_ficha'] == ''
+    assert campos['tipo_sangre'] == 'O+'
+    assert campos['centro'] == CENTRO_POR_DEFECTO
+
+
+def test_importar_con_alias_propios(bd):
+    encabezados = ('Primer Apellido', 'Segundo Apellido', 'Nombre', 'Tipo de documento', 'Documento',
+                   'Nombre del Programa', 'Código de Ficha')
+    alias = dict(ALIAS_COLUMNAS, cedula=('Documento',))
+
+    with pytest.raises(ValueError, match='Número de documento'):
+        importar(csv_de([ANA], encabezados))
+    assert conteos(importar(csv_de([ANA], encabezados), alias=alias)) == (1, 0, 0, 0)
+
+
+# =============================================
+# CSV Y ODS
+# =============================================
+
+def test_detectar_csv_utf8_con_bom():
+    fuente = io.BytesIO('\ufeffNúmero de documento;Nombre\r\n1;Ñ\r\n'.encode('utf-8'))
+    assert detectar_csv(fuente) == ('utf-8-sig', ';')
+    assert fuente.tell() == 0
+
+
+def test_detectar_csv_cp1252_de_excel():
+    fuente = io.BytesIO('Número de documento;Nombre\r\n1;PEÑA\r\n'.encode('cp1252'))
+    assert detectar_csv(fuente) == ('cp1252', ';')
+
+
+def test_detectar_csv_delimitador():
+    assert detectar_csv(io.BytesIO(b'a\tb\tc\n1,5\t2\t3\n'))[1] == '\t'
+    assert detectar_csv(io.BytesIO(b'a|b\n'))[1] == '|'
+    # Una sola columna: el delimitador por defecto
+    assert detectar_csv(io.BytesIO(b'cedula\n1\n'))[1] == ','
+
+
+def test_importar_csv_cp1252_con_punto_y_coma(bd):
+    pena = ('PEÑA', '', 'JOSÉ', 'CC', '10000003', 'Gestión', '300')
+    assert conteos(importar(csv_de([pena], delimitador=';', codificacion='cp1252'))) == (1, 0, 0, 0)
+    assert bd.execute("SELECT nombre, nombre_programa FROM empleados").fetchone() == ('JOSÉ PEÑA', 'Gestión')
+
+
+def celda(valor=None, repetir=1):
+    atributos = f' table:number-columns-repeated="{repetir}"' if repetir > 1 else ''
+    if valor is None:
+        return f'<table:table-cell{atributos}/>'
+    if isinstance(valor, float):
+        return (f'<table:table-cell office:value-type="float" office:value="{valor}"{atributos}>'
+                f'<text:p>{valor}</text:p></table:table-cell>')
+    return f'<table:table-cell office:value-type="string"{atributos}><text:p>{valor}</text:p></table:table-cell>'
+
+
+def fila(*celdas, repetir=1):
+    atributos = f' table:number-rows-repeated="{repetir}"' if repetir > 1 else ''
+    return f'<table:table-row{atributos}>{"".join(celdas)}</table:table-row>'
+
+
+def ods_de(*filas):
+    """.ods mínimo: primera hoja con `filas` y una segunda hoja que no se debe leer"""
+    contenido = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+        'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+        'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">'
+        '<office:body><office:spreadsheet>'
+        f'<table:table table:name="Aprendices">{"".join(filas)}</table:table>'
+        f'<table:table table:name="Otra">{fila(celda("no"))}</table:table>'
+        '</office:spreadsheet></office:body></office:document-content>'
+    )
+    archivo = io.BytesIO()
+    with zipfile.ZipFile(archivo, 'w') as paquete:
+        paquete.writestr('mimetype', 'application/vnd.oasis.opendocument.spreadsheet')
+        paquete.writestr('content.xml', contenido)
+    archivo.seek(0)
+    return archivo
+
+
+def test_leer_filas_ods_expande_repetidas_y_corta_el_final():
+    fuente = ods_de(
+        fila(celda('a'), celda(repetir=2), celda(1.5), celda(repetir=1000)),
+        fila(celda(repetir=5)),
+        fila(celda('b', repetir=2), repetir=2),
+        fila(celda(repetir=1024), repetir=1048000),
+    )
+    assert list(leer_filas_ods(fuente)) == [
+        ('a', None, None, 1.5),
+        (),
+        ('b', 'b'),
+        ('b', 'b'),
+    ]
+
+
+def test_importar_ods(bd):
+    fuente = ods_de(
+        fila(*(celda(encabezado) for encabezado in ENCABEZADOS)),
+        fila(celda('PEREZ'), celda(), celda('ANA MARIA'), celda('CC'), celda(10000001.0), celda('Sistemas'),
+             celda(100.0)),
+        fila(celda(repetir=7), repetir=500),
+    )
+    assert conteos(importar(fuente, '.ods')) == (1, 0, 0, 0)
+    assert bd.execute("SELECT cedula, codigo_ficha, segundo_apellido FROM empleados").fetchone() == (
+        '10000001', '100', '')
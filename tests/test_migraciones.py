@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from migraciones import VERSION_ACTUAL, aplicar_migraciones, version_esquema
+
+
+@pytest.fixture
+def ruta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path / 'carnet.db')
+
+
+def esquema(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        return sorted(conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+    finally:
+        conn.close()
+
+
+def crear_base_antigua(ruta):
+    """empleados como la dejaban las versiones sin migraciones: sin columnas SENA"""
+    conn = sqlite3.connect(ruta)
+    conn.execute("""
+        CREATE TABLE empleados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            cedula TEXT UNIQUE NOT NULL,
+            cargo TEXT,
+            codigo TEXT UNIQUE,
+            foto TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO empleados (nombre, cedula, codigo, foto) VALUES (?, ?, ?, ?)", [
+        ('ANA PEREZ', '111', 'AP1', 'a.jpg'),
+        ('LUIS GOMEZ', '222', 'LG2', None),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def test_base_nueva_llega_a_la_version_actual(ruta):
+    assert aplicar_migraciones(ruta)
+    conn = sqlite3.connect(ruta)
+    assert version_esquema(conn) == VERSION_ACTUAL
+    tablas = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert {'empleados', 'empleados_fts', 'contadores', 'programas', 'fichas',
+            'trabajos_importacion', 'version_datos', 'lotes_carnets'} <= tablas
+
+
+def test_aplicar_dos_veces_no_cambia_nada(ruta):
+    assert aplicar_migraciones(ruta)
+    antes = esquema(ruta)
+    assert aplicar_migraciones(ruta)
+    assert esquema(ruta) == antes
+
+
+def test_base_antigua_conserva_sus_filas(ruta):
+    crear_base_antigua(ruta)
+    assert aplicar_migraciones(ruta)
+
+    conn = sqlite3.connect(ruta)
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(empleados)")}
+    assert {'nis', 'nombre_programa', 'codigo_ficha', 'huella', 'created_at'} <= columnas
+    assert conn.execute("SELECT cedula FROM empleados ORDER BY id").fetchall() == [('111',), ('222',)]
+    # Contadores y búsqueda se llenan con las filas existentes
+    assert conn.execute("SELECT total FROM contadores WHERE dimension = 'total'").fetchone() == (2,)
+    assert conn.execute("SELECT total FROM contadores WHERE dimension = 'con_foto'").fetchone() == (1,)
+    assert conn.execute("SELECT COUNT(*) FROM empleados_fts WHERE empleados_fts MATCH 'gomez'").fetchone() == (1,)
+    conn.close()
+
+
+def test_una_migracion_fallida_no_adelanta_la_version(ruta, monkeypatch):
+    import migraciones
+
+    def fallar(cursor):
+        cursor.execute("CREATE TABLE a_medias (x)")
+        raise RuntimeError('falla')
+
+    monkeypatch.setattr(migraciones, 'MIGRACIONES', migraciones.MIGRACIONES[:2] + [(3, 'falla', fallar)])
+    monkeypatch.setattr(migraciones, 'VERSION_ACTUAL', 3)
+    assert not aplicar_migraciones(ruta)
+
+    conn = sqlite3.connect(ruta)
+    assert version_esquema(conn) == 2
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'a_medias'").fetchone() is None
+    conn.close()
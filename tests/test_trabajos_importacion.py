@@ -0,0 +1,113 @@
+import os
+import queue
+import sqlite3
+import subprocess
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import migraciones
+import trabajos_importacion as trabajos
+from test_importador import ANA, LUIS, csv_de
+
+
+@pytest.fixture
+def sin_hilo(bd, monkeypatch):
+    """Trabajos sin el hilo de fondo: las pruebas llaman _ejecutar directamente"""
+    monkeypatch.setattr(trabajos, '_asegurar_worker', lambda: None)
+    monkeypatch.setattr(trabajos, '_cola', queue.Queue())
+    monkeypatch.setattr(trabajos, '_en_memoria', {})
+    return bd
+
+
+def subir(contenido, nombre='aprendices.csv'):
+    return trabajos.crear_trabajo(FileStorage(contenido, filename=nombre))
+
+
+def archivo_de(conn, trabajo_id):
+    return conn.execute("SELECT archivo FROM trabajos_importacion WHERE id = ?", (trabajo_id,)).fetchone()[0]
+
+
+def pid_terminado():
+    proceso = subprocess.Popen(['true'])
+    proceso.wait()
+    return proceso.pid
+
+
+def test_archivo_pequeno_queda_solo_en_memoria(sin_hilo):
+    trabajo_id = subir(csv_de([ANA, LUIS]))
+
+    assert archivo_de(sin_hilo, trabajo_id) == f'{trabajos.PREFIJO_MEMORIA}{os.getpid()}'
+    assert not os.path.exists(trabajos.CARPETA_IMPORTACIONES)
+
+    trabajos._ejecutar(trabajo_id)
+    estado = trabajos.obtener_trabajo(trabajo_id)
+    assert (estado['estado'], estado['created']) == ('completado', 2)
+    assert trabajos._en_memoria == {}
+
+
+def test_archivo_grande_se_guarda_en_disco(sin_hilo, monkeypatch):
+    monkeypatch.setattr(trabajos, 'UMBRAL_EN_MEMORIA', 10)
+    trabajo_id = subir(csv_de([ANA]))
+    ruta = archivo_de(sin_hilo, trabajo_id)
+    assert os.path.isfile(ruta)
+
+    trabajos._ejecutar(trabajo_id)
+    assert trabajos.obtener_trabajo(trabajo_id)['estado'] == 'completado'
+    assert not os.path.exists(ruta)
+
+
+def test_al_salir_los_archivos_en_memoria_pasan_a_disco(sin_hilo):
+    trabajo_id = subir(csv_de([ANA]))
+    trabajos._guardar_en_disco()
+
+    ruta = archivo_de(sin_hilo, trabajo_id)
+    assert ruta == os.path.join(trabajos.CARPETA_IMPORTACIONES, f'{trabajo_id}.csv')
+    # Otro proceso lo retoma desde el disco
+    trabajos._en_memoria.clear()
+    assert trabajo_id in trabajos._trabajos_reclamables()
+    trabajos._ejecutar(trabajo_id)
+    assert trabajos.obtener_trabajo(trabajo_id)['created'] == 1
+    assert not os.path.exists(ruta)
+
+
+def test_archivo_en_memoria_de_un_proceso_muerto(sin_hilo):
+    for trabajo_id, pid in (('muerto', pid_terminado()), ('vivo', os.getppid())):
+        sin_hilo.execute("""
+            INSERT INTO trabajos_importacion (id, archivo, nombre_original, extension)
+            VALUES (?, ?, 'a.csv', '.csv')
+        """, (trabajo_id, f'{trabajos.PREFIJO_MEMORIA}{pid}'))
+    sin_hilo.commit()
+
+    # El del proceso vivo solo lo puede importar ese proceso
+    assert trabajos._trabajos_reclamables() == ['muerto']
+    trabajos._ejecutar('muerto')
+    estado = trabajos.obtener_trabajo('muerto')
+    assert (estado['estado'], estado['message']) == ('error', trabajos.MENSAJE_ARCHIVO_PERDIDO)
+
+
+def test_migracion_saca_el_contenido_de_la_bd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ruta = str(tmp_path / 'carnet.db')
+    # Base en la versión 10, cuando los archivos pequeños se guardaban en la columna contenido
+    with monkeypatch.context() as parche:
+        parche.setattr(migraciones, 'MIGRACIONES', migraciones.MIGRACIONES[:10])
+        parche.setattr(migraciones, 'VERSION_ACTUAL', 10)
+        assert migraciones.aplicar_migraciones(ruta)
+    conn = sqlite3.connect(ruta)
+    conn.execute("ALTER TABLE trabajos_importacion ADD COLUMN contenido BLOB")
+    conn.executemany("""
+        INSERT INTO trabajos_importacion (id, archivo, nombre_original, extension, estado, contenido)
+        VALUES (?, '', 'a.csv', '.csv', ?, ?)
+    """, [('pendiente', 'pendiente', b'cedula\n1\n'), ('listo', 'completado', b'viejo')])
+    conn.commit()
+    conn.close()
+
+    assert migraciones.aplicar_migraciones(ruta)
+    conn = sqlite3.connect(ruta)
+    assert 'contenido' not in {fila[1] for fila in conn.execute("PRAGMA table_info(trabajos_importacion)")}
+    archivos = dict(conn.execute("SELECT id, archivo FROM trabajos_importacion"))
+    conn.close()
+    with open(archivos['pendiente'], 'rb') as archivo:
+        assert archivo.read() == b'cedula\n1\n'
+    assert archivos['listo'] == ''
@@ -0,0 +1,374 @@
+import atexit
+import io
+import json
+import os
+import queue
+import sqlite3
+import threading
+import traceback
+import uuid
+
+from conexion_db import obtener_conexion
+from importador_sena import (
+    filas_estimadas, importar_excel_por_lotes, nuevo_progreso, resultado_exitoso,
+)
+
+# ============================================
+# IMPORTACIONES EN SEGUNDO PLANO
+# La ruta de carga crea un registro en trabajos_importacion y responde
+# de inmediato con el id. Los archivos pequeños quedan solo en la memoria
+# del proceso hasta que se importan; los grandes se guardan en disco. Un
+# hilo de fondo procesa los trabajos uno a uno, confirmando cada lote
+# junto con su avance; si el proceso se reinicia, el trabajo se retoma
+# desde el último lote confirmado. Al salir, el proceso escribe en disco
+# los archivos que tenía en memoria; si muere sin alcanzar a hacerlo,
+# esos trabajos terminan en error y hay que volver a cargar el archivo.
+# ============================================
+
+CARPETA_IMPORTACIONES = os.path.join('uploads', 'importaciones')
+
+# Archivos hasta este tamaño no se escriben en disco
+UMBRAL_EN_MEMORIA = 4 * 1024 * 1024
+
+# Columna archivo de un trabajo en memoria: 'memoria:<pid del proceso que lo tiene>'
+PREFIJO_MEMORIA = 'memoria:'
+
+MENSAJE_ARCHIVO_PERDIDO = 'El archivo se perdió al reiniciarse el servidor; vuelva a cargarlo'
+
+# Un trabajo 'procesando' sin latido en este tiempo se considera abandonado
+LATIDO_VENCIDO_SEGUNDOS = 60
+# Cada cuánto el hilo busca trabajos pendientes o abandonados
+INTERVALO_REVISION_SEGUNDOS = 30
+
+ESTADOS_TERMINADOS = ('completado', 'error')
+
+# Tabla de encabezados de la app (init_app); None usa ALIAS_COLUMNAS
+_alias_columnas = None
+
+# Archivos de los trabajos en memoria de este proceso: id -> bytes
+_en_memoria = {}
+
+_cola = queue.Queue()
+_hilo_worker = None
+_hilo_pid = None
+_hilo_lock = threading.Lock()
+
+
+def crear_tabla_trabajos(conn):
+    """Tabla de trabajos de importación. Se ejecuta como migración (migraciones.py)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS trabajos_importacion (
+            id TEXT PRIMARY KEY,
+            archivo TEXT NOT NULL,
+            nombre_original TEXT,
+            extension TEXT,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            filas_totales INTEGER,
+            filas_procesadas INTEGER NOT NULL DEFAULT 0,
+            creados INTEGER NOT NULL DEFAULT 0,
+            actualizados INTEGER NOT NULL DEFAULT 0,
+            sin_cambios INTEGER NOT NULL DEFAULT 0,
+            errores INTEGER NOT NULL DEFAULT 0,
+            error_detalles TEXT,
+            mensaje TEXT,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            latido TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos_importacion(estado)")
+
+
+def agregar_extension(conn):
+    """Columna extension en tablas creadas antes de aceptar CSV y ODS"""
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(trabajos_importacion)")}
+    if 'extension' not in columnas:
+        conn.execute("ALTER TABLE trabajos_importacion ADD COLUMN extension TEXT")
+
+
+def quitar_contenido(conn):
+    """
+    Quita la columna contenido, donde versiones anteriores guardaban los
+    archivos pequeños. Los de trabajos sin terminar pasan antes a disco.
+    """
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(trabajos_importacion)")}
+    if 'contenido' not in columnas:
+        return
+
+    pendientes = conn.execute("""
+        SELECT id, extension, contenido FROM trabajos_importacion
+        WHERE contenido IS NOT NULL AND estado NOT IN (?, ?)
+    """, ESTADOS_TERMINADOS).fetchall()
+    for trabajo_id, extension, contenido in pendientes:
+        os.makedirs(CARPETA_IMPORTACIONES, exist_ok=True)
+        ruta = os.path.join(CARPETA_IMPORTACIONES, f"{trabajo_id}{extension or '.xlsx'}")
+        with open(ruta, 'wb') as destino:
+            destino.write(contenido)
+        conn.execute("UPDATE trabajos_importacion SET archivo = ? WHERE id = ?", (ruta, trabajo_id))
+
+    # DROP COLUMN existe desde SQLite 3.35; antes solo se libera el espacio
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute("ALTER TABLE trabajos_importacion DROP COLUMN contenido")
+    else:
+        conn.execute("UPDATE trabajos_importacion SET contenido = NULL")
+
+
+def agregar_sin_cambios(conn):
+    """Columna sin_cambios en tablas creadas antes de la importación incremental"""
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(trabajos_importacion)")}
+    if 'sin_cambios' not in columnas:
+        conn.execute("ALTER TABLE trabajos_importacion ADD COLUMN sin_cambios INTEGER NOT NULL DEFAULT 0")
+
+
+# =============================================
+# API DEL MÓDULO
+# =============================================
+
+def init_app(app):
+    """Toma de app.config la tabla de encabezados (ALIAS_COLUMNAS) para los trabajos"""
+    global _alias_columnas
+    _alias_columnas = app.config.get('ALIAS_COLUMNAS')
+
+
+def crear_trabajo(archivo):
+    """
+    Registra el trabajo con el archivo subido y lo encola. Devuelve el id.
+    Los archivos que no superan UMBRAL_EN_MEMORIA quedan solo en memoria
+    para el hilo de fondo; los demás se escriben en CARPETA_IMPORTACIONES.
+    """
+    trabajo_id = uuid.uuid4().hex
+    extension = os.path.splitext(archivo.filename)[1].lower() or '.xlsx'
+
+    stream = archivo.stream
+    stream.seek(0, os.SEEK_END)
+    tamano = stream.tell()
+    stream.seek(0)
+
+    if tamano <= UMBRAL_EN_MEMORIA:
+        ruta = f"{PREFIJO_MEMORIA}{os.getpid()}"
+        # Antes del INSERT: el hilo de fondo puede ver la fila en cuanto se confirma
+        _en_memoria[trabajo_id] = stream.read()
+    else:
+        os.makedirs(CARPETA_IMPORTACIONES, exist_ok=True)
+        ruta = os.path.join(CARPETA_IMPORTACIONES, f"{trabajo_id}{extension}")
+        archivo.save(ruta)
+
+    conn = obtener_conexion()
+    try:
+        conn.execute("""
+            INSERT INTO trabajos_importacion (id, archivo, nombre_original, extension)
+            VALUES (?, ?, ?, ?)
+        """, (trabajo_id, ruta, archivo.filename, extension))
+        conn.commit()
+    except Exception:
+        _en_memoria.pop(trabajo_id, None)
+        raise
+
+    print(f"📥 Trabajo de importación {trabajo_id} creado para {archivo.filename}")
+    _asegurar_worker()
+    _cola.put(trabajo_id)
+    return trabajo_id
+
+
+def obtener_trabajo(trabajo_id):
+    """Estado del trabajo en el formato que usan las pantallas de carga, o None"""
+    conn = obtener_conexion()
+    cursor = conn.execute("""
+        SELECT id, estado, filas_totales, filas_procesadas, creados, actualizados,
+               errores, error_detalles, mensaje, nombre_original, sin_cambios
+        FROM trabajos_importacion WHERE id = ?
+    """, (trabajo_id,))
+    fila = cursor.fetchone()
+    if not fila:
+        return None
+
+    estado = fila[1]
+    return {
+        'success': estado != 'error',
+        'job_id': fila[0],
+        'estado': estado,
+        'terminado': estado in ESTADOS_TERMINADOS,
+        'archivo': fila[9],
+        'filas_totales': fila[2],
+        'filas_procesadas': fila[3],
+        'created': fila[4],
+        'updated': fila[5],
+        'unchanged': fila[10],
+        'errors': fila[6],
+        'error_details': json.loads(fila[7]) if fila[7] else [],
+        'message': fila[8] or 'Importación en proceso...',
+    }
+
+
+def reanudar_trabajos():
+    """Arranca el hilo de fondo, que retoma los trabajos pendientes o interrumpidos"""
+    _asegurar_worker()
+
+
+# =============================================
+# HILO DE FONDO
+# =============================================
+
+def _asegurar_worker():
+    """Inicia el hilo si no existe en este proceso (gunicorn hace fork)"""
+    global _hilo_worker, _hilo_pid
+    with _hilo_lock:
+        if _hilo_worker is not None and _hilo_worker.is_alive() and _hilo_pid == os.getpid():
+            return
+        _hilo_pid = os.getpid()
+        _hilo_worker = threading.Thread(target=_bucle, name='importaciones', daemon=True)
+        _hilo_worker.start()
+
+
+def _bucle():
+    # Al arrancar se revisa si quedó algo a medias
+    pendientes = _trabajos_reclamables()
+    while True:
+        for trabajo_id in pendientes:
+            try:
+                _ejecutar(trabajo_id)
+            except Exception as e:
+                print(f"❌ Error en trabajo de importación {trabajo_id}: {e}")
+                traceback.print_exc()
+        try:
+            pendientes = [_cola.get(timeout=INTERVALO_REVISION_SEGUNDOS)]
+        except queue.Empty:
+            pendientes = _trabajos_reclamables()
+
+
+def _trabajos_reclamables():
+    """
+    Trabajos pendientes o abandonados. Se omiten los que están en la memoria
+    de otro proceso vivo: solo ese proceso puede importarlos.
+    """
+    conn = obtener_conexion()
+    cursor = conn.execute("""
+        SELECT id, archivo FROM trabajos_importacion
+        WHERE estado = 'pendiente'
+           OR (estado = 'procesando' AND latido < datetime('now', ?))
+        ORDER BY creado_en
+    """, (f'-{LATIDO_VENCIDO_SEGUNDOS} seconds',))
+    return [trabajo_id for trabajo_id, archivo in cursor.fetchall()
+            if not (archivo.startswith(PREFIJO_MEMORIA) and trabajo_id not in _en_memoria
+                    and _proceso_vivo(int(archivo[len(PREFIJO_MEMORIA):])))]
+
+
+def _proceso_vivo(pid):
+    """True si otro proceso con ese pid sigue corriendo"""
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reclamar(conn, trabajo_id):
+    """Marca el trabajo como propio; False si otro proceso ya lo está ejecutando"""
+    cursor = conn.execute("""
+        UPDATE trabajos_importacion SET estado = 'procesando', latido = CURRENT_TIMESTAMP
+        WHERE id = ?
+          AND (estado = 'pendiente'
+               OR (estado = 'procesando' AND latido < datetime('now', ?)))
+    """, (trabajo_id, f'-{LATIDO_VENCIDO_SEGUNDOS} seconds'))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def _terminar(conn, trabajo_id, estado, mensaje):
+    conn.execute("""
+        UPDATE trabajos_importacion SET estado = ?, mensaje = ?, latido = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, (estado, mensaje, trabajo_id))
+    conn.commit()
+
+
+def _ejecutar(trabajo_id):
+    conn = obtener_conexion()
+    if not _reclamar(conn, trabajo_id):
+        return
+
+    fila = conn.execute("""
+        SELECT archivo, filas_totales, filas_procesadas, creados, actualizados, sin_cambios,
+               errores, error_detalles, extension
+        FROM trabajos_importacion WHERE id = ?
+    """, (trabajo_id,)).fetchone()
+    ruta, filas_totales, filas_procesadas = fila[0], fila[1], fila[2]
+    progreso = nuevo_progreso(fila[3], fila[4], fila[5], fila[6], json.loads(fila[7]) if fila[7] else [])
+    extension = fila[8]
+
+    contenido = _en_memoria.get(trabajo_id)
+    if contenido is None and ruta.startswith(PREFIJO_MEMORIA):
+        # El proceso que tenía el archivo en memoria murió sin escribirlo en disco
+        print(f"⚠️ Importación {trabajo_id}: el archivo ya no está disponible")
+        _terminar(conn, trabajo_id, 'error', MENSAJE_ARCHIVO_PERDIDO)
+        return
+    fuente = io.BytesIO(contenido) if contenido is not None else ruta
+
+    if filas_procesadas:
+        print(f"🔁 Retomando importación {trabajo_id} desde la fila {filas_procesadas + 1}")
+    else:
+        print(f"🔄 Procesando importación {trabajo_id}")
+
+    try:
+        if filas_totales is None:
+            # Estimación para la barra de progreso (la hoja trae su dimensión)
+            conn.execute(
+                "UPDATE trabajos_importacion SET filas_totales = ? WHERE id = ?",
+                (filas_estimadas(fuente, extension), trabajo_id)
+            )
+            conn.commit()
+
+        def guardar_avance(cursor, filas, progreso):
+            cursor.execute("""
+                UPDATE trabajos_importacion SET
+                    filas_procesadas = ?, creados = ?, actualizados = ?, sin_cambios = ?,
+                    errores = ?, error_detalles = ?, latido = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (filas, progreso['creados'], progreso['actualizados'], progreso['sin_cambios'],
+                  progreso['errores'],
+                  json.dumps(progreso['detalles'], ensure_ascii=False), trabajo_id))
+
+        importar_excel_por_lotes(fuente, progreso, filas_procesadas, al_confirmar_lote=guardar_avance,
+                                 extension=extension, alias=_alias_columnas)
+        _terminar(conn, trabajo_id, 'completado', resultado_exitoso(progreso)['message'])
+
+    except Exception as e:
+        print(f"Error general cargando Excel: {e}")
+        traceback.print_exc()
+        _terminar(conn, trabajo_id, 'error', f'Error al procesar archivo: {str(e)}')
+
+    finally:
+        # archivo se vuelve a leer: _guardar_en_disco pudo haberlo escrito mientras tanto
+        estado, ruta = conn.execute(
+            "SELECT estado, archivo FROM trabajos_importacion WHERE id = ?", (trabajo_id,)).fetchone()
+        if estado in ESTADOS_TERMINADOS:
+            _en_memoria.pop(trabajo_id, None)
+            if not ruta.startswith(PREFIJO_MEMORIA) and os.path.exists(ruta):
+                os.remove(ruta)
+
+
+@atexit.register
+def _guardar_en_disco():
+    """
+    Al terminar el proceso, los archivos que siguen en memoria se escriben
+    en disco para que el trabajo se retome en otro proceso o al reiniciar.
+    """
+    if not _en_memoria:
+        return
+    try:
+        conn = obtener_conexion()
+        os.makedirs(CARPETA_IMPORTACIONES, exist_ok=True)
+        for trabajo_id, contenido in list(_en_memoria.items()):
+            fila = conn.execute(
+                "SELECT extension FROM trabajos_importacion WHERE id = ?", (trabajo_id,)).fetchone()
+            ruta = os.path.join(CARPETA_IMPORTACIONES, f"{trabajo_id}{fila[0] if fila else '.xlsx'}")
+            with open(ruta, 'wb') as destino:
+                destino.write(contenido)
+            conn.execute("UPDATE trabajos_importacion SET archivo = ? WHERE id = ?", (ruta, trabajo_id))
+        conn.commit()
+        print(f"💾 {len(_en_memoria)} archivos de importación guardados en disco para retomarse")
+    except Exception as e:
+        print(f"❌ No se pudieron guardar en disco las importaciones en memoria: {e}")